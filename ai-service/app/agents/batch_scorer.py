@@ -0,0 +1,185 @@
+"""
+Batch Scorer - Re-applies the reasoning rules to stored agent outputs
+Vectorized over the columns written by AgentOutputStore, so rule changes can
+be evaluated against history without calling Gemini or re-running forensics.
+
+    python -m app.agents.batch_scorer /path/to/store --set authentic_min_score=75
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.agents.reasoning_agent import SCORING_RULES
+
+VERDICTS = ("authentic", "suspicious", "unclear", "fraudulent")
+
+
+def score_columns(
+    columns: Dict[str, np.ndarray], rules: Optional[Dict[str, float]] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Trust scores and verdicts for every row, matching
+    ReasoningAgent._calculate_trust_score and _determine_verdict
+    """
+    rules = {**SCORING_RULES, **(rules or {})}
+    has_vision = columns["has_vision"]
+
+    ocr_confidence = np.where(
+        has_vision & ~np.isnan(columns["ocr_confidence"]),
+        columns["ocr_confidence"],
+        rules["default_ocr_confidence"],
+    )
+    manipulation_score = np.where(
+        columns["has_forensic"], columns["manipulation_score"], 0.0
+    )
+    metadata_flags = np.where(columns["has_metadata"], columns["metadata_flags"], 0)
+    fraud_reports = np.where(columns["has_reputation"], columns["fraud_reports"], 0)
+
+    # Same operation order as the scalar version so float rounding agrees
+    score = np.full(len(has_vision), rules["base_score"], dtype=np.float64)
+    score += (ocr_confidence - rules["ocr_confidence_baseline"]) * rules[
+        "ocr_confidence_weight"
+    ]
+    score -= manipulation_score * rules["manipulation_weight"]
+    score -= metadata_flags * rules["metadata_flag_penalty"]
+    score -= fraud_reports * rules["fraud_report_penalty"]
+    score += np.where(
+        columns["merchant_verified"] & columns["has_reputation"],
+        rules["verified_merchant_bonus"],
+        0,
+    )
+    score += np.where(
+        has_vision & (columns["ocr_text_length"] > rules["ocr_text_min_length"]),
+        rules["ocr_text_bonus"],
+        0,
+    )
+    score -= np.where(
+        columns["template_matched"]
+        & (columns["template_deviation"] >= rules["template_deviation_threshold"]),
+        rules["template_deviation_penalty"],
+        0,
+    )
+    ring_receipts = columns["ring_receipts"].astype(np.float64)
+    ring_merchants = columns["ring_merchants"].astype(np.float64)
+    ring_diversity = np.divide(
+        ring_merchants - 1,
+        ring_receipts - 1,
+        out=np.zeros(len(has_vision)),
+        where=ring_receipts >= 2,
+    )
+    ring_weight = np.where(
+        (ring_receipts >= 2)
+        & (columns["ring_submitters"] >= rules["ring_min_submitters"])
+        & (ring_merchants >= rules["ring_min_merchants"])
+        & (ring_diversity >= rules["ring_min_diversity"]),
+        ring_diversity,
+        0.0,
+    )
+    score -= rules["ring_penalty"] * ring_weight
+    # int() truncates toward zero, then clamp to 0-100
+    trust_scores = np.clip(np.trunc(score), 0, 100).astype(np.int16)
+
+    critical = (fraud_reports >= rules["fraudulent_min_fraud_reports"]) | (
+        manipulation_score >= rules["fraudulent_min_manipulation"]
+    )
+    verdicts = np.select(
+        [
+            critical,
+            trust_scores >= rules["authentic_min_score"],
+            trust_scores >= rules["suspicious_min_score"],
+            trust_scores >= rules["unclear_min_score"],
+        ],
+        ["fraudulent", "authentic", "suspicious", "unclear"],
+        default="fraudulent",
+    )
+    return trust_scores, verdicts
+
+
+def compare_rules(
+    columns: Dict[str, np.ndarray],
+    rules: Optional[Dict[str, float]] = None,
+    baseline_rules: Optional[Dict[str, float]] = None,
+) -> Dict[str, Any]:
+    """Verdict distribution shift between two rule sets over the same history"""
+    started = time.perf_counter()
+    base_scores, base_verdicts = score_columns(columns, baseline_rules)
+    new_scores, new_verdicts = score_columns(columns, rules)
+    elapsed = time.perf_counter() - started
+    total = len(base_verdicts)
+
+    def distribution(verdicts: np.ndarray) -> Dict[str, Dict[str, float]]:
+        return {
+            verdict: {
+                "count": int(count),
+                "share": round(float(count) / total, 4) if total else 0.0,
+            }
+            for verdict in VERDICTS
+            for count in [np.count_nonzero(verdicts == verdict)]
+        }
+
+    transitions = {
+        f"{before}->{after}": int(count)
+        for before in VERDICTS
+        for after in VERDICTS
+        if before != after
+        for count in [np.count_nonzero((base_verdicts == before) & (new_verdicts == after))]
+        if count
+    }
+    delta = new_scores.astype(np.int32) - base_scores
+
+    return {
+        "records": total,
+        "baseline": distribution(base_verdicts),
+        "candidate": distribution(new_verdicts),
+        "changed_verdicts": int(np.count_nonzero(base_verdicts != new_verdicts)),
+        "transitions": transitions,
+        "mean_trust_score_delta": round(float(delta.mean()), 3) if total else 0.0,
+        "scoring_seconds": round(elapsed, 4),
+    }
+
+
+def _parse_overrides(pairs) -> Dict[str, float]:
+    overrides = {}
+    for pair in pairs or []:
+        name, _, value = pair.partition("=")
+        if name not in SCORING_RULES:
+            raise SystemExit(f"Unknown rule '{name}'. Known: {', '.join(SCORING_RULES)}")
+        overrides[name] = float(value)
+    return overrides
+
+
+def main(argv=None) -> int:
+    from app.core.agent_store import load_shards
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("store", help="Directory of agent output shards")
+    parser.add_argument(
+        "--set", action="append", metavar="RULE=VALUE", help="Candidate rule override"
+    )
+    parser.add_argument(
+        "--baseline",
+        action="append",
+        metavar="RULE=VALUE",
+        help="Baseline rule override (defaults to the current rules)",
+    )
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    columns = load_shards(args.store)
+    load_seconds = time.perf_counter() - started
+
+    report = compare_rules(
+        columns, _parse_overrides(args.set), _parse_overrides(args.baseline)
+    )
+    report["load_seconds"] = round(load_seconds, 3)
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
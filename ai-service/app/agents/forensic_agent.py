@@ -1,97 +1,385 @@
 """
 Forensic Agent - Detects image manipulation and forgery
-Uses Error Level Analysis (ELA), noise analysis, and compression artifacts
+Uses Error Level Analysis (ELA), noise analysis, and compression artifacts,
+run on the detected text regions when the image has enough of them
 """
 import logging
-import cv2
-import numpy as np
+import math
+import time
 from PIL import Image, ImageChops, ImageEnhance
-from typing import Dict, Any, List
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, Any, List, Optional, Tuple, Union
 import io
 
+from app.core.buffers import ArenaPool, BufferArena, ByteCounter
+from app.core.cancellation import CancelToken, OperationCancelled
+from app.core.forensic_kernels import crop_statistics, image_statistics, stack_statistics
+from app.core.imaging import DecodedImage, decode_grayscale
+from app.core.text_regions import detect_text_regions, scale_boxes
+
+if TYPE_CHECKING:
+    import numpy as np
+
 logger = logging.getLogger(__name__)
 
+# Below this many text regions the tests fall back to the whole image
+MIN_TEXT_REGIONS = 3
+# Laplacian variance ratio (as a log) between a region and the median
+# region that maps to a noise score of 100
+NOISE_LOG_SPREAD = math.log(4)
+# A region is reported when its noise or ELA level is this far off the median
+SUSPICIOUS_NOISE_DEVIATION = math.log(2)
+SUSPICIOUS_ELA_RATIO = 2.0
+
+
+@dataclass
+class _PreparedImage:
+    """An image decoded and scanned for text, ready for the statistical tests"""
+
+    path: str
+    decoded: DecodedImage
+    regions: "np.ndarray"
+    detect_ms: float
+
+    @property
+    def text_mode(self) -> bool:
+        return len(self.regions) >= MIN_TEXT_REGIONS
+
+
+@dataclass
+class _LoadedImage:
+    """The full-resolution image, with the text regions scaled onto it"""
+
+    image: Image.Image
+    regions: Optional["np.ndarray"]
+    decode_ms: float
+
+    @property
+    def gray(self) -> Image.Image:
+        img = self.image
+        return img if img.mode == "L" else img.convert("L")
+
 
 class ForensicAgent:
     """Computer vision forensic analysis for receipt tampering detection"""
 
-    def __init__(self):
-        pass
+    def __init__(
+        self,
+        decode_scale: int = 4,
+        executor=None,
+        arenas: Optional[ArenaPool] = None,
+    ):
+        # Text regions are found on a JPEG draft decode at 1/decode_scale
+        # resolution. The noise, edge, ELA and compression tests run at full
+        # resolution, where their thresholds were calibrated.
+        self.decode_scale = decode_scale
+        # CancellableExecutor keeping the CPU work off the event loop; the
+        # analysis stops between stages when its caller is cancelled
+        self.executor = executor
+        # Per-thread scratch buffers for the intermediates (None: fresh arrays)
+        self.arenas = arenas
 
     async def analyze(self, image_path: str) -> Dict[str, Any]:
+        """Forensic analysis, on the executor when one is configured"""
+        if self.executor:
+            return await self.executor.run("forensic", self.analyze_sync, image_path)
+        return self.analyze_sync(image_path)
+
+    async def analyze_batch(
+        self, image_paths: List[str]
+    ) -> List[Union[Dict[str, Any], Exception]]:
+        """Forensic analysis of several images, on the executor when one is configured"""
+        if self.executor:
+            return await self.executor.run("forensic_batch", self.analyze_batch_sync, image_paths)
+        return self.analyze_batch_sync(image_paths)
+
+    def analyze_sync(
+        self, image_path: str, cancel: Optional[CancelToken] = None
+    ) -> Dict[str, Any]:
         """
         Perform forensic analysis on receipt image
 
+        cancel, when given, is checked between stages (OperationCancelled).
+
         Returns:
             - manipulation_score: 0-100 (higher = more likely manipulated)
             - techniques_detected: List of manipulation techniques found
             - suspicious_regions: Regions with high manipulation probability
             - compression_analysis: JPEG compression artifact analysis
         """
+        check = cancel.check if cancel else lambda: None
         try:
             logger.info(f"Forensic agent analyzing: {image_path}")
+            arena = self.arenas.get() if self.arenas else None
+            prepared = self._prepare(image_path, check, arena)
+            loaded = self._load(prepared, check)
+            gray = loaded.gray
+            statistics = self._statistics(image_path, gray, loaded.regions, arena)
+            del gray
+            check()
+            return self._finish(prepared, loaded, statistics, check, arena)
+
+        except OperationCancelled:
+            logger.info(f"Forensic analysis of {image_path} cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"Forensic agent error: {str(e)}")
+            raise
 
-            # Load image
-            img = Image.open(image_path)
-            img_array = np.array(img)
-
-            # Run multiple forensic tests
-            ela_score = await self._error_level_analysis(img)
-            noise_score = await self._noise_analysis(img_array)
-            compression_score = await self._compression_analysis(img)
-            edge_score = await self._edge_consistency_analysis(img_array)
-
-            # Calculate overall manipulation score
-            manipulation_score = int(
-                (ela_score * 0.3)
-                + (noise_score * 0.3)
-                + (compression_score * 0.2)
-                + (edge_score * 0.2)
-            )
+    def analyze_batch_sync(
+        self, image_paths: List[str], cancel: Optional[CancelToken] = None
+    ) -> List[Union[Dict[str, Any], Exception]]:
+        """
+        Forensic analysis of several images at once, each scored exactly as
+        analyze_sync would. Whole-image statistics of same-size images are
+        computed as one stack. An image that fails gets its exception in
+        place of a result, as with asyncio.gather(return_exceptions=True).
 
-            # Determine techniques detected
-            techniques = []
-            if ela_score > 60:
-                techniques.append("JPEG compression anomalies")
-            if noise_score > 60:
-                techniques.append("Inconsistent noise patterns")
-            if compression_score > 60:
-                techniques.append("Multiple compression cycles")
-            if edge_score > 60:
-                techniques.append("Edge tampering detected")
-
-            result = {
-                "manipulation_score": manipulation_score,
-                "techniques_detected": techniques,
-                "ela_score": ela_score,
-                "noise_score": noise_score,
-                "compression_score": compression_score,
-                "edge_score": edge_score,
-                "verdict": self._get_verdict(manipulation_score),
-            }
-
-            logger.info(
-                f"Forensic agent completed. Manipulation score: {manipulation_score}"
-            )
-            return result
+        Every image of the batch is held decoded at full resolution until
+        the stacks are done, so the batch size bounds the memory used.
+        """
+        check = cancel.check if cancel else lambda: None
+        logger.info(f"Forensic agent analyzing a batch of {len(image_paths)} images")
+        arena = self.arenas.get() if self.arenas else None
+        results: List[Union[Dict[str, Any], Exception, None]] = [None] * len(image_paths)
+        images: Dict[int, Tuple[_PreparedImage, _LoadedImage]] = {}
+        statistics: Dict[int, Optional[Dict[str, Any]]] = {}
+        by_size: Dict[Tuple[int, int], List[int]] = {}
+        try:
+            for index, image_path in enumerate(image_paths):
+                try:
+                    prepared = self._prepare(image_path, check, arena)
+                    loaded = self._load(prepared, check)
+                except OperationCancelled:
+                    raise
+                except Exception as e:
+                    logger.error(f"Forensic agent error on {image_path}: {str(e)}")
+                    results[index] = e
+                    continue
+                images[index] = (prepared, loaded)
+                if loaded.regions is not None:
+                    statistics[index] = self._statistics(
+                        image_path, loaded.gray, loaded.regions, arena
+                    )
+                else:
+                    by_size.setdefault(loaded.image.size, []).append(index)
+
+            for indices in by_size.values():
+                statistics.update(self._stack_statistics(images, indices, arena))
+            check()
+
+            for index, (prepared, loaded) in images.items():
+                try:
+                    results[index] = self._finish(
+                        prepared, loaded, statistics[index], check, arena
+                    )
+                except OperationCancelled:
+                    raise
+                except Exception as e:
+                    logger.error(f"Forensic agent error on {prepared.path}: {str(e)}")
+                    results[index] = e
+            return results
+
+        except OperationCancelled:
+            logger.info(f"Forensic analysis of a batch of {len(image_paths)} images cancelled")
+            raise
+
+    def _prepare(
+        self, image_path: str, check: Callable[[], None], arena: Optional[BufferArena] = None
+    ) -> "_PreparedImage":
+        """Decode the image to reduced-resolution grayscale and find its text regions"""
+        decoded = decode_grayscale(image_path, self.decode_scale)
+        check()
+
+        # Text areas are where receipts get edited; background is skipped
+        started = time.perf_counter()
+        regions = detect_text_regions(decoded.gray, arena)
+        detect_ms = (time.perf_counter() - started) * 1000
+        check()
+
+        return _PreparedImage(
+            path=image_path, decoded=decoded, regions=regions, detect_ms=detect_ms
+        )
+
+    def _statistics(
+        self,
+        image_path: str,
+        gray: Image.Image,
+        regions: Optional["np.ndarray"],
+        arena: Optional[BufferArena] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Laplacian variance and Canny edge pixels of the full-resolution luma,
+        per text region or of the whole image (regions None). None if they
+        failed. Text regions are cropped before leaving PIL so the whole
+        image is never copied into numpy.
+
+        The noise (variance / 1000) and edge density thresholds were tuned at
+        full resolution and do not rescale: on the test set the variance of
+        a 1/4 draft ranges from 0.1x to 3.6x the full-resolution one, and edge
+        density from 1.3x to 2.8x, depending on content.
+        """
+        import numpy as np
 
+        try:
+            if regions is not None:
+                variances, edge_pixels = crop_statistics(
+                    (
+                        np.asarray(gray.crop((x, y, x + w, y + h)))
+                        for x, y, w, h in regions.tolist()
+                    ),
+                    arena,
+                )
+            else:
+                variance, edge_pixels = image_statistics(np.asarray(gray), arena)
+                variances = [variance]
         except Exception as e:
-            logger.error(f"Forensic agent error: {str(e)}")
-            raise
+            logger.warning(f"Noise/edge statistics failed for {image_path}: {str(e)}")
+            return None
+        return {"variances": variances, "edge_pixels": edge_pixels}
+
+    def _stack_statistics(
+        self,
+        images: Dict[int, Tuple["_PreparedImage", "_LoadedImage"]],
+        indices: List[int],
+        arena: Optional[BufferArena] = None,
+    ) -> Dict[int, Optional[Dict[str, Any]]]:
+        """_statistics of several same-size images without text regions, as one stack"""
+        import numpy as np
 
-    async def _error_level_analysis(self, img: Image.Image) -> float:
+        try:
+            variances, edge_pixels = stack_statistics(
+                [np.asarray(images[index][1].gray) for index in indices], arena
+            )
+        except Exception as e:
+            logger.warning(f"Noise/edge statistics failed for {len(indices)} images: {str(e)}")
+            return {index: None for index in indices}
+        return {
+            index: {"variances": [variance], "edge_pixels": pixels}
+            for index, variance, pixels in zip(indices, variances, edge_pixels)
+        }
+
+    def _load(self, prepared: "_PreparedImage", check: Callable[[], None]) -> "_LoadedImage":
+        """Decode the full-resolution image and scale the text regions onto it"""
+        started = time.perf_counter()
+        img = Image.open(prepared.path)
+        img.load()
+        decode_ms = (time.perf_counter() - started) * 1000
+        check()
+
+        full_regions = None
+        if prepared.text_mode:
+            gray = prepared.decoded.gray
+            # Snapped to the 8x8 JPEG grid so ELA re-encodes whole blocks
+            full_regions = scale_boxes(
+                prepared.regions, (gray.shape[1], gray.shape[0]), img.size, align=8
+            )
+        return _LoadedImage(image=img, regions=full_regions, decode_ms=decode_ms)
+
+    def _finish(
+        self,
+        prepared: "_PreparedImage",
+        loaded: "_LoadedImage",
+        statistics: Optional[Dict[str, Any]],
+        check: Callable[[], None],
+        arena: Optional[BufferArena] = None,
+    ) -> Dict[str, Any]:
+        """Run the full-resolution tests and combine everything into the result"""
+        decoded, regions = prepared.decoded, prepared.regions
+        img, full_regions = loaded.image, loaded.regions
+
+        if prepared.text_mode:
+            pixels_analysed = int((full_regions[:, 2] * full_regions[:, 3]).sum())
+        else:
+            pixels_analysed = img.size[0] * img.size[1]
+        variances = statistics["variances"] if statistics else []
+        edge_score = (
+            self._edge_score(statistics["edge_pixels"], pixels_analysed) if statistics else 0
+        )
+
+        suspicious_regions = []
+        if prepared.text_mode:
+            ela_score, ela_levels = self._error_level_analysis_regions(
+                img, full_regions, arena
+            )
+            check()
+            noise_score, noise_deviations = self._noise_consistency_score(variances)
+            compression_score = self._compression_analysis(
+                img, self._bounding_box(full_regions)
+            )
+            check()
+            suspicious_regions = self._suspicious_regions(
+                full_regions, ela_levels, noise_deviations
+            )
+        else:
+            ela_score = self._error_level_analysis(img, arena)
+            check()
+            noise_score = self._noise_score(variances[0]) if variances else 0
+            compression_score = self._compression_analysis(img)
+            check()
+
+        # Calculate overall manipulation score
+        manipulation_score = int(
+            (ela_score * 0.3)
+            + (noise_score * 0.3)
+            + (compression_score * 0.2)
+            + (edge_score * 0.2)
+        )
+
+        # Determine techniques detected
+        techniques = []
+        if ela_score > 60:
+            techniques.append("JPEG compression anomalies")
+        if noise_score > 60:
+            techniques.append("Inconsistent noise patterns")
+        if compression_score > 60:
+            techniques.append("Multiple compression cycles")
+        if edge_score > 60:
+            techniques.append("Edge tampering detected")
+
+        result = {
+            "manipulation_score": manipulation_score,
+            "techniques_detected": techniques,
+            "ela_score": ela_score,
+            "noise_score": noise_score,
+            "compression_score": compression_score,
+            "edge_score": edge_score,
+            "verdict": self._get_verdict(manipulation_score),
+            "suspicious_regions": suspicious_regions,
+            "regions": {
+                "text_regions": int(len(regions)),
+                "mode": "text" if prepared.text_mode else "full",
+                "pixels_analysed": pixels_analysed,
+                "pixels_total": img.size[0] * img.size[1],
+                "detect_ms": round(prepared.detect_ms, 2),
+            },
+            "decode": {
+                "full_decode_ms": round(loaded.decode_ms, 2),
+                "grayscale": decoded.stats(),
+            },
+        }
+
+        logger.info(
+            f"Forensic agent completed. Manipulation score: {manipulation_score}"
+        )
+        return result
+
+    def _error_level_analysis(
+        self, img: Image.Image, arena: Optional[BufferArena] = None
+    ) -> float:
         """
         Error Level Analysis (ELA) - Detects JPEG compression inconsistencies
         """
         try:
-            # Save with known quality
-            temp_buffer = io.BytesIO()
-            img.save(temp_buffer, format="JPEG", quality=90)
+            # Save with known quality (JPEG cannot hold alpha or palettes)
+            rgb = self._rgb(img)
+            temp_buffer = arena.encode_buffer() if arena else io.BytesIO()
+            rgb.save(temp_buffer, format="JPEG", quality=90)
             temp_buffer.seek(0)
             compressed = Image.open(temp_buffer)
 
             # Calculate difference
-            diff = ImageChops.difference(img.convert("RGB"), compressed.convert("RGB"))
+            diff = ImageChops.difference(rgb, self._rgb(compressed))
             extrema = diff.getextrema()
 
             # Calculate ELA score
@@ -102,29 +390,104 @@ class ForensicAgent:
         except:
             return 0
 
-    async def _noise_analysis(self, img_array: np.ndarray) -> float:
+    def _error_level_analysis_regions(
+        self, img: Image.Image, regions: "np.ndarray", arena: Optional[BufferArena] = None
+    ) -> Tuple[float, List[float]]:
         """
-        Analyze noise patterns - Edited regions often have different noise
+        ELA on each text region; the score is the worst region, and the mean
+        error level of every region is returned for comparison
         """
         try:
-            # Convert to grayscale
-            if len(img_array.shape) == 3:
-                gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-            else:
-                gray = img_array
+            rgb = self._rgb(img)
+            max_diff = 0
+            levels = []
+            for x, y, w, h in regions.tolist():
+                crop = rgb.crop((x, y, x + w, y + h))
+                temp_buffer = arena.encode_buffer() if arena else io.BytesIO()
+                crop.save(temp_buffer, format="JPEG", quality=90)
+                temp_buffer.seek(0)
+                diff = ImageChops.difference(crop, self._rgb(Image.open(temp_buffer)))
+
+                max_diff = max(max_diff, max(ex[1] for ex in diff.getextrema()))
+                histogram = diff.convert("L").histogram()
+                levels.append(
+                    sum(i * count for i, count in enumerate(histogram)) / (w * h)
+                )
+
+            return min((max_diff / 255.0) * 100, 100), levels
+        except:
+            return 0, []
 
-            # Calculate noise using Laplacian variance
-            laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-            noise_variance = laplacian.var()
+    def _noise_consistency_score(self, variances: List[float]) -> Tuple[float, List[float]]:
+        """
+        Compare Laplacian variance across text regions - a pasted or retyped
+        field rarely matches the noise and sharpness of the rest of the slip
+        """
+        try:
+            import numpy as np
 
-            # Normalize to 0-100 scale
-            noise_score = min((noise_variance / 1000) * 100, 100)
+            log_variances = np.log(np.maximum(np.array(variances), 1e-6))
+            deviations = np.abs(log_variances - np.median(log_variances))
 
-            return noise_score
+            noise_score = min(float(deviations.max()) / NOISE_LOG_SPREAD * 100, 100)
+            return noise_score, deviations.tolist()
         except:
-            return 0
+            return 0, []
+
+    def _bounding_box(self, regions: "np.ndarray") -> Tuple[int, int, int, int]:
+        x0, y0 = regions[:, 0].min(), regions[:, 1].min()
+        x1 = (regions[:, 0] + regions[:, 2]).max()
+        y1 = (regions[:, 1] + regions[:, 3]).max()
+        return int(x0), int(y0), int(x1), int(y1)
+
+    def _suspicious_regions(
+        self,
+        regions: "np.ndarray",
+        ela_levels: List[float],
+        noise_deviations: List[float],
+        limit: int = 5,
+    ) -> List[Dict[str, Any]]:
+        """Text regions whose noise or error level stands out from the others"""
+        if not ela_levels or not noise_deviations:
+            return []
+        median_ela = sorted(ela_levels)[len(ela_levels) // 2]
+
+        found = []
+        for box, ela_level, deviation in zip(
+            regions.tolist(), ela_levels, noise_deviations
+        ):
+            reasons = []
+            if deviation >= SUSPICIOUS_NOISE_DEVIATION:
+                reasons.append("noise differs from other text")
+            if median_ela > 0 and ela_level >= median_ela * SUSPICIOUS_ELA_RATIO:
+                reasons.append("error level differs from other text")
+            if reasons:
+                found.append(
+                    {
+                        "box": box,
+                        "noise_deviation": round(deviation, 3),
+                        "ela_level": round(ela_level, 2),
+                        "reasons": reasons,
+                    }
+                )
+        found.sort(key=lambda r: r["noise_deviation"], reverse=True)
+        return found[:limit]
+
+    @staticmethod
+    def _rgb(img: Image.Image) -> Image.Image:
+        # convert() copies even when the mode already matches
+        return img if img.mode == "RGB" else img.convert("RGB")
+
+    def _noise_score(self, noise_variance: float) -> float:
+        """
+        Analyze noise patterns - Edited regions often have different noise
+        """
+        # Full-resolution Laplacian variance, normalized to 0-100 scale
+        return min((noise_variance / 1000) * 100, 100)
 
-    async def _compression_analysis(self, img: Image.Image) -> float:
+    def _compression_analysis(
+        self, img: Image.Image, box: Optional[Tuple[int, int, int, int]] = None
+    ) -> float:
         """
         Detect multiple JPEG compression cycles (sign of editing)
         """
@@ -132,18 +495,21 @@ class ForensicAgent:
             # Check if image format is JPEG
             if img.format != "JPEG":
                 return 0
+            if box:
+                img = img.crop(box)
 
             # Analyze DCT coefficients (requires deeper analysis)
             # For now, use a simplified heuristic based on image quality
 
             # Save and reload at different qualities
-            buffer1 = io.BytesIO()
-            buffer2 = io.BytesIO()
+            # Only the encoded sizes are needed, not the bytes
+            high = ByteCounter()
+            low = ByteCounter()
 
-            img.save(buffer1, format="JPEG", quality=95)
-            img.save(buffer2, format="JPEG", quality=50)
+            img.save(high, format="JPEG", quality=95)
+            img.save(low, format="JPEG", quality=50)
 
-            size_ratio = len(buffer1.getvalue()) / len(buffer2.getvalue())
+            size_ratio = high.size / low.size
 
             # If ratio is unusual, might indicate re-compression
             if size_ratio > 2.5 or size_ratio < 1.5:
@@ -153,32 +519,22 @@ class ForensicAgent:
         except:
             return 0
 
-    async def _edge_consistency_analysis(self, img_array: np.ndarray) -> float:
+    def _edge_score(self, edge_pixels: int, pixels_analysed: int) -> float:
         """
         Analyze edge consistency - Copy-paste often creates sharp edges
+        With text regions, only they are scanned, and the density is over
+        their area: relative to the whole image it would fall with text
+        coverage, whether or not the slip was edited.
         """
-        try:
-            # Convert to grayscale
-            if len(img_array.shape) == 3:
-                gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-            else:
-                gray = img_array
-
-            # Detect edges
-            edges = cv2.Canny(gray, 100, 200)
-
-            # Calculate edge density
-            edge_density = np.sum(edges > 0) / edges.size
-
-            # High edge density in certain patterns can indicate manipulation
-            if edge_density > 0.15:
-                return 65
-            elif edge_density > 0.10:
-                return 45
-            return 25
-
-        except:
-            return 0
+        # Calculate edge density
+        edge_density = edge_pixels / pixels_analysed
+
+        # High edge density in certain patterns can indicate manipulation
+        if edge_density > 0.15:
+            return 65
+        elif edge_density > 0.10:
+            return 45
+        return 25
 
     def _get_verdict(self, manipulation_score: float) -> str:
         """Convert manipulation score to verdict"""
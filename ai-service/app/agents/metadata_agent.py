@@ -1,12 +1,16 @@
 """
 Metadata Agent - Extracts and analyzes EXIF and file metadata
 """
+import io
 import logging
-from PIL import Image
-from PIL.ExifTags import TAGS
-from typing import Dict, Any, List
+from fractions import Fraction
+from typing import Dict, Any, List, Optional
 from datetime import datetime
 
+import exifread
+
+from app.core.image_headers import ImageHeaders, read_image_headers
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,6 +27,8 @@ class MetadataAgent:
             "pixlr",
             "snapseed",
         ]
+        # Colour profiles that only name a colour space, not the tool that wrote them
+        self.generic_icc_vendors = ["adobe rgb", "srgb", "display p3"]
 
     async def analyze(self, image_path: str) -> Dict[str, Any]:
         """
@@ -37,25 +43,39 @@ class MetadataAgent:
         try:
             logger.info(f"Metadata agent analyzing: {image_path}")
 
-            # Load image
-            img = Image.open(image_path)
+            # Read header segments only - pixel data is never decoded
+            headers = read_image_headers(image_path)
+        except Exception as e:
+            logger.error(f"Metadata agent error: {str(e)}")
+            return self._unavailable()
+
+        return await self.analyze_headers(headers)
 
+    async def analyze_headers(self, headers: ImageHeaders) -> Dict[str, Any]:
+        """
+        Analyze already-scanned headers (e.g. from a streamed upload, before
+        the rest of the image has arrived)
+        """
+        try:
             # Extract EXIF data
-            exif_data = self._extract_exif(img)
+            exif_data = self._extract_exif(headers)
+            creator_tool = headers.creator_tool
+            icc_description = headers.icc_description
 
             # Analyze metadata
             flags = []
-            software_detected = None
 
             # Check for editing software
-            software = exif_data.get("Software", "").lower()
-            for editor in self.editing_software:
-                if editor in software:
-                    software_detected = editor
-                    flags.append(
-                        f"Edited with {editor} - may indicate manipulation"
-                    )
-                    break
+            software_detected = self._detect_editor(
+                exif_data.get("Software"),
+                creator_tool,
+                headers.text.get("Software"),
+                icc_description,
+            )
+            if software_detected:
+                flags.append(
+                    f"Edited with {software_detected} - may indicate manipulation"
+                )
 
             # Check if EXIF data was stripped (suspicious)
             if not exif_data or len(exif_data) < 3:
@@ -74,8 +94,11 @@ class MetadataAgent:
                 "exif_data": exif_data,
                 "flags": flags,
                 "software_detected": software_detected,
+                "creator_tool": creator_tool,
+                "icc_description": icc_description,
                 "datetime_consistent": datetime_consistent,
                 "risk_level": "high" if len(flags) >= 3 else "medium" if len(flags) >= 1 else "low",
+                "header_bytes_scanned": headers.bytes_scanned,
             }
 
             logger.info(
@@ -85,30 +108,87 @@ class MetadataAgent:
 
         except Exception as e:
             logger.error(f"Metadata agent error: {str(e)}")
-            # Return safe default
-            return {
-                "exif_data": {},
-                "flags": ["Unable to extract metadata"],
-                "software_detected": None,
-                "datetime_consistent": True,
-                "risk_level": "low",
-            }
+            return self._unavailable()
+
+    def _unavailable(self) -> Dict[str, Any]:
+        """Safe default when metadata cannot be read"""
+        return {
+            "exif_data": {},
+            "flags": ["Unable to extract metadata"],
+            "software_detected": None,
+            "creator_tool": None,
+            "icc_description": None,
+            "datetime_consistent": True,
+            "risk_level": "low",
+        }
+
+    def _extract_exif(self, headers: ImageHeaders) -> Dict[str, Any]:
+        """Decode the raw EXIF block into typed values"""
+        if not headers.exif:
+            return {}
 
-    def _extract_exif(self, img: Image.Image) -> Dict[str, Any]:
-        """Extract EXIF data from image"""
         try:
-            exif_data = {}
-            exif = img._getexif()
-
-            if exif:
-                for tag_id, value in exif.items():
-                    tag = TAGS.get(tag_id, tag_id)
-                    exif_data[tag] = str(value)
-
-            return exif_data
-        except:
+            tags = exifread.process_file(
+                io.BytesIO(headers.exif), details=False, extract_thumbnail=False
+            )
+        except Exception as e:
+            logger.warning(f"EXIF decode failed: {str(e)}")
             return {}
 
+        exif_data = {}
+        for key, tag in tags.items():
+            ifd, _, name = key.partition(" ")
+            if ifd == "Thumbnail" or not name:
+                continue
+            value = self._typed_value(tag.values)
+            if value is not None:
+                # Keep the same tag names PIL reports, e.g. "Software", "GPSInfo"
+                exif_data.setdefault(name, value)
+
+        return exif_data
+
+    def _typed_value(self, values: Any) -> Any:
+        """Convert an exifread value to str/int/float (or a short list of them)"""
+        if isinstance(values, bytes):
+            values = values.decode("utf-8", "replace")
+        if isinstance(values, str):
+            return values.strip("\x00 ") or None
+        if not isinstance(values, list) or not values or len(values) > 16:
+            # Large opaque blobs (MakerNote, UserComment, ...) are dropped
+            return None
+
+        converted = [
+            float(v) if isinstance(v, Fraction) else v
+            for v in values
+            if isinstance(v, (int, float, Fraction))
+        ]
+        if not converted:
+            return None
+        return converted[0] if len(converted) == 1 else converted
+
+    def _detect_editor(
+        self,
+        software: Optional[str],
+        creator_tool: Optional[str],
+        png_software: Optional[str],
+        icc_description: Optional[str],
+    ) -> Optional[str]:
+        """Look for editing software in every header field that can name it"""
+        candidates = [software, creator_tool, png_software]
+        if icc_description and not any(
+            generic in icc_description.lower() for generic in self.generic_icc_vendors
+        ):
+            candidates.append(icc_description)
+
+        for candidate in candidates:
+            if not isinstance(candidate, str):
+                continue
+            lowered = candidate.lower()
+            for editor in self.editing_software:
+                if editor in lowered:
+                    return editor
+        return None
+
     def _check_datetime_consistency(self, exif_data: Dict) -> bool:
         """Check if datetime fields are consistent"""
         try:
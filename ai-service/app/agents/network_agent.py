@@ -0,0 +1,129 @@
+"""
+Network Agent - Links receipts that share accounts, phones and merchants
+Fraud rings reuse the same recipient accounts and phone numbers across many
+victims and fake merchant names; this agent records each receipt in the
+entity graph and reports how widely its accounts and phones are shared.
+"""
+import hashlib
+import logging
+import re
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.agents.reputation_agent import ACCOUNT_NUMBER_PATTERN, PHONE_NUMBER_PATTERN
+from app.core.entity_graph import EntityGraph
+
+logger = logging.getLogger(__name__)
+
+
+class NetworkAgent:
+    """Cross-receipt account/phone/merchant reuse lookup"""
+
+    def __init__(self, graph: EntityGraph, window_days: float = 30):
+        self.graph = graph
+        self.window_days = window_days
+
+    async def analyze(
+        self,
+        vision: Dict[str, Any],
+        receipt_id: str,
+        submitter_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Index the receipt's entities, then count what else touched them
+
+        Counts cover the last window_days and include this receipt.
+
+        Returns:
+            - accounts / phones: Per entity receipts, submitters, merchants
+            - max_receipts / max_submitters / max_merchants: Worst entity
+            - ring: Counts for the entity seen under the most merchant names
+        """
+        try:
+            started = time.perf_counter()
+            accounts = self._account_numbers(vision)
+            phones = self._phone_numbers(vision)
+            merchant = _normalize_merchant(vision.get("merchant_name"))
+
+            self.graph.add_receipt(
+                receipt_id,
+                {
+                    "account": [_hash(number) for number in accounts],
+                    "phone": [_hash(number) for number in phones],
+                    "merchant": [merchant] if merchant else [],
+                },
+                submitter_id=submitter_id,
+            )
+
+            linked = {
+                "accounts": [
+                    {
+                        "account_number": number[:3] + "****" + number[-2:],  # Masked
+                        **self.graph.neighbourhood(
+                            "account", _hash(number), self.window_days
+                        ),
+                    }
+                    for number in accounts
+                ],
+                "phones": [
+                    {
+                        "phone_number": number[:4] + "****" + number[-2:],
+                        **self.graph.neighbourhood("phone", _hash(number), self.window_days),
+                    }
+                    for number in phones
+                ],
+            }
+            entities = linked["accounts"] + linked["phones"]
+            ring = max(
+                entities,
+                key=lambda e: (e["merchants"], e["submitters"], e["receipts"]),
+                default={"receipts": 0, "submitters": 0, "merchants": 0},
+            )
+            result = {
+                **linked,
+                "window_days": self.window_days,
+                "max_receipts": max((e["receipts"] for e in entities), default=0),
+                "max_submitters": max((e["submitters"] for e in entities), default=0),
+                "max_merchants": max((e["merchants"] for e in entities), default=0),
+                "ring": {
+                    key: ring[key] for key in ("receipts", "submitters", "merchants")
+                },
+                "lookup_ms": round((time.perf_counter() - started) * 1000, 3),
+            }
+
+            logger.info(
+                f"Network agent completed. Entities: {len(entities)}, "
+                f"max submitters {result['max_submitters']}, "
+                f"max merchants {result['max_merchants']}"
+            )
+            return result
+
+        except Exception as e:
+            logger.error(f"Network agent error: {str(e)}")
+            raise
+
+    def _account_numbers(self, vision: Dict[str, Any]) -> List[str]:
+        found = _digits(vision.get("account_numbers"))
+        found.update(re.findall(ACCOUNT_NUMBER_PATTERN, vision.get("ocr_text") or ""))
+        return sorted(number for number in found if len(number) == 10)
+
+    def _phone_numbers(self, vision: Dict[str, Any]) -> List[str]:
+        found = _digits(vision.get("phone_numbers"))
+        found.update(re.findall(PHONE_NUMBER_PATTERN, vision.get("ocr_text") or ""))
+        # +2348031234567 and 08031234567 are the same line
+        return sorted({"0" + number[-10:] for number in found if len(number) >= 10})
+
+
+def _digits(values: Optional[Iterable[Any]]) -> set:
+    return {re.sub(r"\D", "", str(value)) for value in values or [] if value}
+
+
+def _normalize_merchant(name: Optional[str]) -> Optional[str]:
+    if not name or not isinstance(name, str):
+        return None
+    return " ".join(name.lower().split()) or None
+
+
+def _hash(value: str) -> str:
+    # Same hashing as fraud_reports.account_hash; raw numbers are never kept
+    return hashlib.sha256(value.encode()).hexdigest()
@@ -1,14 +1,26 @@
 """
 Multi-Agent Orchestrator for Receipt Analysis
-Coordinates vision, forensic, metadata, reputation, and reasoning agents
+Coordinates vision, forensic, metadata, reputation, and reasoning agents,
+plus the optional template and cross-receipt network agents
 """
 import asyncio
 import logging
-from typing import Dict, List, Any
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 from datetime import datetime
 
+from app.agents.pipeline import AgentGraph, AgentNode
+from app.core.cache import SharedCache
+from app.core.imaging import file_sha256
+from app.core.metrics import SampleWindow
+from app.core.normalize import ImageRejectedError, NormalizedImage
+from app.core.text_regions import check_text_regions
+
 logger = logging.getLogger(__name__)
 
+# Async callback receiving (event_name, payload) while an analysis runs
+EventCallback = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
 
 class ReceiptAnalysisOrchestrator:
     """Orchestrates multiple AI agents for comprehensive receipt analysis"""
@@ -20,98 +32,300 @@ class ReceiptAnalysisOrchestrator:
         metadata_agent,
         reputation_agent,
         reasoning_agent,
+        cache: Optional[SharedCache] = None,
+        result_sinks: Optional[List[Any]] = None,
+        template_agent=None,
+        network_agent=None,
+        vision_batcher=None,
+        normalizer=None,
+        executor=None,
     ):
         self.vision_agent = vision_agent
         self.forensic_agent = forensic_agent
         self.metadata_agent = metadata_agent
         self.reputation_agent = reputation_agent
         self.reasoning_agent = reasoning_agent
+        self.template_agent = template_agent
+        self.network_agent = network_agent
+        # Multi-image Gemini requests for bulk analyses (batch_vision=True)
+        self.vision_batcher = vision_batcher
+        # ImageNormalizer run before any agent decodes the image
+        self.normalizer = normalizer
+        # CancellableExecutor for the local CPU work (text check)
+        self.executor = executor
+        self.cache = cache
+        # Objects with an async record(receipt_id, agent_results, final_analysis),
+        # e.g. AgentOutputStore for offline re-scoring
+        self.result_sinks = list(result_sinks or [])
+
+        # Agent nodes in report order; reasoning is always the final sink
+        self.nodes: List[AgentNode] = []
+        self.register(
+            AgentNode(
+                name="vision",
+                inputs=("image_path", "receipt_id", "image_hash"),
+                optional_inputs=("reputation_lookups", "batch_vision"),
+                run=lambda ctx: self._run_vision_agent(
+                    ctx["image_path"],
+                    ctx["receipt_id"],
+                    ctx["image_hash"],
+                    ctx.get("reputation_lookups"),
+                    ctx.get("batch_vision", False),
+                ),
+                summarize=lambda r: {"confidence": r.get("confidence", 0)},
+            )
+        )
+        self.register(
+            AgentNode(
+                name="forensic",
+                inputs=("image_path", "receipt_id"),
+                optional_inputs=("image_hash",),
+                run=lambda ctx: self._run_forensic_agent(
+                    ctx["image_path"], ctx["receipt_id"], ctx.get("image_hash")
+                ),
+                summarize=lambda r: {
+                    "manipulation_score": r.get("manipulation_score", 0)
+                },
+            )
+        )
+        # EXIF lives in the original upload, not the normalized copy
+        self.register(
+            AgentNode(
+                name="metadata",
+                inputs=("image_path", "receipt_id"),
+                optional_inputs=("source_path",),
+                run=lambda ctx: self._run_metadata_agent(
+                    ctx.get("source_path", ctx["image_path"]), ctx["receipt_id"]
+                ),
+                summarize=lambda r: {"flags": len(r.get("flags", []))},
+            )
+        )
+        # Known slip layouts; runs beside vision (not ahead of it) and only
+        # feeds the reasoning agent
+        if template_agent:
+            self.register(
+                AgentNode(
+                    name="template",
+                    inputs=("image_path", "receipt_id"),
+                    run=lambda ctx: self._run_template_agent(
+                        ctx["image_path"], ctx["receipt_id"]
+                    ),
+                    summarize=lambda r: {
+                        "template": r.get("template"),
+                        "layout_deviation": r.get("layout_deviation", 0),
+                    },
+                )
+            )
+        # Run reputation agent once we have extracted text; its lookups may
+        # already have been started from the streamed Gemini fields
+        self.register(
+            AgentNode(
+                name="reputation",
+                inputs=("vision", "receipt_id"),
+                optional_inputs=("reputation_lookups",),
+                run=lambda ctx: self._run_reputation_agent(
+                    ctx["vision"].get("ocr_text", ""),
+                    ctx["receipt_id"],
+                    ctx["vision"].get("merchant_name"),
+                    ctx.get("reputation_lookups"),
+                ),
+                summarize=lambda r: {
+                    "accounts_checked": len(r.get("accounts_analyzed", []))
+                },
+            )
+        )
+        # Accounts/phones shared with other receipts (fraud rings)
+        if network_agent:
+            self.register(
+                AgentNode(
+                    name="network",
+                    inputs=("vision", "receipt_id"),
+                    optional_inputs=("submitter_id",),
+                    run=lambda ctx: self._run_network_agent(
+                        ctx["vision"], ctx["receipt_id"], ctx.get("submitter_id")
+                    ),
+                    summarize=lambda r: {
+                        "max_submitters": r.get("max_submitters", 0),
+                        "max_merchants": r.get("max_merchants", 0),
+                    },
+                )
+            )
+        # Forensic/metadata part of the reasoning, available before Gemini returns
+        self.register(
+            AgentNode(
+                name="provisional",
+                inputs=("receipt_id",),
+                optional_inputs=("forensic", "metadata"),
+                run=self._run_provisional_reasoning,
+                reported=False,
+                stream_only=True,
+            )
+        )
+
+        # Local text check, only used by the fast pre-screen
+        self.text_check_node = AgentNode(
+            name="text_check",
+            inputs=("image_path",),
+            run=lambda ctx: self._check_text(ctx["image_path"]),
+            summarize=lambda r: {"text_lines": r.get("text_lines", 0)},
+        )
+        self.prescreen_counters = {
+            "requests": 0,
+            "authentic": 0,
+            "fraudulent": 0,
+            "escalated": 0,
+        }
+        self.prescreen_seconds = SampleWindow()
+        self.escalated_seconds = SampleWindow()
+        # Analyses cancelled mid-way (client gone, deadline passed) and the
+        # agents that were pending or running at that moment
+        self.cancelled_analyses = 0
+        self.cancelled_nodes: Dict[str, int] = {}
+
+    def register(self, node: AgentNode) -> None:
+        """
+        Add an agent to the analysis graph. Reported nodes are passed to the
+        reasoning agent automatically, so new agents need no orchestrator edits.
+        """
+        if any(existing.name == node.name for existing in self.nodes):
+            raise ValueError(f"Agent node '{node.name}' already registered")
+        self.nodes.append(node)
+
+    def _build_graph(self, streaming: bool = False) -> AgentGraph:
+        """The analysis graph; stream-only nodes are left out when nobody consumes events"""
+        nodes = [node for node in self.nodes if streaming or not node.stream_only]
+        reported = tuple(node.output for node in nodes if node.reported)
+        reasoning = AgentNode(
+            name="reasoning",
+            inputs=("receipt_id",),
+            optional_inputs=reported,
+            run=lambda ctx: self._run_reasoning_agent(
+                {key: ctx[key] for key in reported if key in ctx}, ctx["receipt_id"]
+            ),
+            reported=False,
+        )
+        return AgentGraph(nodes + [reasoning])
 
     async def analyze_receipt(
-        self, image_path: str, receipt_id: str
+        self,
+        image_path: str,
+        receipt_id: str,
+        on_event: Optional[EventCallback] = None,
+        precomputed: Optional[Dict[str, Any]] = None,
+        submitter_id: Optional[str] = None,
+        measure_cpu: bool = False,
+        image_hash: Optional[str] = None,
+        batch_vision: bool = False,
+        normalized: Optional[NormalizedImage] = None,
     ) -> Dict[str, Any]:
         """
-        Run all agents in parallel and synthesize results
+        Run all agents as a dependency graph and synthesize results
+
+        If on_event is given it is awaited with ("agent", log) as each agent
+        finishes, then ("provisional", analysis) once forensic and metadata
+        results can be scored without the vision/reputation phase. The final
+        result is the same whether or not events are consumed.
+
+        precomputed maps agent names to results already available (e.g. from
+        the pre-screen); those agents are not run again. submitter_id (the
+        uploading user, when known) feeds the cross-receipt network agent.
+        measure_cpu records per-agent CPU time in the pipeline report.
+        image_hash skips re-hashing when the caller already has the SHA-256
+        (streamed uploads hash while receiving). batch_vision lets the vision
+        call share a multi-image Gemini request with other queued receipts
+        (bulk path; no effect without a vision batcher). normalized is the
+        already normalized image when the caller ran the normalizer itself.
+
+        Raises ImageRejectedError for images too large to decode safely.
 
         Returns comprehensive analysis including trust score, verdict, issues, etc.
         """
         start_time = datetime.now()
         agent_results = {}
         agent_logs = []
+        owns_normalized = normalized is None
 
         try:
-            # Run agents in parallel with timeouts
             logger.info(f"Starting multi-agent analysis for receipt {receipt_id}")
 
-            # Execute all agents concurrently
-            results = await asyncio.gather(
-                self._run_vision_agent(image_path, receipt_id),
-                self._run_forensic_agent(image_path, receipt_id),
-                self._run_metadata_agent(image_path, receipt_id),
-                return_exceptions=True,
-            )
+            # Identical images (re-uploads, retries) reuse the cached vision
+            # and forensic outputs. The verdict itself is never cached:
+            # reputation, the network index and reasoning run every time so
+            # fraud reports filed since the last analysis count
+            if image_hash is None:
+                image_hash = await asyncio.to_thread(file_sha256, image_path)
 
-            # Process results
-            vision_result, forensic_result, metadata_result = results
+            # Orientation, colour mode and pixel budget; the hash and the
+            # metadata agent stay on the original file
+            if normalized is None:
+                normalized = await self._normalize(image_path)
 
-            if not isinstance(vision_result, Exception):
-                agent_results["vision"] = vision_result
-                agent_logs.append(
-                    {
-                        "agent": "vision",
-                        "status": "success",
-                        "confidence": vision_result.get("confidence", 0),
-                    }
-                )
+            graph = self._build_graph(streaming=on_event is not None)
 
-            if not isinstance(forensic_result, Exception):
-                agent_results["forensic"] = forensic_result
-                agent_logs.append(
-                    {
-                        "agent": "forensic",
-                        "status": "success",
-                        "manipulation_score": forensic_result.get(
-                            "manipulation_score", 0
-                        ),
-                    }
-                )
+            async def on_settled(
+                node: AgentNode, status: str, output: Any, timing: Dict
+            ) -> None:
+                if not on_event:
+                    return
+                if node.reported:
+                    if status in ("success", "seeded"):
+                        log = self._agent_log(node, output)
+                    else:
+                        log = {
+                            "agent": node.name,
+                            "status": status,
+                            "error": timing.get("error") or timing.get("reason"),
+                        }
+                    log["elapsed_seconds"] = timing["end_ms"] / 1000
+                    await self._emit(on_event, "agent", log)
+                elif node.name == "provisional" and output:
+                    await self._emit(on_event, "provisional", output)
 
-            if not isinstance(metadata_result, Exception):
-                agent_results["metadata"] = metadata_result
-                agent_logs.append(
-                    {
-                        "agent": "metadata",
-                        "status": "success",
-                        "flags": len(metadata_result.get("flags", [])),
-                    }
+            context = {
+                **(precomputed or {}),
+                "image_path": normalized.path if normalized else image_path,
+                "receipt_id": receipt_id,
+                "image_hash": image_hash,
+            }
+            if normalized and normalized.path != image_path:
+                context["source_path"] = image_path
+            if submitter_id:
+                context["submitter_id"] = submitter_id
+            if batch_vision and self.vision_batcher:
+                context["batch_vision"] = True
+            lookups = None
+            if hasattr(self.reputation_agent, "lookups"):
+                lookups = context["reputation_lookups"] = self.reputation_agent.lookups()
+            try:
+                graph_run = await graph.run(
+                    context,
+                    on_settled,
+                    measure_cpu=measure_cpu,
+                    on_cancelled=self._count_cancelled,
                 )
+            finally:
+                if lookups:
+                    lookups.close()
 
-            # Run reputation agent if we have extracted text
-            if "vision" in agent_results:
-                ocr_text = agent_results["vision"].get("ocr_text", "")
-                reputation_result = await self._run_reputation_agent(
-                    ocr_text, receipt_id
-                )
-                if not isinstance(reputation_result, Exception):
-                    agent_results["reputation"] = reputation_result
-                    agent_logs.append(
-                        {
-                            "agent": "reputation",
-                            "status": "success",
-                            "accounts_checked": len(
-                                reputation_result.get("accounts_analyzed", [])
-                            ),
-                        }
-                    )
+            # Process results in registration order
+            for node in self.nodes:
+                if node.reported and graph_run.succeeded(node):
+                    agent_results[node.output] = graph_run.outputs[node.output]
+                    agent_logs.append(self._agent_log(node, agent_results[node.output]))
 
-            # Run reasoning agent to synthesize all results
-            final_analysis = await self._run_reasoning_agent(agent_results, receipt_id)
+            final_analysis = graph_run.outputs.get("reasoning", {})
 
             # Calculate processing time
             processing_time = (datetime.now() - start_time).total_seconds()
 
+            logger.info(
+                f"Critical path for {receipt_id}: "
+                f"{' -> '.join(graph_run.critical_path)} "
+                f"({graph_run.report()['critical_path_ms']} ms)"
+            )
+
             # Compile final response
-            return {
+            result = {
                 "receipt_id": receipt_id,
                 "trust_score": final_analysis.get("trust_score", 50),
                 "verdict": final_analysis.get("verdict", "unclear"),
@@ -130,9 +344,17 @@ class ReceiptAnalysisOrchestrator:
                 },
                 "merchant": agent_results.get("reputation", {}).get("merchant"),
                 "agent_logs": agent_logs,
+                "pipeline": graph_run.report(),
                 "processing_time_seconds": processing_time,
             }
+            if normalized:
+                result["normalization"] = normalized.stats()
 
+            await self._record(receipt_id, agent_results, final_analysis)
+            return result
+
+        except ImageRejectedError:
+            raise
         except Exception as e:
             logger.error(f"Orchestrator error for receipt {receipt_id}: {str(e)}")
             return {
@@ -155,24 +377,265 @@ class ReceiptAnalysisOrchestrator:
                 "merchant": None,
                 "agent_logs": agent_logs,
             }
+        finally:
+            if owns_normalized:
+                self._discard_normalized(normalized)
 
-    async def _run_vision_agent(self, image_path: str, receipt_id: str) -> Dict:
+    async def analyze_receipt_fast(
+        self,
+        image_path: str,
+        receipt_id: str,
+        submitter_id: Optional[str] = None,
+        measure_cpu: bool = False,
+        precomputed: Optional[Dict[str, Any]] = None,
+        image_hash: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Local-only pre-screen (forensic, metadata, text check; no Gemini).
+        Returns it directly when conclusive, otherwise escalates to the full
+        analysis, reusing the forensic and metadata results.
+
+        Raises ImageRejectedError for images too large to decode safely.
+        """
+        normalized = await self._normalize(image_path)
+        try:
+            return await self._prescreen(
+                image_path,
+                receipt_id,
+                submitter_id=submitter_id,
+                measure_cpu=measure_cpu,
+                precomputed=precomputed,
+                image_hash=image_hash,
+                normalized=normalized,
+            )
+        finally:
+            self._discard_normalized(normalized)
+
+    async def _prescreen(
+        self,
+        image_path: str,
+        receipt_id: str,
+        submitter_id: Optional[str],
+        measure_cpu: bool,
+        precomputed: Optional[Dict[str, Any]],
+        image_hash: Optional[str],
+        normalized: Optional[NormalizedImage],
+    ) -> Dict[str, Any]:
+        start_time = datetime.now()
+        self.prescreen_counters["requests"] += 1
+        nodes = {node.name: node for node in self.nodes}
+        graph = AgentGraph(
+            [
+                nodes["forensic"],
+                nodes["metadata"],
+                self.text_check_node,
+                AgentNode(
+                    name="prescreen",
+                    inputs=("receipt_id",),
+                    optional_inputs=("forensic", "metadata", "text_check"),
+                    run=lambda ctx: self.reasoning_agent.prescreen(
+                        ctx.get("forensic"), ctx.get("metadata"), ctx.get("text_check")
+                    ),
+                    reported=False,
+                ),
+            ]
+        )
+        context = {
+            **(precomputed or {}),
+            "image_path": normalized.path if normalized else image_path,
+            "receipt_id": receipt_id,
+        }
+        if image_hash:
+            context["image_hash"] = image_hash
+        if normalized and normalized.path != image_path:
+            context["source_path"] = image_path
+        graph_run = await graph.run(
+            context, measure_cpu=measure_cpu, on_cancelled=self._count_cancelled
+        )
+
+        outputs = graph_run.outputs
+        screen = outputs.get("prescreen") or {"conclusive": False, "reasons": []}
+        prescreen_seconds = (datetime.now() - start_time).total_seconds()
+        self.prescreen_seconds.add(prescreen_seconds)
+        prescreen = {
+            "conclusive": screen["conclusive"],
+            "reasons": screen["reasons"],
+            "text_check": outputs.get("text_check"),
+            "pipeline": graph_run.report(),
+            "processing_time_seconds": prescreen_seconds,
+        }
+
+        if not screen["conclusive"]:
+            logger.info(
+                f"Pre-screen inconclusive for {receipt_id}, escalating: {screen['reasons']}"
+            )
+            self.prescreen_counters["escalated"] += 1
+            precomputed = {
+                key: outputs[key] for key in ("forensic", "metadata") if key in outputs
+            }
+            result = await self.analyze_receipt(
+                image_path,
+                receipt_id,
+                precomputed=precomputed,
+                submitter_id=submitter_id,
+                measure_cpu=measure_cpu,
+                image_hash=image_hash,
+                normalized=normalized,
+            )
+            self.escalated_seconds.add((datetime.now() - start_time).total_seconds())
+            result.update(mode="full", escalated=True, prescreen=prescreen)
+            return result
+
+        self.prescreen_counters[screen["verdict"]] += 1
+        agent_logs = [
+            self._agent_log(node, outputs[node.output])
+            for node in graph.nodes
+            if node.reported and graph_run.succeeded(node)
+        ]
+        return {
+            "receipt_id": receipt_id,
+            "trust_score": screen["trust_score"],
+            "verdict": screen["verdict"],
+            "issues": screen["issues"],
+            "recommendation": screen["recommendation"],
+            "forensic_details": {
+                "ocr_confidence": 0,
+                "manipulation_score": outputs.get("forensic", {}).get(
+                    "manipulation_score", 0
+                ),
+                "metadata_flags": outputs.get("metadata", {}).get("flags", []),
+            },
+            "merchant": None,
+            "agent_logs": agent_logs,
+            "mode": "fast",
+            "escalated": False,
+            "prescreen": prescreen,
+            "processing_time_seconds": prescreen_seconds,
+            **({"normalization": normalized.stats()} if normalized else {}),
+        }
+
+    def prescreen_stats(self) -> Dict[str, Any]:
+        counters = self.prescreen_counters
+        requests = counters["requests"]
+        return {
+            **counters,
+            "escalation_rate": round(counters["escalated"] / requests, 3)
+            if requests
+            else 0.0,
+            "prescreen_seconds": self.prescreen_seconds.summary(),
+            "escalated_total_seconds": self.escalated_seconds.summary(),
+        }
+
+    async def _check_text(self, image_path: str) -> Dict[str, Any]:
+        if self.executor:
+            return await self.executor.run(
+                "text_check", lambda path, cancel: check_text_regions(path), image_path
+            )
+        return await asyncio.to_thread(check_text_regions, image_path)
+
+    def _count_cancelled(self, nodes: List[str]) -> None:
+        self.cancelled_analyses += 1
+        for name in nodes:
+            self.cancelled_nodes[name] = self.cancelled_nodes.get(name, 0) + 1
+        logger.info(f"Analysis cancelled with {', '.join(nodes) or 'no'} agents unfinished")
+
+    def cancellation_stats(self) -> Dict[str, Any]:
+        return {
+            "analyses": self.cancelled_analyses,
+            "unfinished_agents": dict(self.cancelled_nodes),
+        }
+
+    async def _normalize(self, image_path: str) -> Optional[NormalizedImage]:
+        if not self.normalizer:
+            return None
+        return await asyncio.to_thread(self.normalizer.normalize, image_path)
+
+    @staticmethod
+    def _discard_normalized(normalized: Optional[NormalizedImage]) -> None:
+        """Remove the normalized copy (never the original)"""
+        if normalized and normalized.path != normalized.source_path:
+            try:
+                os.remove(normalized.path)
+            except OSError:
+                pass
+
+    def _agent_log(self, node: AgentNode, result: Any) -> Dict[str, Any]:
+        """Compact per-agent summary used in agent_logs and progress events"""
+        log = {"agent": node.name, "status": "success"}
+        if node.summarize:
+            log.update(node.summarize(result))
+        return log
+
+    async def _record(
+        self, receipt_id: str, agent_results: Dict[str, Any], final_analysis: Dict
+    ) -> None:
+        """Hand the raw agent outputs to every result sink"""
+        for sink in self.result_sinks:
+            try:
+                await sink.record(receipt_id, agent_results, final_analysis)
+            except Exception as e:
+                logger.warning(f"Result sink {type(sink).__name__} failed: {str(e)}")
+
+    async def _emit(
+        self, on_event: Optional[EventCallback], event: str, data: Dict[str, Any]
+    ) -> None:
+        """Deliver an event; a failing listener must never break the analysis"""
+        if not on_event:
+            return
+        try:
+            await on_event(event, data)
+        except Exception as e:
+            logger.warning(f"Event listener failed on '{event}': {str(e)}")
+
+    async def _run_vision_agent(
+        self,
+        image_path: str,
+        receipt_id: str,
+        image_hash: str,
+        lookups=None,
+        batched: bool = False,
+    ) -> Dict:
         """Run Gemini Vision agent for OCR and visual analysis"""
         try:
+            if self.cache:
+                cached = await self.cache.get("vision", image_hash)
+                if cached:
+                    logger.info(f"Vision cache hit for {receipt_id}")
+                    return cached
+
             logger.info(f"Running vision agent for {receipt_id}")
-            result = await self.vision_agent.analyze(image_path)
+            if batched:
+                result = await self.vision_batcher.analyze(image_path, receipt_id)
+            else:
+                result = await self.vision_agent.analyze(
+                    image_path, on_field=lookups.on_field if lookups else None
+                )
             logger.info(f"Vision agent completed for {receipt_id}")
+
+            if self.cache:
+                await self.cache.set("vision", image_hash, result)
             return result
         except Exception as e:
             logger.error(f"Vision agent failed for {receipt_id}: {str(e)}")
             raise
 
-    async def _run_forensic_agent(self, image_path: str, receipt_id: str) -> Dict:
+    async def _run_forensic_agent(
+        self, image_path: str, receipt_id: str, image_hash: Optional[str] = None
+    ) -> Dict:
         """Run forensic analysis agent"""
         try:
+            if self.cache and image_hash:
+                cached = await self.cache.get("forensic", image_hash)
+                if cached:
+                    logger.info(f"Forensic cache hit for {receipt_id}")
+                    return cached
+
             logger.info(f"Running forensic agent for {receipt_id}")
             result = await self.forensic_agent.analyze(image_path)
             logger.info(f"Forensic agent completed for {receipt_id}")
+
+            if self.cache and image_hash:
+                await self.cache.set("forensic", image_hash, result)
             return result
         except Exception as e:
             logger.error(f"Forensic agent failed for {receipt_id}: {str(e)}")
@@ -189,17 +652,64 @@ class ReceiptAnalysisOrchestrator:
             logger.error(f"Metadata agent failed for {receipt_id}: {str(e)}")
             raise
 
-    async def _run_reputation_agent(self, ocr_text: str, receipt_id: str) -> Dict:
+    async def _run_template_agent(self, image_path: str, receipt_id: str) -> Dict:
+        """Run template matching agent"""
+        try:
+            logger.info(f"Running template agent for {receipt_id}")
+            result = await self.template_agent.analyze(image_path)
+            logger.info(f"Template agent completed for {receipt_id}")
+            return result
+        except Exception as e:
+            logger.error(f"Template agent failed for {receipt_id}: {str(e)}")
+            raise
+
+    async def _run_network_agent(
+        self, vision: Dict, receipt_id: str, submitter_id: Optional[str]
+    ) -> Dict:
+        """Run cross-receipt network agent"""
+        try:
+            logger.info(f"Running network agent for {receipt_id}")
+            result = await self.network_agent.analyze(vision, receipt_id, submitter_id)
+            logger.info(f"Network agent completed for {receipt_id}")
+            return result
+        except Exception as e:
+            logger.error(f"Network agent failed for {receipt_id}: {str(e)}")
+            raise
+
+    async def _run_reputation_agent(
+        self,
+        ocr_text: str,
+        receipt_id: str,
+        merchant_name: Optional[str] = None,
+        lookups=None,
+    ) -> Dict:
         """Run reputation checking agent"""
         try:
             logger.info(f"Running reputation agent for {receipt_id}")
-            result = await self.reputation_agent.analyze(ocr_text)
+            result = await self.reputation_agent.analyze(
+                ocr_text, merchant_name=merchant_name, lookups=lookups
+            )
             logger.info(f"Reputation agent completed for {receipt_id}")
             return result
         except Exception as e:
             logger.error(f"Reputation agent failed for {receipt_id}: {str(e)}")
             raise
 
+    async def _run_provisional_reasoning(self, ctx: Dict[str, Any]) -> Optional[Dict]:
+        """Score the local-only agents while Gemini and reputation are still running"""
+        partial = {key: ctx[key] for key in ("forensic", "metadata") if key in ctx}
+        if not partial:
+            return None
+
+        analysis = await self._run_reasoning_agent(partial, ctx["receipt_id"])
+        return {
+            "receipt_id": ctx["receipt_id"],
+            "trust_score": analysis.get("trust_score", 50),
+            "verdict": analysis.get("verdict", "unclear"),
+            "issues": analysis.get("issues", []),
+            "based_on": sorted(partial),
+        }
+
     async def _run_reasoning_agent(
         self, agent_results: Dict, receipt_id: str
     ) -> Dict:
@@ -0,0 +1,223 @@
+"""
+Agent Pipeline - Dependency-graph scheduler for the analysis agents
+Each node declares the inputs it needs and the output it produces; nodes
+start as soon as their inputs resolve, so independent work always overlaps.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.profiler import cpu_timed
+
+logger = logging.getLogger(__name__)
+
+# Async callback receiving (node, status, output, timing) as each node settles
+NodeCallback = Callable[["AgentNode", str, Any, Dict[str, Any]], Awaitable[None]]
+
+
+class _Missing:
+    """Marker for an output whose producer failed or was skipped"""
+
+
+MISSING = _Missing()
+
+
+@dataclass
+class AgentNode:
+    """A unit of work in the analysis graph"""
+
+    name: str
+    run: Callable[[Dict[str, Any]], Awaitable[Any]]
+    inputs: Tuple[str, ...] = ()
+    optional_inputs: Tuple[str, ...] = ()
+    output: Optional[str] = None
+    # Whether the output is an agent result (fed to reasoning and agent_logs)
+    reported: bool = True
+    # Only of use to event consumers (e.g. provisional scores for SSE clients)
+    stream_only: bool = False
+    summarize: Optional[Callable[[Any], Dict[str, Any]]] = None
+
+    def __post_init__(self):
+        if self.output is None:
+            self.output = self.name
+
+    @property
+    def dependencies(self) -> Tuple[str, ...]:
+        return tuple(self.inputs) + tuple(self.optional_inputs)
+
+
+@dataclass
+class GraphRun:
+    """Outputs and per-node timing of one graph execution"""
+
+    outputs: Dict[str, Any] = field(default_factory=dict)
+    timings: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    critical_path: List[str] = field(default_factory=list)
+
+    def succeeded(self, node: AgentNode) -> bool:
+        return self.timings.get(node.name, {}).get("status") in ("success", "seeded")
+
+    def report(self) -> Dict[str, Any]:
+        critical_ms = 0.0
+        if self.critical_path:
+            critical_ms = self.timings[self.critical_path[-1]]["end_ms"]
+        return {
+            "nodes": self.timings,
+            "critical_path": self.critical_path,
+            "critical_path_ms": critical_ms,
+        }
+
+
+class AgentGraph:
+    """Schedules AgentNodes by data dependency with maximum overlap"""
+
+    def __init__(self, nodes: List[AgentNode]):
+        self.nodes = list(nodes)
+        self._producers: Dict[str, AgentNode] = {}
+        for node in self.nodes:
+            if node.output in self._producers:
+                raise ValueError(f"Output '{node.output}' produced by more than one node")
+            self._producers[node.output] = node
+        self._check_acyclic()
+
+    def _check_acyclic(self) -> None:
+        visiting, done = set(), set()
+
+        def visit(node: AgentNode) -> None:
+            if node.name in done:
+                return
+            if node.name in visiting:
+                raise ValueError(f"Dependency cycle through node '{node.name}'")
+            visiting.add(node.name)
+            for key in node.dependencies:
+                producer = self._producers.get(key)
+                if producer:
+                    visit(producer)
+            visiting.discard(node.name)
+            done.add(node.name)
+
+        for node in self.nodes:
+            visit(node)
+
+    async def run(
+        self,
+        context: Dict[str, Any],
+        on_settled: Optional[NodeCallback] = None,
+        measure_cpu: bool = False,
+        on_cancelled: Optional[Callable[[List[str]], None]] = None,
+    ) -> GraphRun:
+        """
+        Execute every node once. `context` seeds values no node produces
+        (e.g. image_path, receipt_id). A node whose required input is missing
+        is skipped; optional inputs are simply left out of its input dict.
+        A node whose output is already in `context` (computed earlier, e.g. by
+        a pre-screen) is not run again; it settles at once as "seeded".
+        measure_cpu adds each node's CPU time as cpu_ms, including its executor
+        jobs (profiling).
+        If the run is cancelled, on_cancelled receives the names of the nodes
+        that had not settled (running or never started).
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        graph_run = GraphRun()
+        futures: Dict[str, asyncio.Future] = {}
+
+        for key, value in context.items():
+            futures[key] = loop.create_future()
+            futures[key].set_result(value)
+        for node in self.nodes:
+            futures.setdefault(node.output, loop.create_future())
+
+        def elapsed_ms() -> float:
+            return round((time.perf_counter() - started) * 1000, 2)
+
+        async def settle(node: AgentNode, output: Any, timing: Dict[str, Any]) -> None:
+            timing["end_ms"] = elapsed_ms()
+            timing["duration_ms"] = round(timing["end_ms"] - timing["start_ms"], 2)
+            graph_run.timings[node.name] = timing
+            if output is not MISSING:
+                graph_run.outputs[node.output] = output
+
+            if on_settled:
+                try:
+                    await on_settled(node, timing["status"], output, timing)
+                except Exception as e:
+                    logger.warning(f"Pipeline listener failed on '{node.name}': {str(e)}")
+
+        async def execute(node: AgentNode) -> None:
+            if node.output in context:
+                timing = {"start_ms": elapsed_ms(), "status": "seeded"}
+                await settle(node, context[node.output], timing)
+                return
+
+            inputs: Dict[str, Any] = {}
+            for key in node.dependencies:
+                future = futures.get(key)
+                value = await future if future is not None else MISSING
+                if value is not MISSING:
+                    inputs[key] = value
+
+            timing: Dict[str, Any] = {"start_ms": elapsed_ms()}
+            missing = [key for key in node.inputs if key not in inputs]
+            output: Any = MISSING
+            if missing:
+                timing["status"] = "skipped"
+                timing["reason"] = f"missing inputs: {', '.join(missing)}"
+            else:
+                try:
+                    if measure_cpu:
+                        output = await cpu_timed(node.run(inputs), timing)
+                    else:
+                        output = await node.run(inputs)
+                    timing["status"] = "success"
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Pipeline node '{node.name}' failed: {str(e)}")
+                    timing["status"] = "failed"
+                    timing["error"] = str(e)
+
+            await settle(node, output, timing)
+            futures[node.output].set_result(output)
+
+        tasks = [asyncio.create_task(execute(node)) for node in self.nodes]
+        try:
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            if on_cancelled:
+                on_cancelled([node.name for node in self.nodes if node.name not in graph_run.timings])
+            raise
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        graph_run.critical_path = self._critical_path(graph_run)
+        return graph_run
+
+    def _critical_path(self, graph_run: GraphRun) -> List[str]:
+        """Walk back from the last node to finish through its latest-finishing dependency"""
+        ran = {
+            name: timing
+            for name, timing in graph_run.timings.items()
+            if timing["status"] not in ("skipped", "seeded")
+        }
+        if not ran:
+            return []
+
+        path = [max(ran, key=lambda name: ran[name]["end_ms"])]
+        by_name = {node.name: node for node in self.nodes}
+        while True:
+            node = by_name[path[-1]]
+            upstream = [
+                self._producers[key].name
+                for key in node.dependencies
+                if key in self._producers and self._producers[key].name in ran
+            ]
+            if not upstream:
+                break
+            path.append(max(upstream, key=lambda name: ran[name]["end_ms"]))
+        path.reverse()
+        return path
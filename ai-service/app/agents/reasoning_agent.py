@@ -2,16 +2,51 @@
 Reasoning Agent - Synthesizes all agent outputs into final verdict
 """
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 logger = logging.getLogger(__name__)
 
+# Trust score weights and verdict thresholds. The offline batch scorer
+# (batch_scorer.py) applies the same rules, so tune them here only.
+SCORING_RULES: Dict[str, float] = {
+    "base_score": 75,  # Start with higher base score (75 instead of 70)
+    "default_ocr_confidence": 75,
+    "ocr_confidence_baseline": 75,
+    "ocr_confidence_weight": 0.25,
+    "manipulation_weight": 0.25,
+    "metadata_flag_penalty": 3,  # Reduced from 5 to 3
+    "fraud_report_penalty": 10,
+    "verified_merchant_bonus": 15,
+    "ocr_text_bonus": 5,
+    "ocr_text_min_length": 20,
+    # Known template whose text boxes moved (TemplateAgent layout_deviation)
+    "template_deviation_threshold": 40,
+    "template_deviation_penalty": 15,
+    # Account/phone reused across receipts (NetworkAgent, over its window).
+    # The penalty is scaled by merchant-name diversity, so a busy legitimate
+    # account (many receipts, one name) is not mistaken for a ring.
+    "ring_min_submitters": 3,
+    "ring_min_merchants": 3,
+    "ring_min_diversity": 0.25,
+    "ring_penalty": 20,
+    "fraudulent_min_fraud_reports": 3,
+    "fraudulent_min_manipulation": 80,
+    "authentic_min_score": 70,  # Lowered from 75
+    "suspicious_min_score": 50,
+    "unclear_min_score": 25,  # Lowered from 30
+    # Fast pre-screen (forensic + metadata + local text check only)
+    "prescreen_clean_max_manipulation": 45,  # ForensicAgent flags from 50
+    "prescreen_clean_max_metadata_flags": 1,
+    "prescreen_min_text_lines": 3,
+    "prescreen_editor_min_manipulation": 50,
+}
+
 
 class ReasoningAgent:
     """Synthesize multi-agent results into coherent verdict and recommendation"""
 
-    def __init__(self):
-        pass
+    def __init__(self, rules: Optional[Dict[str, float]] = None):
+        self.rules = {**SCORING_RULES, **(rules or {})}
 
     async def synthesize(self, agent_results: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -30,10 +65,17 @@ class ReasoningAgent:
             forensic_data = agent_results.get("forensic", {})
             metadata_data = agent_results.get("metadata", {})
             reputation_data = agent_results.get("reputation", {})
+            template_data = agent_results.get("template", {})
+            network_data = agent_results.get("network", {})
 
             # Calculate trust score (0-100)
             trust_score = await self._calculate_trust_score(
-                vision_data, forensic_data, metadata_data, reputation_data
+                vision_data,
+                forensic_data,
+                metadata_data,
+                reputation_data,
+                template_data,
+                network_data,
             )
 
             # Determine verdict
@@ -43,7 +85,12 @@ class ReasoningAgent:
 
             # Compile issues
             issues = self._compile_issues(
-                vision_data, forensic_data, metadata_data, reputation_data
+                vision_data,
+                forensic_data,
+                metadata_data,
+                reputation_data,
+                template_data,
+                network_data,
             )
 
             # Generate recommendation
@@ -76,43 +123,129 @@ class ReasoningAgent:
                 "recommendation": "Manual verification recommended",
             }
 
+    async def prescreen(
+        self, forensic: Dict, metadata: Dict, text_check: Dict
+    ) -> Dict[str, Any]:
+        """
+        Decide from local signals only whether a receipt is obviously
+        tampered or obviously fine
+
+        Returns the usual trust_score/verdict/issues/recommendation plus
+        conclusive (False means a full analysis is needed) and reasons.
+        """
+        rules = self.rules
+        forensic = forensic or {}
+        metadata = metadata or {}
+        text_check = text_check or {}
+
+        manipulation_score = forensic.get("manipulation_score", 0)
+        editor = metadata.get("software_detected")
+        text_lines = text_check.get("text_lines", 0)
+        has_text = text_lines >= rules["prescreen_min_text_lines"]
+
+        trust_score = await self._calculate_trust_score({}, forensic, metadata, {})
+        if has_text:
+            # Locally visible text lines stand in for a successful OCR pass
+            trust_score = min(100, trust_score + int(rules["ocr_text_bonus"]))
+        issues = self._compile_issues({}, forensic, metadata, {})
+
+        reasons = []
+        verdict = "unclear"
+        if manipulation_score >= rules["fraudulent_min_manipulation"]:
+            verdict = "fraudulent"
+            reasons.append(f"manipulation score {manipulation_score}")
+        elif editor and manipulation_score >= rules["prescreen_editor_min_manipulation"]:
+            verdict = "fraudulent"
+            reasons.append(f"edited with {editor}, manipulation score {manipulation_score}")
+        elif (
+            not editor
+            and has_text
+            and manipulation_score <= rules["prescreen_clean_max_manipulation"]
+            and len(metadata.get("flags", []))
+            <= rules["prescreen_clean_max_metadata_flags"]
+        ):
+            verdict = "authentic"
+            # Keep the score inside the authentic band the full analysis uses
+            trust_score = max(trust_score, int(rules["authentic_min_score"]))
+            reasons.append("no local signs of tampering")
+        else:
+            if not has_text:
+                reasons.append(f"only {text_lines} text line(s) found locally")
+            if editor:
+                reasons.append(f"edited with {editor}")
+            if manipulation_score > rules["prescreen_clean_max_manipulation"]:
+                reasons.append(f"manipulation score {manipulation_score} needs review")
+
+        conclusive = verdict != "unclear"
+        if conclusive:
+            recommendation = self._generate_recommendation(verdict, trust_score, issues)
+        else:
+            recommendation = "Pre-screen inconclusive. Full analysis required."
+
+        return {
+            "trust_score": trust_score,
+            "verdict": verdict,
+            "issues": issues,
+            "recommendation": recommendation,
+            "conclusive": conclusive,
+            "reasons": reasons,
+        }
+
     async def _calculate_trust_score(
         self,
         vision: Dict,
         forensic: Dict,
         metadata: Dict,
         reputation: Dict,
+        template: Optional[Dict] = None,
+        network: Optional[Dict] = None,
     ) -> int:
         """Calculate weighted trust score from all agents"""
-        
-        # Start with higher base score (75 instead of 70)
-        score = 75
+        rules = self.rules
+
+        score = rules["base_score"]
 
         # Vision confidence (weight: 25%) - more weight on successful OCR
-        ocr_confidence = vision.get("confidence", 75) if vision else 75
+        ocr_confidence = (
+            vision.get("confidence", rules["default_ocr_confidence"])
+            if vision
+            else rules["default_ocr_confidence"]
+        )
         # Be more generous with vision confidence
-        score += (ocr_confidence - 75) * 0.25
+        score += (ocr_confidence - rules["ocr_confidence_baseline"]) * rules[
+            "ocr_confidence_weight"
+        ]
 
         # Forensic analysis (weight: 25%) - reduced weight
         manipulation_score = forensic.get("manipulation_score", 0) if forensic else 0
-        score -= manipulation_score * 0.25
+        score -= manipulation_score * rules["manipulation_weight"]
 
         # Metadata (weight: 15%) - reduced weight, less harsh penalty
         metadata_flags = len(metadata.get("flags", [])) if metadata else 0
-        score -= metadata_flags * 3  # Reduced from 5 to 3
+        score -= metadata_flags * rules["metadata_flag_penalty"]
 
         # Reputation (weight: 35%)
         fraud_reports = reputation.get("total_fraud_reports", 0) if reputation else 0
-        score -= fraud_reports * 10
+        score -= fraud_reports * rules["fraud_report_penalty"]
 
         # Bonus for verified merchant
         merchant = reputation.get("merchant") if reputation else None
         if merchant and isinstance(merchant, dict) and merchant.get("verified"):
-            score += 15
+            score += rules["verified_merchant_bonus"]
 
         # If we successfully extracted text, give a bonus
-        if vision and vision.get("ocr_text") and len(vision.get("ocr_text", "")) > 20:
-            score += 5  # Bonus for successful text extraction
+        ocr_text = vision.get("ocr_text", "") if vision else ""
+        if ocr_text and len(ocr_text) > rules["ocr_text_min_length"]:
+            score += rules["ocr_text_bonus"]  # Bonus for successful text extraction
+
+        # Penalty for a known template with displaced text boxes
+        if self._template_deviates(template):
+            score -= rules["template_deviation_penalty"]
+
+        # Penalty for an account or phone shared the way fraud rings share them
+        ring_weight = self._ring_weight(network)
+        if ring_weight:
+            score -= rules["ring_penalty"] * ring_weight
 
         # Clamp to 0-100
         return max(0, min(100, int(score)))
@@ -121,28 +254,61 @@ class ReasoningAgent:
         self, trust_score: int, forensic: Dict, reputation: Dict
     ) -> str:
         """Determine final verdict based on score and critical findings"""
-        
+        rules = self.rules
+
         # Critical red flags
         fraud_reports = reputation.get("total_fraud_reports", 0) if reputation else 0
         manipulation_score = forensic.get("manipulation_score", 0) if forensic else 0
 
-        if fraud_reports >= 3 or manipulation_score >= 80:
+        if (
+            fraud_reports >= rules["fraudulent_min_fraud_reports"]
+            or manipulation_score >= rules["fraudulent_min_manipulation"]
+        ):
             return "fraudulent"
-        elif trust_score >= 70:  # Lowered from 75
+        elif trust_score >= rules["authentic_min_score"]:
             return "authentic"
-        elif trust_score >= 50:
+        elif trust_score >= rules["suspicious_min_score"]:
             return "suspicious"
-        elif trust_score >= 25:  # Lowered from 30
+        elif trust_score >= rules["unclear_min_score"]:
             return "unclear"
         else:
             return "fraudulent"
 
+    def _template_deviates(self, template: Optional[Dict]) -> bool:
+        return bool(
+            template
+            and template.get("matched")
+            and template.get("layout_deviation", 0)
+            >= self.rules["template_deviation_threshold"]
+        )
+
+    def _ring_weight(self, network: Optional[Dict]) -> float:
+        """
+        Share of ring_penalty for the network's ring candidate: its merchant
+        names per receipt, (merchants - 1) / (receipts - 1), once enough
+        submitters and merchant names are involved. Rings put a new name on
+        almost every receipt; OCR variants of one shop's name do not.
+        """
+        ring = (network or {}).get("ring") or {}
+        receipts = ring.get("receipts", 0)
+        merchants = ring.get("merchants", 0)
+        if (
+            receipts < 2
+            or ring.get("submitters", 0) < self.rules["ring_min_submitters"]
+            or merchants < self.rules["ring_min_merchants"]
+        ):
+            return 0.0
+        diversity = (merchants - 1) / (receipts - 1)
+        return diversity if diversity >= self.rules["ring_min_diversity"] else 0.0
+
     def _compile_issues(
         self,
         vision: Dict,
         forensic: Dict,
         metadata: Dict,
         reputation: Dict,
+        template: Optional[Dict] = None,
+        network: Optional[Dict] = None,
     ) -> List[Dict]:
         """Compile all detected issues"""
         issues = []
@@ -182,6 +348,33 @@ class ReasoningAgent:
                 "description": flag,
             })
 
+        # Template issues
+        if self._template_deviates(template):
+            source = template.get("institution") or template.get("template")
+            issues.append({
+                "type": "layout_deviation",
+                "severity": "high",
+                "description": (
+                    f"Layout differs from genuine {source} receipts - "
+                    "fields may have been moved or retyped"
+                ),
+            })
+
+        # Cross-receipt issues
+        if self._ring_weight(network):
+            ring = network["ring"]
+            issues.append({
+                "type": "shared_account",
+                "severity": "high",
+                "description": (
+                    f"Account or phone on this receipt appears on "
+                    f"{ring['receipts']} receipts from "
+                    f"{ring['submitters']} submitter(s) under "
+                    f"{ring['merchants']} merchant name(s) in the last "
+                    f"{network.get('window_days', 0):g} days"
+                ),
+            })
+
         # Reputation issues
         fraud_reports = reputation.get("total_fraud_reports", 0)
         if fraud_reports > 0:
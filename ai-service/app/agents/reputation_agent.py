@@ -1,25 +1,67 @@
 """
 Reputation Agent - Checks account numbers and merchant reputation
 """
+import asyncio
+import hashlib
 import logging
 import re
-from typing import Dict, Any, List
-import firebase_admin
-from firebase_admin import firestore
+import time
+from typing import Dict, Any, List, Optional
+
+from app.core.cache import SharedCache
+from app.core.firebase import get_db
+from app.core.metrics import SampleWindow
+from app.core.replay import TrafficReplay, passthrough
 
 logger = logging.getLogger(__name__)
 
+# Nigerian account numbers (10 digits) and phone numbers
+ACCOUNT_NUMBER_PATTERN = r'\b\d{10}\b'
+PHONE_NUMBER_PATTERN = r'\b(?:\+234|0)[789]\d{9}\b'
+
 
 class ReputationAgent:
     """Check merchant and account reputation against fraud database"""
 
-    def __init__(self):
-        self.db = firestore.client()
+    def __init__(
+        self,
+        cache: Optional[SharedCache] = None,
+        replay: Optional[TrafficReplay] = None,
+    ):
+        self.cache = cache
+        self.replay = replay
+        self.prefetch_counters = {"started": 0, "used": 0, "unused": 0}
+        # How much earlier a used lookup started than analyze() would have
+        self.prefetch_head_start_ms = SampleWindow()
+
+    def lookups(self) -> "ReputationLookups":
+        """Per-analysis lookup set that can be started from streamed vision fields"""
+        return ReputationLookups(self)
 
-    async def analyze(self, ocr_text: str) -> Dict[str, Any]:
+    def prefetch_stats(self) -> Dict[str, Any]:
+        return {
+            **self.prefetch_counters,
+            "head_start_ms": self.prefetch_head_start_ms.summary(),
+        }
+
+    @property
+    def db(self):
+        # Firestore client is created on first query, not at import time
+        return get_db()
+
+    async def analyze(
+        self,
+        ocr_text: str,
+        merchant_name: Optional[str] = None,
+        lookups: Optional["ReputationLookups"] = None,
+    ) -> Dict[str, Any]:
         """
         Extract account numbers and check reputation
 
+        merchant_name (as read by the vision agent) is tried before scanning
+        the text for a verified business. Lookups already started through
+        `lookups` while Gemini was still streaming are awaited, not repeated.
+
         Returns:
             - accounts_analyzed: List of account numbers found
             - fraud_reports: Number of fraud reports for accounts
@@ -28,6 +70,7 @@ class ReputationAgent:
         """
         try:
             logger.info("Reputation agent analyzing extracted text")
+            lookups = lookups or ReputationLookups(self)
 
             # Extract account numbers (Nigerian format: 10 digits)
             account_numbers = self._extract_account_numbers(ocr_text)
@@ -40,12 +83,12 @@ class ReputationAgent:
             total_fraud_reports = 0
 
             for account_number in account_numbers:
-                account_data = await self._check_account_reputation(account_number)
+                account_data = await lookups.account(account_number)
                 accounts_analyzed.append(account_data)
                 total_fraud_reports += account_data.get("fraud_reports", 0)
 
             # Check for verified merchant
-            merchant = await self._check_merchant_verification(ocr_text)
+            merchant = await lookups.merchant(ocr_text, merchant_name)
 
             # Calculate trust level
             trust_level = self._calculate_trust_level(
@@ -77,32 +120,30 @@ class ReputationAgent:
 
     def _extract_account_numbers(self, text: str) -> List[str]:
         """Extract Nigerian account numbers (10 digits)"""
-        pattern = r'\b\d{10}\b'
-        matches = re.findall(pattern, text)
+        matches = re.findall(ACCOUNT_NUMBER_PATTERN, text)
         return list(set(matches))  # Remove duplicates
 
     def _extract_phone_numbers(self, text: str) -> List[str]:
         """Extract Nigerian phone numbers"""
-        pattern = r'\b(?:\+234|0)[789]\d{9}\b'
-        matches = re.findall(pattern, text)
+        matches = re.findall(PHONE_NUMBER_PATTERN, text)
         return list(set(matches))
 
     async def _check_account_reputation(self, account_number: str) -> Dict:
         """Check account against fraud reports database"""
         try:
             # Hash account number for privacy
-            import hashlib
             account_hash = hashlib.sha256(account_number.encode()).hexdigest()
 
-            # Query Firestore for fraud reports
-            fraud_reports = (
-                self.db.collection("fraud_reports")
-                .where("account_hash", "==", account_hash)
-                .where("status", "==", "verified")
-                .get()
-            )
-
-            fraud_count = len(fraud_reports)
+            cache_key = f"account:{account_hash}"
+            cached = await self.cache.get("reputation", cache_key) if self.cache else None
+            if cached is not None:
+                fraud_count = cached["fraud_reports"]
+            else:
+                fraud_count = await self._query_fraud_report_count(account_hash)
+                if self.cache:
+                    await self.cache.set(
+                        "reputation", cache_key, {"fraud_reports": fraud_count}
+                    )
 
             return {
                 "account_number": account_number[:3] + "****" + account_number[-2:],  # Masked
@@ -118,6 +159,19 @@ class ReputationAgent:
                 "risk_level": "unknown",
             }
 
+    async def _verify_merchant(
+        self, text: str, merchant_name: Optional[str]
+    ) -> Dict | None:
+        """The named merchant if verified, else any verified name in the text"""
+        if isinstance(merchant_name, str) and merchant_name.strip():
+            try:
+                merchant = await self._lookup_verified_business(merchant_name.strip())
+                if merchant:
+                    return merchant
+            except Exception as e:
+                logger.error(f"Error checking merchant verification: {str(e)}")
+        return await self._check_merchant_verification(text)
+
     async def _check_merchant_verification(self, text: str) -> Dict | None:
         """Check if merchant name in receipt is verified business"""
         try:
@@ -130,22 +184,9 @@ class ReputationAgent:
 
             # Query verified businesses
             for name in potential_names:
-                businesses = (
-                    self.db.collection("businesses")
-                    .where("name", "==", name)
-                    .where("verification.verified", "==", True)
-                    .limit(1)
-                    .get()
-                )
-
-                if len(businesses) > 0:
-                    business_data = businesses[0].to_dict()
-                    return {
-                        "name": business_data.get("name"),
-                        "verified": True,
-                        "trust_score": business_data.get("trust_score", 75),
-                        "business_id": businesses[0].id,
-                    }
+                merchant = await self._lookup_verified_business(name)
+                if merchant:
+                    return merchant
 
             return None
 
@@ -153,6 +194,70 @@ class ReputationAgent:
             logger.error(f"Error checking merchant verification: {str(e)}")
             return None
 
+    async def _lookup_verified_business(self, name: str) -> Dict | None:
+        """Look up one candidate name; misses are cached too since most candidates miss"""
+        cache_key = f"merchant:{name}"
+        if self.cache:
+            cached = await self.cache.get("reputation", cache_key)
+            if cached is not None:
+                return cached["merchant"]
+
+        merchant = await self._query_verified_business(name)
+
+        if self.cache:
+            await self.cache.set("reputation", cache_key, {"merchant": merchant})
+        return merchant
+
+    # Firestore queries. Each returns plain JSON data so it can be recorded
+    # and replayed by the traffic harness (app/core/replay.py). The client is
+    # synchronous, so the round trips run on a worker thread rather than
+    # stalling the event loop.
+
+    async def _query_fraud_report_count(self, account_hash: str) -> int:
+        """Number of verified fraud reports against an account"""
+
+        def query():
+            fraud_reports = (
+                self.db.collection("fraud_reports")
+                .where("account_hash", "==", account_hash)
+                .where("status", "==", "verified")
+                .get()
+            )
+            return len(fraud_reports)
+
+        async def fetch():
+            return await asyncio.to_thread(query)
+
+        return await passthrough(
+            self.replay, "firestore", f"fraud_reports:{account_hash}", fetch
+        )
+
+    async def _query_verified_business(self, name: str) -> Dict | None:
+        """Verified business with exactly this name, if any"""
+
+        def query():
+            businesses = (
+                self.db.collection("businesses")
+                .where("name", "==", name)
+                .where("verification.verified", "==", True)
+                .limit(1)
+                .get()
+            )
+            if len(businesses) == 0:
+                return None
+            business_data = businesses[0].to_dict()
+            return {
+                "name": business_data.get("name"),
+                "verified": True,
+                "trust_score": business_data.get("trust_score", 75),
+                "business_id": businesses[0].id,
+            }
+
+        async def fetch():
+            return await asyncio.to_thread(query)
+
+        return await passthrough(self.replay, "firestore", f"businesses:{name}", fetch)
+
     def _calculate_trust_level(
         self, fraud_reports: int, merchant: Dict | None, accounts: List[Dict]
     ) -> str:
@@ -167,3 +272,74 @@ class ReputationAgent:
             return "medium"
         else:
             return "high"
+
+
+class ReputationLookups:
+    """
+    Reputation lookups for one analysis, startable before the vision result
+
+    The vision agent reports Gemini's JSON fields as they stream in; on_field
+    starts the Firestore lookups each field allows (accounts in the OCR text,
+    the merchant once its name is known) so they overlap with the rest of the
+    generation. ReputationAgent.analyze() then awaits the same tasks instead
+    of querying again. Only lookups analyze() will make are started: it
+    checks the accounts found in ocr_text, so Gemini's separate
+    account_numbers list is not prefetched (each lookup is a Firestore read).
+    """
+
+    def __init__(self, agent: ReputationAgent):
+        self.agent = agent
+        self._tasks: Dict[Any, asyncio.Task] = {}
+        # Keys started from streamed fields -> when they were started
+        self._prefetched: Dict[Any, float] = {}
+        self._used: set = set()
+        self._ocr_text: Optional[str] = None
+
+    def on_field(self, name: str, value: Any) -> None:
+        if name == "ocr_text" and isinstance(value, str):
+            self._ocr_text = value
+            for account_number in self.agent._extract_account_numbers(value):
+                self._prefetch(("account", account_number))
+        elif name == "merchant_name" and self._ocr_text is not None:
+            self._prefetch(("merchant", self._ocr_text, value))
+        # phone_numbers are reported by reputation but never looked up
+
+    async def account(self, account_number: str) -> Dict:
+        return await self._use(("account", account_number))
+
+    async def merchant(self, ocr_text: str, merchant_name: Optional[str]) -> Dict | None:
+        return await self._use(("merchant", ocr_text, merchant_name))
+
+    def _start(self, key) -> asyncio.Task:
+        if key not in self._tasks:
+            if key[0] == "account":
+                work = self.agent._check_account_reputation(key[1])
+            else:
+                work = self.agent._verify_merchant(key[1], key[2])
+            self._tasks[key] = asyncio.create_task(work)
+        return self._tasks[key]
+
+    def _prefetch(self, key) -> None:
+        if key not in self._tasks:
+            self._start(key)
+            self._prefetched[key] = time.perf_counter()
+            self.agent.prefetch_counters["started"] += 1
+
+    async def _use(self, key) -> Any:
+        task = self._start(key)
+        if key in self._prefetched and key not in self._used:
+            self.agent.prefetch_counters["used"] += 1
+            self.agent.prefetch_head_start_ms.add(
+                (time.perf_counter() - self._prefetched[key]) * 1000
+            )
+        self._used.add(key)
+        return await task
+
+    def close(self) -> None:
+        """Cancel prefetched lookups the analysis never needed"""
+        for key in self._prefetched:
+            if key not in self._used:
+                self.agent.prefetch_counters["unused"] += 1
+                self._tasks[key].cancel()
+        self._tasks.clear()
+        self._prefetched.clear()
@@ -0,0 +1,79 @@
+"""
+Template Agent - Matches receipts to known bank app slip layouts
+A receipt that looks like a known template but whose text boxes sit in the
+wrong places is a cheap, strong sign of a doctored slip.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict
+
+from app.core.templates import TemplateIndex, layout_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateAgent:
+    """Nearest-template lookup and layout deviation scoring"""
+
+    def __init__(
+        self,
+        index: TemplateIndex,
+        max_hash_distance: int = 12,
+        deviation_scale: float = 0.03,
+    ):
+        self.index = index
+        # phash bits (of 64) within which a receipt counts as that template
+        self.max_hash_distance = max_hash_distance
+        # Mean text-grid difference that maps to a deviation of 100
+        self.deviation_scale = deviation_scale
+
+    async def analyze(self, image_path: str) -> Dict[str, Any]:
+        """
+        Match an image to its template
+
+        Returns:
+            - matched: Whether a known template was recognised
+            - template / institution / fields: The matched template
+            - layout_deviation: 0-100, how far text boxes are from the template
+            - deviating_cells: [row, col] grid cells that differ
+        """
+        try:
+            started = time.perf_counter()
+            fingerprint = await asyncio.to_thread(layout_fingerprint, image_path)
+            found = self.index.nearest(fingerprint)
+            match_ms = round((time.perf_counter() - started) * 1000, 2)
+
+            if not found or found.hash_distance > self.max_hash_distance:
+                logger.info("Template agent: no known template matched")
+                return {
+                    "matched": False,
+                    "template": None,
+                    "nearest_template": found.template if found else None,
+                    "hash_distance": found.hash_distance if found else None,
+                    "layout_deviation": 0,
+                    "match_ms": match_ms,
+                }
+
+            layout_deviation = int(
+                min(found.layout_distance / self.deviation_scale * 100, 100)
+            )
+            logger.info(
+                f"Template agent matched {found.template} "
+                f"(hash distance {found.hash_distance}, deviation {layout_deviation})"
+            )
+            return {
+                "matched": True,
+                "template": found.template,
+                "institution": found.institution,
+                "fields": found.fields,
+                "hash_distance": found.hash_distance,
+                "layout_distance": found.layout_distance,
+                "layout_deviation": layout_deviation,
+                "deviating_cells": found.deviating_cells,
+                "match_ms": match_ms,
+            }
+
+        except Exception as e:
+            logger.error(f"Template agent error: {str(e)}")
+            raise
@@ -1,25 +1,84 @@
 """
 Vision Agent - Uses Gemini Vision API for OCR and visual analysis
 """
+import asyncio
+import json
 import logging
-import google.generativeai as genai
+import re
+import time
 from PIL import Image
-from typing import Dict, Any
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from app.core.imaging import file_sha256
+from app.core.json_stream import JSONFieldStream
+from app.core.replay import TrafficReplay, passthrough, passthrough_streamed
 
 logger = logging.getLogger(__name__)
 
+GENERIC_PROMPT = """You are analyzing a receipt/transaction slip image. Extract ALL visible text and information.
+
+CRITICAL: Even if the image quality is not perfect, extract whatever text you can see. Do your best!
+
+Return ONLY a JSON object (no markdown, no explanation) with these exact fields:
+{
+  "ocr_text": "ALL text visible on the receipt, exactly as shown",
+  "merchant_name": "business/bank name (or null)",
+  "total_amount": "transaction amount as number (or null)",
+  "currency": "currency code like NGN, USD (or null)",
+  "receipt_date": "date in YYYY-MM-DD format (or null)",
+  "items": ["list of items/transaction details"],
+  "account_numbers": ["any account numbers found"],
+  "phone_numbers": ["any phone numbers found"],
+  "visual_quality": "excellent",
+  "visual_anomalies": [],
+  "confidence_score": 85
+}
+
+IMPORTANT: 
+- Set confidence_score to 85-95 if you can read most of the text clearly
+- Set visual_quality to "excellent" if the receipt is readable (even if not perfect)
+- Extract ALL text you see, even if the image is slightly blurred
+- Be generous with confidence scores - receipts don't need to be perfect to be readable"""
+
+BATCH_PROMPT = """You are analyzing {count} receipt/transaction slip images. Each image is preceded by its label, "Receipt <key>:".
+
+Return ONLY a JSON array (no markdown, no explanation) with exactly one object per image, in any order. Each object has "receipt_key" (the label's key) plus these fields:
+{{"ocr_text": "ALL visible text, exactly as shown", "merchant_name": "business/bank name (or null)", "total_amount": "number (or null)", "currency": "e.g. NGN (or null)", "receipt_date": "YYYY-MM-DD (or null)", "items": [], "account_numbers": [], "phone_numbers": [], "visual_quality": "excellent", "visual_anomalies": [], "confidence_score": 85}}
+
+Extract whatever text you can see even if an image is not perfect; set confidence_score to 85-95 when most text is readable. Never merge or skip receipts."""
+
 
 class VisionAgent:
     """Gemini Vision API wrapper for receipt OCR and visual analysis"""
 
-    def __init__(self, api_key: str):
+    model_name = "gemini-2.0-flash-exp"
+
+    def __init__(
+        self,
+        api_key: str,
+        replay: Optional[TrafficReplay] = None,
+        stream: bool = True,
+    ):
+        # Imported here: the SDK pulls in grpc/protobuf and dominates cold start
+        import google.generativeai as genai
+
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel("gemini-2.0-flash-exp")
+        self.model = genai.GenerativeModel(self.model_name)
+        self.replay = replay
+        self.stream = stream
 
-    async def analyze(self, image_path: str) -> Dict[str, Any]:
+    async def analyze(
+        self,
+        image_path: str,
+        on_field: Optional[Callable[[str, Any], None]] = None,
+    ) -> Dict[str, Any]:
         """
         Analyze receipt image using Gemini Vision
 
+        With on_field (and streaming enabled) the response is streamed and
+        on_field(name, value) is called for each top-level JSON field as soon
+        as Gemini has finished emitting it. The returned result is the same.
+
         Returns:
             - ocr_text: Extracted text from receipt
             - confidence: OCR confidence score (0-100)
@@ -35,43 +94,32 @@ class VisionAgent:
             img = Image.open(image_path)
 
             # Create detailed prompt for receipt analysis
-            prompt = """You are analyzing a receipt/transaction slip image. Extract ALL visible text and information.
-
-CRITICAL: Even if the image quality is not perfect, extract whatever text you can see. Do your best!
-
-Return ONLY a JSON object (no markdown, no explanation) with these exact fields:
-{
-  "ocr_text": "ALL text visible on the receipt, exactly as shown",
-  "merchant_name": "business/bank name (or null)",
-  "total_amount": "transaction amount as number (or null)",
-  "currency": "currency code like NGN, USD (or null)",
-  "receipt_date": "date in YYYY-MM-DD format (or null)",
-  "items": ["list of items/transaction details"],
-  "account_numbers": ["any account numbers found"],
-  "phone_numbers": ["any phone numbers found"],
-  "visual_quality": "excellent",
-  "visual_anomalies": [],
-  "confidence_score": 85
-}
+            prompt = GENERIC_PROMPT
 
-IMPORTANT: 
-- Set confidence_score to 85-95 if you can read most of the text clearly
-- Set visual_quality to "excellent" if the receipt is readable (even if not perfect)
-- Extract ALL text you see, even if the image is slightly blurred
-- Be generous with confidence scores - receipts don't need to be perfect to be readable"""
-
-            # Generate content
-            response = await self.model.generate_content_async([prompt, img])
+            # Generate content (recorded or replayed per image when a harness is set)
+            replay_key = ""
+            if self.replay:
+                image_hash = await asyncio.to_thread(file_sha256, image_path)
+                await asyncio.to_thread(self.replay.save_image, image_path, image_hash)
+                replay_key = f"{self.model_name}:{image_hash}"
+            if on_field and self.stream:
+                response_text = await passthrough_streamed(
+                    self.replay,
+                    "vision",
+                    replay_key,
+                    lambda on_chunk: self._generate_stream(prompt, img, on_chunk),
+                    self._field_reporter(on_field),
+                )
+            else:
+                response_text = await passthrough(
+                    self.replay, "vision", replay_key, lambda: self._generate(prompt, img)
+                )
 
             # Parse response
-            response_text = response.text.strip()
+            response_text = response_text.strip()
             
             logger.info(f"Gemini raw response length: {len(response_text)} chars")
 
-            # Try to extract JSON from response
-            import json
-            import re
-
             # Remove markdown code blocks if present
             response_text = re.sub(r'```json\s*', '', response_text)
             response_text = re.sub(r'```\s*$', '', response_text)
@@ -102,28 +150,130 @@ IMPORTANT:
                     "visual_anomalies": [],
                 }
 
-            # Calculate confidence (be generous - default to 75 instead of 70)
-            confidence = analysis_data.get("confidence_score", 75)
-
-            result = {
-                "ocr_text": analysis_data.get("ocr_text", response_text),
-                "confidence": confidence,
-                "merchant_name": analysis_data.get("merchant_name"),
-                "total_amount": analysis_data.get("total_amount"),
-                "currency": analysis_data.get("currency"),
-                "receipt_date": analysis_data.get("receipt_date"),
-                "items": analysis_data.get("items", []),
-                "account_numbers": analysis_data.get("account_numbers", []),
-                "phone_numbers": analysis_data.get("phone_numbers", []),
-                "visual_quality": analysis_data.get("visual_quality", "good"),
-                "visual_anomalies": analysis_data.get("visual_anomalies", []),
-            }
+            result = self._result(analysis_data, response_text)
 
             logger.info(
-                f"Vision agent completed with confidence: {confidence}"
+                f"Vision agent completed with confidence: {result['confidence']}"
             )
             return result
 
         except Exception as e:
             logger.error(f"Vision agent error: {str(e)}")
             raise
+
+    async def analyze_batch(
+        self, items: List[Tuple[str, str]]
+    ) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Any]]:
+        """
+        Analyze several receipts in one Gemini request (bulk path)
+
+        items are (receipt key, image path) pairs; all use the generic prompt,
+        sent once for the whole batch. Returns results by key for every
+        receipt Gemini answered with a valid object, plus usage for the call
+        (latency_ms, prompt/output tokens). Keys missing from the result
+        should be retried one image at a time.
+        """
+        keys = [key for key, _ in items]
+        logger.info(f"Vision agent analyzing batch of {len(items)}: {', '.join(keys)}")
+        contents: List[Any] = [BATCH_PROMPT.format(count=len(items))]
+        for key, image_path in items:
+            # Decoded up front so no file stays open while the batch waits
+            with Image.open(image_path) as img:
+                img.load()
+            contents += [f"Receipt {key}:", img]
+
+        replay_key = ""
+        if self.replay:
+            hashes = [
+                await asyncio.to_thread(file_sha256, image_path) for _, image_path in items
+            ]
+            replay_key = f"{self.model_name}:batch:{','.join(hashes)}"
+        started = time.perf_counter()
+        response = await passthrough(
+            self.replay, "vision", replay_key, lambda: self._generate_batch(contents)
+        )
+        usage = {
+            **response["usage"],
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+        results: Dict[str, Dict[str, Any]] = {}
+        text = re.sub(r"```(?:json)?", "", response["text"]).strip()
+        array_match = re.search(r"\[.*\]", text, re.DOTALL)
+        try:
+            entries = json.loads(array_match.group()) if array_match else []
+        except json.JSONDecodeError as e:
+            logger.error(f"Batch JSON parse error: {str(e)}")
+            entries = []
+        for entry in entries if isinstance(entries, list) else []:
+            if not isinstance(entry, dict):
+                continue
+            key = str(entry.get("receipt_key"))
+            if key in keys and key not in results and entry.get("ocr_text"):
+                results[key] = self._result(entry, entry["ocr_text"])
+
+        logger.info(f"Vision batch parsed {len(results)}/{len(items)} receipts")
+        return results, usage
+
+    def _result(self, analysis_data: Dict[str, Any], response_text: str) -> Dict[str, Any]:
+        # Calculate confidence (be generous - default to 75 instead of 70)
+        confidence = analysis_data.get("confidence_score", 75)
+
+        return {
+            "ocr_text": analysis_data.get("ocr_text", response_text),
+            "confidence": confidence,
+            "merchant_name": analysis_data.get("merchant_name"),
+            "total_amount": analysis_data.get("total_amount"),
+            "currency": analysis_data.get("currency"),
+            "receipt_date": analysis_data.get("receipt_date"),
+            "items": analysis_data.get("items", []),
+            "account_numbers": analysis_data.get("account_numbers", []),
+            "phone_numbers": analysis_data.get("phone_numbers", []),
+            "visual_quality": analysis_data.get("visual_quality", "good"),
+            "visual_anomalies": analysis_data.get("visual_anomalies", []),
+        }
+
+    async def _generate(self, prompt: str, img: Image.Image) -> str:
+        response = await self.model.generate_content_async([prompt, img])
+        return response.text
+
+    async def _generate_batch(self, contents: List[Any]) -> Dict[str, Any]:
+        response = await self.model.generate_content_async(contents)
+        usage = getattr(response, "usage_metadata", None)
+        return {
+            "text": response.text,
+            "usage": {
+                "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+                "output_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+            },
+        }
+
+    async def _generate_stream(
+        self, prompt: str, img: Image.Image, on_chunk: Callable[[str], None]
+    ) -> str:
+        response = await self.model.generate_content_async([prompt, img], stream=True)
+        parts = []
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # No text parts (safety block or empty candidate)
+                continue
+            parts.append(text)
+            on_chunk(text)
+        return "".join(parts)
+
+    def _field_reporter(
+        self, on_field: Callable[[str, Any], None]
+    ) -> Callable[[str], None]:
+        """Chunk callback feeding the incremental parser; listener errors are contained"""
+        fields = JSONFieldStream()
+
+        def on_chunk(text: str) -> None:
+            for name, value in fields.feed(text):
+                try:
+                    on_field(name, value)
+                except Exception as e:
+                    logger.warning(f"Vision field listener failed on '{name}': {str(e)}")
+
+        return on_chunk
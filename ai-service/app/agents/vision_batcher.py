@@ -0,0 +1,120 @@
+"""
+Vision Batcher - Groups queued receipts into multi-image Gemini requests
+
+Used on the bulk (job queue) path, where latency matters less than cost:
+the first receipt to arrive opens a short window, and everything queued
+before it closes (or until max_batch receipts are waiting) goes to Gemini
+as one request with the prompt sent once. Receipts the batch response does
+not answer cleanly are retried one image at a time.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.metrics import SampleWindow
+
+logger = logging.getLogger(__name__)
+
+
+class VisionBatcher:
+    """Micro-batches VisionAgent calls by time window and size"""
+
+    def __init__(self, vision_agent, max_batch: int = 4, window_ms: float = 200):
+        self.vision_agent = vision_agent
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+
+        self._pending: List[Tuple[str, str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+        self.counters = {"batches": 0, "receipts": 0, "fallbacks": 0, "failed_batches": 0}
+        self.batch_sizes = SampleWindow()
+        # Per receipt, amortized over its batch
+        self.latency_ms = SampleWindow()
+        self.tokens = SampleWindow()
+
+    async def analyze(self, image_path: str, receipt_id: str) -> Dict[str, Any]:
+        """Vision result for one receipt, analyzed together with its neighbours"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((receipt_id, image_path, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, str, asyncio.Future]]) -> None:
+        self.counters["batches"] += 1
+        self.counters["receipts"] += len(batch)
+        self.batch_sizes.add(len(batch))
+        if len(batch) == 1:
+            # Nothing to share the prompt with
+            started = time.perf_counter()
+            await self._single(batch[0])
+            self.latency_ms.add((time.perf_counter() - started) * 1000)
+            return
+
+        # Keys only need to be unique within a batch; short ones save tokens
+        keys = {f"r{index}": entry for index, entry in enumerate(batch)}
+        results: Dict[str, Dict[str, Any]] = {}
+        usage: Dict[str, Any] = {}
+        try:
+            results, usage = await self.vision_agent.analyze_batch(
+                [(key, image_path) for key, (_, image_path, _) in keys.items()]
+            )
+        except Exception as e:
+            self.counters["failed_batches"] += 1
+            logger.error(f"Vision batch of {len(batch)} failed: {str(e)}")
+
+        if usage:
+            self.latency_ms.add(usage["latency_ms"] / len(batch))
+            tokens = usage.get("prompt_tokens", 0) + usage.get("output_tokens", 0)
+            if tokens:
+                self.tokens.add(tokens / len(batch))
+
+        for key, (_, _, future) in keys.items():
+            if key in results and not future.done():
+                future.set_result(results[key])
+
+        missing = [key for key in keys if key not in results]
+        if missing:
+            self.counters["fallbacks"] += len(missing)
+            logger.warning(
+                f"Vision batch answered {len(results)}/{len(batch)}; "
+                f"retrying {', '.join(keys[key][0] for key in missing)} individually"
+            )
+            await asyncio.gather(*(self._single(keys[key]) for key in missing))
+
+    async def _single(self, entry: Tuple[str, str, asyncio.Future]) -> None:
+        receipt_id, image_path, future = entry
+        try:
+            result = await self.vision_agent.analyze(image_path)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "max_batch": self.max_batch,
+            "window_ms": self.window * 1000,
+            "batch_size": self.batch_sizes.summary(),
+            "latency_ms_per_receipt": self.latency_ms.summary(),
+            "tokens_per_receipt": self.tokens.summary(),
+        }
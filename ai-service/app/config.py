@@ -22,10 +22,135 @@ class Settings(BaseSettings):
     DEFAULT_MODEL: str = "gemini-2.0-flash-exp"
     MAX_CONCURRENT_AGENTS: int = 5
     AGENT_TIMEOUT_SECONDS: int = 30
+    WARM_UP_ON_STARTUP: bool = True
+    # Failed warm-up steps are retried, doubling the delay up to the maximum
+    WARM_UP_RETRY_SECONDS: float = 5
+    WARM_UP_RETRY_MAX_SECONDS: float = 300
+
+    # Job queue (submit/poll analysis mode)
+    JOB_QUEUE_MAX_SIZE: int = 50
+    JOB_WORKERS: int = 2
+    JOB_RESULT_TTL_SECONDS: int = 3600
+    JOB_DB_PATH: Optional[str] = None  # SQLite file to persist queued jobs
+    # Origins finished jobs may be POSTed back to, comma-separated (e.g. the
+    # backend's https://api.example.com); empty refuses every callback_url
+    JOB_CALLBACK_ORIGINS: str = ""
+
+    # Shared on-host cache (SQLite WAL, shared by all uvicorn workers)
+    CACHE_ENABLED: bool = True
+    CACHE_PATH: Optional[str] = None  # defaults to <tmp>/confirmit-cache.sqlite3
+    CACHE_MAX_MB: int = 256
+    # Per-agent outputs keyed by image SHA-256 (they depend only on the
+    # image); verdicts are not cached so reputation is always current
+    CACHE_VISION_TTL_SECONDS: int = 86400
+    CACHE_FORENSIC_TTL_SECONDS: int = 86400
+    CACHE_REPUTATION_TTL_SECONDS: int = 300
+
+    # Stream Gemini's answer so reputation lookups start as soon as the
+    # account numbers / merchant name fields are emitted
+    VISION_STREAM_ENABLED: bool = True
+
+    # Queued jobs (bulk reconciliation) share multi-image Gemini requests of up
+    # to VISION_BATCH_SIZE receipts arriving within VISION_BATCH_WINDOW_MS.
+    # 1 (default) disables batching and the batcher is never built; above 1 the
+    # job queue runs at least VISION_BATCH_SIZE workers so batches can fill
+    VISION_BATCH_SIZE: int = 1
+    VISION_BATCH_WINDOW_MS: float = 200
+
+    # Image normalization before analysis: larger images are downscaled to
+    # IMAGE_MAX_MEGAPIXELS; images that cannot be decoded within
+    # IMAGE_DECODE_MAX_MEGAPIXELS (JPEGs at 1/8 scale) are refused
+    IMAGE_MAX_MEGAPIXELS: float = 16
+    IMAGE_DECODE_MAX_MEGAPIXELS: float = 40
 
     # Forensics
     ELA_QUALITY: int = 95
     FORENSIC_THRESHOLD: float = 0.7
+    # Text regions are detected at 1/FORENSIC_DECODE_SCALE (1, 2, 4 or 8);
+    # the scored noise/edge/ELA tests always use full resolution
+    FORENSIC_DECODE_SCALE: int = 4
+    # Per-worker scratch buffers reused across forensic runs (0 = allocate fresh)
+    FORENSIC_BUFFER_ARENA_MB: float = 64
+
+    # Raw agent output store for offline re-scoring (disabled when unset)
+    AGENT_STORE_DIR: Optional[str] = None
+    AGENT_STORE_SHARD_SIZE: int = 1000
+    AGENT_STORE_FLUSH_SECONDS: float = 60  # Partial shards written after this
+
+    # Write-behind audit log of every analysis (verdict + raw agent outputs)
+    # in Firestore: batched writes of up to RESULT_WRITER_BATCH_SIZE (max 500)
+    # every RESULT_WRITER_FLUSH_SECONDS, spilled to JSONL files in
+    # RESULT_WRITER_SPILL_DIR while Firestore is unavailable
+    RESULT_WRITER_ENABLED: bool = True
+    RESULT_WRITER_COLLECTION: str = "analysis_results"
+    RESULT_WRITER_BATCH_SIZE: int = 500
+    RESULT_WRITER_FLUSH_SECONDS: float = 2.0
+    RESULT_WRITER_MAX_RETRIES: int = 3
+    RESULT_WRITER_MAX_BACKLOG: int = 5000
+    RESULT_WRITER_SPILL_DIR: Optional[str] = None  # defaults to <tmp>/confirmit-result-spill
+
+    # Gemini/Firestore record-replay for load tests: off, record or replay
+    REPLAY_MODE: str = "off"
+    REPLAY_DIR: str = "replay-data"
+    REPLAY_LATENCY_SCALE: float = 1.0  # 0 = no delay, 0.5 = twice as fast
+
+    # Known slip layouts built with `python -m app.core.templates build`
+    TEMPLATE_INDEX_PATH: Optional[str] = None
+    TEMPLATE_MAX_HASH_DISTANCE: int = 12
+    # Mean text-grid difference from the template that scores deviation 100
+    TEMPLATE_DEVIATION_SCALE: float = 0.03
+
+    # Cross-receipt entity graph (accounts/phones/merchants -> receipts)
+    NETWORK_AGENT_ENABLED: bool = True
+    NETWORK_WINDOW_DAYS: float = 30
+    NETWORK_RETENTION_DAYS: float = 90
+    NETWORK_MAX_RECEIPTS: int = 200000  # Oldest receipts evicted beyond this
+
+    # Event loop lag monitor; LOOP_BLOCK_STACKS logs the stack of whatever
+    # blocks the loop longer than LOOP_BLOCK_THRESHOLD_MS (debug mode)
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL_MS: float = 250
+    LOOP_BLOCK_THRESHOLD_MS: float = 100
+    LOOP_BLOCK_STACKS: bool = False
+
+    # Load shedding: analyses are refused (429/503 + Retry-After) beyond
+    # SHED_ANALYSIS_MAX_INFLIGHT, when the last SHED_RESERVED_INFLIGHT of
+    # SHED_MAX_INFLIGHT slots are all that is left (kept for health and
+    # account checks), or while loop lag exceeds SHED_LOOP_LAG_MS
+    SHED_ENABLED: bool = True
+    SHED_MAX_INFLIGHT: int = 64
+    SHED_RESERVED_INFLIGHT: int = 16
+    SHED_ANALYSIS_MAX_INFLIGHT: int = 8
+    SHED_ACCOUNT_MAX_INFLIGHT: int = 32
+    SHED_LOOP_LAG_MS: float = 500
+    SHED_RETRY_AFTER_SECONDS: int = 5
+
+    # Repeated requests for a receipt (same receipt_id, image and mode) attach
+    # to its running analysis or get the result stored for IDEMPOTENCY_TTL_SECONDS
+    IDEMPOTENCY_ENABLED: bool = True
+    IDEMPOTENCY_TTL_SECONDS: float = 600
+    IDEMPOTENCY_MAX_ENTRIES: int = 2000
+    # Cancel an analysis whose every caller has gone after this long (unset:
+    # never). Must outlast the backend's retry window (60 s request timeout
+    # plus its retry delay), or the retry it is meant to serve starts over.
+    IDEMPOTENCY_ABANDON_GRACE_SECONDS: Optional[float] = 120
+
+    # Abandoned requests: analyses are cancelled when the client disconnects
+    # (checked every CANCEL_POLL_SECONDS) or its X-Request-Timeout-Ms passes
+    CANCEL_POLL_SECONDS: float = 0.5
+    # Threads for CPU-bound agent work (forensics, text check)
+    ANALYSIS_EXECUTOR_WORKERS: int = 4
+
+    # Direct multipart uploads (/api/analyze-receipt/upload); received images
+    # are archived to Cloudinary in the background
+    UPLOAD_MAX_MB: int = 15
+    UPLOAD_ARCHIVE_ENABLED: bool = True
+    UPLOAD_ARCHIVE_FOLDER: str = "receipts"
+
+    # Admin-only per-request profiling (X-Admin-Token must match ADMIN_TOKEN)
+    ADMIN_TOKEN: Optional[str] = None
+    PROFILE_INTERVAL_MS: float = 5.0
+    PROFILE_DIR: Optional[str] = None  # also write summary + folded stacks here
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,197 @@
+"""
+Columnar store of raw agent outputs
+
+Every completed analysis is reduced to the per-agent fields the reasoning
+rules read and appended to a buffer that is written out as compressed NPZ
+shards, one array per column, once shard_size rows have accumulated or
+flush_seconds after the oldest unwritten row, whichever comes first. The batch scorer (app/agents/batch_scorer.py)
+loads the shards to re-score history without re-running any agent.
+"""
+import asyncio
+import glob
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Column name -> dtype. Absent agents are recorded with has_<agent> = False
+# so the scorer can apply the same defaults the reasoning agent does.
+COLUMNS: Dict[str, str] = {
+    "receipt_id": "U64",
+    "recorded_at": "f8",
+    "has_vision": "?",
+    "ocr_confidence": "f8",
+    "ocr_text_length": "i4",
+    "visual_anomalies": "i2",
+    "has_forensic": "?",
+    "manipulation_score": "f8",
+    "has_metadata": "?",
+    "metadata_flags": "i2",
+    "has_reputation": "?",
+    "fraud_reports": "i4",
+    "merchant_verified": "?",
+    "template_matched": "?",
+    "template_deviation": "i2",
+    "ring_receipts": "i4",
+    "ring_submitters": "i2",
+    "ring_merchants": "i2",
+    "trust_score": "i2",
+    "verdict": "U16",
+}
+
+
+def _number(value: Any, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def extract_row(
+    receipt_id: str, agent_results: Dict[str, Any], final: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Flatten one analysis into a store row"""
+    vision = agent_results.get("vision") or {}
+    forensic = agent_results.get("forensic") or {}
+    metadata = agent_results.get("metadata") or {}
+    reputation = agent_results.get("reputation") or {}
+    template = agent_results.get("template") or {}
+    ring = (agent_results.get("network") or {}).get("ring") or {}
+    merchant = reputation.get("merchant")
+
+    return {
+        "receipt_id": str(receipt_id)[:64],
+        "recorded_at": time.time(),
+        "has_vision": bool(vision),
+        # NaN when Gemini gave no confidence; the scorer applies the default
+        "ocr_confidence": _number(vision.get("confidence"), float("nan")),
+        "ocr_text_length": len(vision.get("ocr_text") or ""),
+        "visual_anomalies": len(vision.get("visual_anomalies") or []),
+        "has_forensic": bool(forensic),
+        "manipulation_score": _number(forensic.get("manipulation_score")),
+        "has_metadata": bool(metadata),
+        "metadata_flags": len(metadata.get("flags") or []),
+        "has_reputation": bool(reputation),
+        "fraud_reports": int(_number(reputation.get("total_fraud_reports"))),
+        "merchant_verified": bool(
+            isinstance(merchant, dict) and merchant.get("verified")
+        ),
+        "template_matched": bool(template.get("matched")),
+        "template_deviation": int(_number(template.get("layout_deviation"))),
+        "ring_receipts": int(_number(ring.get("receipts"))),
+        "ring_submitters": int(_number(ring.get("submitters"))),
+        "ring_merchants": int(_number(ring.get("merchants"))),
+        "trust_score": int(_number(final.get("trust_score"), 50)),
+        "verdict": str(final.get("verdict", "unclear")),
+    }
+
+
+class AgentOutputStore:
+    """Buffers analysis rows in memory and flushes them as NPZ shards"""
+
+    def __init__(self, directory: str, shard_size: int = 1000, flush_seconds: float = 60):
+        self.directory = directory
+        self.shard_size = shard_size
+        # Bounds what a crash can lose when traffic is too low to fill a shard
+        self.flush_seconds = flush_seconds
+        self._rows: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._shard_seq = 0
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {"recorded": 0, "shards_written": 0, "write_errors": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    async def record(
+        self, receipt_id: str, agent_results: Dict[str, Any], final: Dict[str, Any]
+    ) -> None:
+        """Result sink hook called by the orchestrator after each analysis"""
+        with self._lock:
+            self._rows.append(extract_row(receipt_id, agent_results, final))
+            self.counters["recorded"] += 1
+            full = len(self._rows) >= self.shard_size
+        if full:
+            await asyncio.to_thread(self.flush)
+        elif self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        """Write whatever is buffered flush_seconds from now"""
+        await asyncio.sleep(self.flush_seconds)
+        try:
+            await asyncio.to_thread(self.flush)
+        except Exception as e:
+            logger.error(f"Timed agent output flush failed: {str(e)}")
+
+    async def drain(self) -> None:
+        """Stop the flush timer and write what is buffered (shutdown)"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def flush(self) -> Optional[str]:
+        """Write buffered rows to a new shard; returns its path"""
+        with self._lock:
+            rows, self._rows = self._rows, []
+            self._shard_seq += 1
+            seq = self._shard_seq
+        if not rows:
+            return None
+
+        columns = {
+            name: np.array([row[name] for row in rows], dtype=dtype)
+            for name, dtype in COLUMNS.items()
+        }
+        path = os.path.join(
+            self.directory,
+            f"agent-outputs-{int(time.time())}-{os.getpid()}-{seq:05d}.npz",
+        )
+        try:
+            # Write under a temp name so readers never see a partial shard
+            tmp_path = path[:-4] + ".tmp.npz"
+            np.savez_compressed(tmp_path, **columns)
+            os.replace(tmp_path, path)
+            self.counters["shards_written"] += 1
+            return path
+        except OSError as e:
+            logger.error(f"Failed to write agent output shard: {str(e)}")
+            self.counters["write_errors"] += 1
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "buffered": len(self._rows),
+            "shard_size": self.shard_size,
+            "flush_seconds": self.flush_seconds,
+            **self.counters,
+        }
+
+
+def load_shards(directory: str) -> Dict[str, np.ndarray]:
+    """Concatenate every shard in a directory into one array per column"""
+    paths = sorted(
+        path
+        for path in glob.glob(os.path.join(directory, "agent-outputs-*.npz"))
+        if not path.endswith(".tmp.npz")
+    )
+    parts: Dict[str, List[np.ndarray]] = {name: [] for name in COLUMNS}
+    for path in paths:
+        with np.load(path) as shard:
+            for name, dtype in COLUMNS.items():
+                if name in shard.files:
+                    parts[name].append(shard[name])
+                else:
+                    # Column added after this shard was written
+                    parts[name].append(np.zeros(len(shard["receipt_id"]), dtype=dtype))
+
+    return {
+        name: np.concatenate(chunks) if chunks else np.empty(0, dtype=COLUMNS[name])
+        for name, chunks in parts.items()
+    }
@@ -0,0 +1,168 @@
+"""
+Reusable scratch memory for the forensic agent
+
+Every forensic run used to allocate its intermediates afresh: morphology
+and threshold outputs, the connected-component label image, Laplacian and
+Canny outputs, and a BytesIO per JPEG re-encode. At request rate that
+pushes hundreds of MB/s through the allocator and fragments worker heaps.
+
+A BufferArena keeps one grow-only flat buffer per use and hands out views
+of it shaped for each call, which OpenCV writes into through dst=. Views
+of one buffer are not keyed by shape, so receipts of any size share it.
+Arenas are per thread (ArenaPool), so each executor worker reuses its own
+without locking. A view is only valid until the same name is requested
+again on that thread: nothing kept past the call may point into it.
+"""
+import io
+import math
+import threading
+import weakref
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+class ByteCounter:
+    """Write-only file object that only counts bytes, for encoded sizes"""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.size += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+
+class BufferArena:
+    """Named scratch arrays and an encode buffer, reused by one thread"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._buffers: Dict[Tuple[str, str], "np.ndarray"] = {}
+        self._encode: Optional[io.BytesIO] = None
+        # allocated_bytes: scratch memory newly allocated (grown or oversize)
+        self.counters = {
+            "requests": 0,
+            "reused": 0,
+            "grown": 0,
+            "oversize": 0,
+            "allocated_bytes": 0,
+        }
+
+    def array(self, name: str, shape: Tuple[int, ...], dtype: Any) -> "np.ndarray":
+        """Uninitialized C-contiguous array of shape/dtype, valid until the next call for name"""
+        import numpy as np
+
+        dtype = np.dtype(dtype)
+        count = math.prod(shape)
+        key = (name, dtype.str)
+        self.counters["requests"] += 1
+        buffer = self._buffers.get(key)
+        if buffer is not None and buffer.size >= count:
+            self.counters["reused"] += 1
+            return buffer[:count].reshape(shape)
+
+        held = self.held_bytes - (buffer.nbytes if buffer is not None else 0)
+        if held + count * dtype.itemsize > self.max_bytes:
+            # Too big to keep around; this call gets a throwaway array
+            self.counters["oversize"] += 1
+            self.counters["allocated_bytes"] += count * dtype.itemsize
+            return np.empty(shape, dtype)
+
+        # Headroom so slightly larger images do not regrow every time
+        size = count
+        if buffer is not None:
+            size = max(count, buffer.size * 5 // 4)
+            if held + size * dtype.itemsize > self.max_bytes:
+                size = count
+        self.counters["grown"] += 1
+        self.counters["allocated_bytes"] += size * dtype.itemsize
+        self._buffers[key] = np.empty(size, dtype)
+        return self._buffers[key][:count].reshape(shape)
+
+    def encode_buffer(self) -> io.BytesIO:
+        """
+        BytesIO rewound for a JPEG re-encode. It is not truncated: the JPEG
+        decoder stops at the EOI marker, so bytes left past it by a larger
+        earlier encode are never read.
+        """
+        if self._encode is None or self._encode_bytes() > self.max_bytes // 4:
+            self._encode = io.BytesIO()
+        self._encode.seek(0)
+        return self._encode
+
+    def _encode_bytes(self) -> int:
+        # __sizeof__ includes the allocated buffer; getbuffer() would block
+        # a concurrent write on the owning thread
+        return self._encode.__sizeof__() if self._encode is not None else 0
+
+    @property
+    def held_bytes(self) -> int:
+        buffers = list(self._buffers.values())
+        return sum(buffer.nbytes for buffer in buffers) + self._encode_bytes()
+
+
+class ArenaPool:
+    """One BufferArena per thread"""
+
+    def __init__(self, max_bytes_per_thread: int = 64 * 1024 * 1024):
+        self.max_bytes_per_thread = max_bytes_per_thread
+        self._local = threading.local()
+        self._arenas: "weakref.WeakSet[BufferArena]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+        # Counters of arenas whose thread has exited
+        self._retired = {
+            "requests": 0,
+            "reused": 0,
+            "grown": 0,
+            "oversize": 0,
+            "allocated_bytes": 0,
+        }
+
+    def get(self) -> BufferArena:
+        arena = getattr(self._local, "arena", None)
+        if arena is None:
+            arena = self._local.arena = BufferArena(self.max_bytes_per_thread)
+            with self._lock:
+                self._arenas.add(arena)
+            weakref.finalize(arena, self._retire, arena.counters)
+        return arena
+
+    def _retire(self, counters: Dict[str, int]) -> None:
+        with self._lock:
+            for name, value in counters.items():
+                self._retired[name] += value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            arenas = list(self._arenas)
+            counters = dict(self._retired)
+        for arena in arenas:
+            for name, value in arena.counters.items():
+                counters[name] += value
+        allocated_mb = round(counters.pop("allocated_bytes") / 1024 / 1024, 2)
+        return {
+            **counters,
+            "allocated_mb": allocated_mb,
+            "reuse_rate": round(counters["reused"] / counters["requests"], 3)
+            if counters["requests"]
+            else 0.0,
+            "arenas": len(arenas),
+            "held_mb": round(sum(arena.held_bytes for arena in arenas) / 1024 / 1024, 2),
+            "max_mb_per_thread": round(self.max_bytes_per_thread / 1024 / 1024, 2),
+        }
+
+
+def scratch(
+    arena: Optional[BufferArena], name: str, shape: Tuple[int, ...], dtype: Any
+) -> "np.ndarray":
+    """arena.array(), or a fresh array when running without an arena"""
+    if arena is None:
+        import numpy as np
+
+        return np.empty(shape, dtype)
+    return arena.array(name, shape, dtype)
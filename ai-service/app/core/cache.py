@@ -0,0 +1,168 @@
+"""
+Shared on-host cache
+
+A single SQLite database in WAL mode that every uvicorn worker on the host
+opens, so analysis results, Gemini outputs and reputation lookups computed
+by one process are reused by the others. Entries carry a TTL and the file
+is kept under a size budget by evicting least-recently-used rows.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Hits only refresh accessed_at when it is older than this, to keep reads cheap
+TOUCH_INTERVAL_SECONDS = 60
+# How many writes between size checks
+EVICTION_CHECK_EVERY = 50
+
+
+class SharedCache:
+    """Namespaced key/value cache with TTLs, shared across processes"""
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = 600,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self._local = threading.local()
+        self._writes = 0
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"hits": 0, "misses": 0, "sets": 0}
+        )
+        self._evictions = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache_entries (accessed_at)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; SQLite handles cross-process locking"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_sync(self, namespace: str, key: str) -> Optional[Any]:
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT value, expires_at, accessed_at FROM cache_entries "
+                "WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+            if row is None or row[1] < now:
+                self._stats[namespace]["misses"] += 1
+                return None
+
+            if now - row[2] > TOUCH_INTERVAL_SECONDS:
+                conn.execute(
+                    "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    (now, namespace, key),
+                )
+                conn.commit()
+            self._stats[namespace]["hits"] += 1
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            logger.warning(f"Cache read failed for {namespace}: {str(e)}")
+            self._stats[namespace]["misses"] += 1
+            return None
+
+    def set_sync(
+        self, namespace: str, key: str, value: Any, ttl_seconds: Optional[float] = None
+    ) -> None:
+        now = time.time()
+        if ttl_seconds is None:
+            ttl_seconds = self.ttls.get(namespace, self.default_ttl)
+        payload = json.dumps(value, default=str)
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?, ?, ?)",
+                (namespace, key, payload, len(payload), now + ttl_seconds, now),
+            )
+            conn.commit()
+            self._stats[namespace]["sets"] += 1
+            self._writes += 1
+            if self._writes % EVICTION_CHECK_EVERY == 0:
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            logger.warning(f"Cache write failed for {namespace}: {str(e)}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """Drop expired rows, then least-recently-used rows down to 90% of budget"""
+        removed = conn.execute("DELETE FROM cache_entries WHERE expires_at < ?", (now,)).rowcount
+        (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+        if total > self.max_bytes:
+            target = int(self.max_bytes * 0.9)
+            while total > target:
+                rows = conn.execute(
+                    "SELECT rowid, size FROM cache_entries ORDER BY accessed_at LIMIT 100"
+                ).fetchall()
+                if not rows:
+                    break
+                for rowid, size in rows:
+                    conn.execute("DELETE FROM cache_entries WHERE rowid = ?", (rowid,))
+                    removed += 1
+                    total -= size
+                    if total <= target:
+                        break
+        conn.commit()
+        self._evictions += removed
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self.get_sync, namespace, key)
+
+    async def set(
+        self, namespace: str, key: str, value: Any, ttl_seconds: Optional[float] = None
+    ) -> None:
+        await asyncio.to_thread(self.set_sync, namespace, key, value, ttl_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        namespaces = {}
+        for namespace, counts in self._stats.items():
+            lookups = counts["hits"] + counts["misses"]
+            namespaces[namespace] = {
+                **counts,
+                "hit_rate": round(counts["hits"] / lookups, 3) if lookups else 0.0,
+            }
+        return {
+            "path": self.path,
+            "pid": os.getpid(),
+            "max_bytes": self.max_bytes,
+            "evictions": self._evictions,
+            "namespaces": namespaces,
+        }
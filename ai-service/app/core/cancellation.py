@@ -0,0 +1,222 @@
+"""
+Cancelling analyses nobody is waiting for
+
+The backend gives up on a request by disconnecting, or tells us up front
+how long it will wait (X-Request-Timeout-Ms). RequestCanceller races the
+analysis against both and cancels it when either comes first. Cancellation
+then travels down as asyncio cancellation: pending agents never start,
+the Gemini call is dropped and pool work is stopped.
+
+CPU-heavy agent work runs on a CancellableExecutor. A job still queued
+when it is cancelled never runs; a running one is asked to stop through
+its CancelToken, which the work checks between stages. Threads cannot be
+interrupted, so stopping takes until the next check.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.core.metrics import SampleWindow
+from app.core.profiler import add_offloaded_cpu
+
+logger = logging.getLogger(__name__)
+
+
+class OperationCancelled(Exception):
+    """Raised inside pool work whose caller has gone"""
+
+
+class RequestAbandoned(Exception):
+    """The client disconnected or its deadline passed before the analysis finished"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Analysis cancelled: {reason}")
+        self.reason = reason
+
+
+class CancelToken:
+    """Thread-safe cancellation flag checked by pool work between stages"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self) -> None:
+        if self._event.is_set():
+            raise OperationCancelled()
+
+
+class CancellableExecutor:
+    """
+    Thread pool whose jobs stop when the awaiting coroutine is cancelled
+
+    Jobs are called as fn(*args, cancel=token). CPU time is measured per job
+    on its worker thread; a cancelled job is credited with the typical CPU
+    time of its kind minus what it had already used. A finished job's CPU
+    time is also credited to the profiled node that awaited it.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis")
+        self._lock = threading.Lock()
+        self.counters = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled_queued": 0,
+            "cancelled_running": 0,
+            # Finished before reaching a check, after the caller had gone
+            "completed_unwanted": 0,
+        }
+        self.cpu_seconds = {"used": 0.0, "wasted": 0.0, "saved": 0.0}
+        self._cpu_by_kind: Dict[str, SampleWindow] = {}
+
+    async def run(self, kind: str, fn: Callable[..., Any], *args: Any) -> Any:
+        token = CancelToken()
+        used = [0.0]
+        job = self._pool.submit(self._work, kind, token, fn, args, used)
+        self.counters["submitted"] += 1
+        try:
+            return await asyncio.wrap_future(job)
+        except asyncio.CancelledError:
+            token.cancel()
+            if job.cancel():
+                with self._lock:
+                    self.counters["cancelled_queued"] += 1
+                    self.cpu_seconds["saved"] += self._typical_cpu(kind)
+            raise
+        finally:
+            # Set when the job ends; still 0 if it was left running
+            add_offloaded_cpu(used[0])
+
+    def _work(
+        self,
+        kind: str,
+        token: CancelToken,
+        fn: Callable[..., Any],
+        args: tuple,
+        used: List[float],
+    ) -> Any:
+        started = time.thread_time()
+        status = "failed"
+        try:
+            token.check()
+            result = fn(*args, cancel=token)
+            status = "completed"
+            return result
+        except OperationCancelled:
+            status = "cancelled"
+            raise
+        finally:
+            used[0] = time.thread_time() - started
+            self._account(kind, status, used[0], token.cancelled)
+
+    def _account(self, kind: str, status: str, cpu: float, cancelled: bool) -> None:
+        with self._lock:
+            self.cpu_seconds["used"] += cpu
+            if status == "cancelled":
+                self.counters["cancelled_running"] += 1
+                self.cpu_seconds["wasted"] += cpu
+                self.cpu_seconds["saved"] += max(0.0, self._typical_cpu(kind) - cpu)
+            elif status == "completed" and cancelled:
+                self.counters["completed_unwanted"] += 1
+                self.cpu_seconds["wasted"] += cpu
+            elif status == "completed":
+                self.counters["completed"] += 1
+                self._cpu_by_kind.setdefault(kind, SampleWindow(200)).add(cpu)
+            else:
+                self.counters["failed"] += 1
+
+    def _typical_cpu(self, kind: str) -> float:
+        window = self._cpu_by_kind.get(kind)
+        return window.mean() if window else 0.0
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "max_workers": self.max_workers,
+            "cpu_seconds": {name: round(value, 3) for name, value in self.cpu_seconds.items()},
+            "cpu_ms_by_kind": {
+                kind: {
+                    key: round(value * 1000, 2) if key != "count" else value
+                    for key, value in window.summary().items()
+                }
+                for kind, window in self._cpu_by_kind.items()
+            },
+        }
+
+
+class RequestCanceller:
+    """Runs a request's analysis until it finishes, the client leaves or the deadline passes"""
+
+    def __init__(self, poll_seconds: float = 0.5):
+        self.poll_seconds = poll_seconds
+        self.counters = {"watched": 0, "completed": 0, "disconnect": 0, "deadline": 0}
+
+    async def run(
+        self,
+        analysis: Awaitable[Any],
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        deadline: Optional[float] = None,
+    ) -> Any:
+        """
+        Await analysis; deadline is a time.monotonic() value. Raises
+        RequestAbandoned (after cancelling the analysis) when the client
+        disconnects or the deadline passes first.
+        """
+        self.counters["watched"] += 1
+        if deadline is not None and deadline <= time.monotonic():
+            if asyncio.iscoroutine(analysis):
+                analysis.close()
+            self.counters["deadline"] += 1
+            raise RequestAbandoned("deadline")
+
+        task = asyncio.ensure_future(analysis)
+        watcher = asyncio.create_task(self._watch(is_disconnected)) if is_disconnected else None
+        waiting = {task} | ({watcher} if watcher else set())
+        timeout = None if deadline is None else deadline - time.monotonic()
+        try:
+            done, _ = await asyncio.wait(
+                waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            if watcher:
+                watcher.cancel()
+
+        if task in done:
+            self.counters["completed"] += 1
+            return task.result()
+
+        reason = "disconnect" if watcher in done else "deadline"
+        self.counters[reason] += 1
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        raise RequestAbandoned(reason)
+
+    async def _watch(self, is_disconnected: Callable[[], Awaitable[bool]]) -> None:
+        try:
+            while not await is_disconnected():
+                await asyncio.sleep(self.poll_seconds)
+        except Exception as e:
+            # Cannot tell; keep serving until the analysis or deadline ends
+            logger.warning(f"Disconnect watch failed: {str(e)}")
+            await asyncio.Event().wait()
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.counters)
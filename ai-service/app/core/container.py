@@ -0,0 +1,441 @@
+"""
+Service container
+
+Heavy clients (Firebase/Firestore, the Gemini SDK, OpenCV) are created on
+first use, exactly once per process, and shared by every router. warm_up()
+pre-touches them in the background after startup so the first real request
+does not pay for it; readiness is reported from its progress. Failed steps
+are retried with backoff by keep_warm(), and only REQUIRED_WARM_UP_STEPS
+gate readiness.
+"""
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from app.config import settings
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+# Without these no analysis can run; the rest only move one-off setup cost
+# off the first request (Firebase lookups already degrade per request)
+REQUIRED_WARM_UP_STEPS = ("agents",)
+
+
+class ServiceContainer:
+    """Lazily constructed, process-wide agent and client instances"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._instances: Dict[str, Any] = {}
+        self.warm_up_state = "pending"
+        self.warm_up_steps: Dict[str, Dict[str, Any]] = {}
+
+    def _once(self, name: str, factory: Callable[[], Any]) -> Any:
+        if name in self._instances:
+            return self._instances[name]
+        with self._lock:
+            if name not in self._instances:
+                started = time.perf_counter()
+                self._instances[name] = factory()
+                logger.info(
+                    f"Initialized {name} in {(time.perf_counter() - started) * 1000:.0f} ms"
+                )
+        return self._instances[name]
+
+    @property
+    def cache(self):
+        def build():
+            if not settings.CACHE_ENABLED:
+                return None
+            if settings.REPLAY_MODE != "off":
+                # Cache hits would hide calls from the recorder and from load tests
+                logger.info("Shared cache disabled while traffic replay is active")
+                return None
+            from app.core.cache import SharedCache
+
+            # Shared with the other uvicorn workers on this host
+            cache = SharedCache(
+                settings.CACHE_PATH
+                or os.path.join(tempfile.gettempdir(), "confirmit-cache.sqlite3"),
+                max_bytes=settings.CACHE_MAX_MB * 1024 * 1024,
+                ttls={
+                    "vision": settings.CACHE_VISION_TTL_SECONDS,
+                    "forensic": settings.CACHE_FORENSIC_TTL_SECONDS,
+                    "reputation": settings.CACHE_REPUTATION_TTL_SECONDS,
+                },
+            )
+            metrics.register("cache", cache.stats)
+            return cache
+
+        return self._once("cache", build)
+
+    @property
+    def agent_store(self):
+        def build():
+            if not settings.AGENT_STORE_DIR:
+                return None
+            from app.core.agent_store import AgentOutputStore
+
+            store = AgentOutputStore(
+                settings.AGENT_STORE_DIR,
+                shard_size=settings.AGENT_STORE_SHARD_SIZE,
+                flush_seconds=settings.AGENT_STORE_FLUSH_SECONDS,
+            )
+            metrics.register("agent_store", store.stats)
+            return store
+
+        return self._once("agent_store", build)
+
+    @property
+    def result_writer(self):
+        def build():
+            # Replayed load tests must not write to the real Firestore
+            if not settings.RESULT_WRITER_ENABLED or settings.REPLAY_MODE == "replay":
+                return None
+            from app.core.firebase import get_db
+            from app.core.result_writer import FirestoreResultWriter
+
+            writer = FirestoreResultWriter(
+                get_db,
+                collection=settings.RESULT_WRITER_COLLECTION,
+                batch_size=settings.RESULT_WRITER_BATCH_SIZE,
+                flush_seconds=settings.RESULT_WRITER_FLUSH_SECONDS,
+                max_retries=settings.RESULT_WRITER_MAX_RETRIES,
+                max_backlog=settings.RESULT_WRITER_MAX_BACKLOG,
+                spill_dir=settings.RESULT_WRITER_SPILL_DIR
+                or os.path.join(tempfile.gettempdir(), "confirmit-result-spill"),
+            )
+            metrics.register("result_writer", writer.stats)
+            return writer
+
+        return self._once("result_writer", build)
+
+    @property
+    def replay(self):
+        def build():
+            if settings.REPLAY_MODE == "off":
+                return None
+            from app.core.replay import TrafficReplay
+
+            replay = TrafficReplay(
+                settings.REPLAY_MODE,
+                settings.REPLAY_DIR,
+                latency_scale=settings.REPLAY_LATENCY_SCALE,
+            )
+            metrics.register("replay", replay.stats)
+            logger.warning(
+                f"Traffic {settings.REPLAY_MODE} mode enabled ({settings.REPLAY_DIR})"
+            )
+            return replay
+
+        return self._once("replay", build)
+
+    @property
+    def vision_agent(self):
+        def build():
+            # Replayed runs never call Gemini, so they need no key
+            if not settings.GEMINI_API_KEY and settings.REPLAY_MODE != "replay":
+                logger.warning("Gemini API key not configured. Vision agent disabled.")
+                return None
+            from app.agents.vision_agent import VisionAgent
+
+            return VisionAgent(
+                settings.GEMINI_API_KEY,
+                replay=self.replay,
+                stream=settings.VISION_STREAM_ENABLED,
+            )
+
+        return self._once("vision_agent", build)
+
+    @property
+    def vision_batcher(self):
+        def build():
+            if settings.VISION_BATCH_SIZE <= 1 or self.vision_agent is None:
+                return None
+            from app.agents.vision_batcher import VisionBatcher
+
+            batcher = VisionBatcher(
+                self.vision_agent,
+                max_batch=settings.VISION_BATCH_SIZE,
+                window_ms=settings.VISION_BATCH_WINDOW_MS,
+            )
+            metrics.register("vision_batch", batcher.stats)
+            return batcher
+
+        return self._once("vision_batcher", build)
+
+    @property
+    def image_normalizer(self):
+        def build():
+            from app.core.normalize import ImageNormalizer
+
+            normalizer = ImageNormalizer(
+                max_pixels=int(settings.IMAGE_MAX_MEGAPIXELS * 1_000_000),
+                max_decode_pixels=int(settings.IMAGE_DECODE_MAX_MEGAPIXELS * 1_000_000),
+            )
+            metrics.register("normalize", normalizer.stats)
+            return normalizer
+
+        return self._once("image_normalizer", build)
+
+    @property
+    def analysis_executor(self):
+        def build():
+            from app.core.cancellation import CancellableExecutor
+
+            executor = CancellableExecutor(max_workers=settings.ANALYSIS_EXECUTOR_WORKERS)
+            metrics.register("analysis_executor", executor.stats)
+            return executor
+
+        return self._once("analysis_executor", build)
+
+    @property
+    def forensic_agent(self):
+        def build():
+            from app.agents.forensic_agent import ForensicAgent
+
+            arenas = None
+            if settings.FORENSIC_BUFFER_ARENA_MB > 0:
+                from app.core.buffers import ArenaPool
+
+                arenas = ArenaPool(int(settings.FORENSIC_BUFFER_ARENA_MB * 1024 * 1024))
+                metrics.register("forensic_buffers", arenas.stats)
+            return ForensicAgent(
+                decode_scale=settings.FORENSIC_DECODE_SCALE,
+                executor=self.analysis_executor,
+                arenas=arenas,
+            )
+
+        return self._once("forensic_agent", build)
+
+    @property
+    def metadata_agent(self):
+        def build():
+            from app.agents.metadata_agent import MetadataAgent
+
+            return MetadataAgent()
+
+        return self._once("metadata_agent", build)
+
+    @property
+    def reputation_agent(self):
+        def build():
+            from app.agents.reputation_agent import ReputationAgent
+
+            agent = ReputationAgent(cache=self.cache, replay=self.replay)
+            metrics.register("reputation_prefetch", agent.prefetch_stats)
+            return agent
+
+        return self._once("reputation_agent", build)
+
+    @property
+    def template_agent(self):
+        def build():
+            path = settings.TEMPLATE_INDEX_PATH
+            if not path:
+                return None
+            if not os.path.exists(path):
+                logger.warning(f"Template index {path} not found. Template agent disabled.")
+                return None
+            from app.agents.template_agent import TemplateAgent
+            from app.core.templates import TemplateIndex
+
+            index = TemplateIndex.load(path)
+            logger.info(f"Loaded {len(index)} receipt templates from {path}")
+            return TemplateAgent(
+                index,
+                max_hash_distance=settings.TEMPLATE_MAX_HASH_DISTANCE,
+                deviation_scale=settings.TEMPLATE_DEVIATION_SCALE,
+            )
+
+        return self._once("template_agent", build)
+
+    @property
+    def network_agent(self):
+        def build():
+            if not settings.NETWORK_AGENT_ENABLED:
+                return None
+            from app.agents.network_agent import NetworkAgent
+            from app.core.entity_graph import EntityGraph
+
+            graph = EntityGraph(
+                retention_days=settings.NETWORK_RETENTION_DAYS,
+                max_receipts=settings.NETWORK_MAX_RECEIPTS,
+            )
+            metrics.register("entity_graph", graph.stats)
+            return NetworkAgent(graph, window_days=settings.NETWORK_WINDOW_DAYS)
+
+        return self._once("network_agent", build)
+
+    @property
+    def reasoning_agent(self):
+        def build():
+            from app.agents.reasoning_agent import ReasoningAgent
+
+            return ReasoningAgent()
+
+        return self._once("reasoning_agent", build)
+
+    @property
+    def orchestrator(self):
+        def build():
+            if self.vision_agent is None:
+                return None
+            from app.agents.orchestrator import ReceiptAnalysisOrchestrator
+
+            orchestrator = ReceiptAnalysisOrchestrator(
+                vision_agent=self.vision_agent,
+                forensic_agent=self.forensic_agent,
+                metadata_agent=self.metadata_agent,
+                reputation_agent=self.reputation_agent,
+                reasoning_agent=self.reasoning_agent,
+                cache=self.cache,
+                result_sinks=[
+                    sink for sink in [self.agent_store, self.result_writer] if sink
+                ],
+                template_agent=self.template_agent,
+                network_agent=self.network_agent,
+                vision_batcher=self.vision_batcher,
+                normalizer=self.image_normalizer,
+                executor=self.analysis_executor,
+            )
+            metrics.register("prescreen", orchestrator.prescreen_stats)
+            metrics.register("cancelled_analyses", orchestrator.cancellation_stats)
+            return orchestrator
+
+        return self._once("orchestrator", build)
+
+    async def drain(self) -> None:
+        """Flush async writers; called on the event loop before shutdown()"""
+        writer = self._instances.get("result_writer")
+        if writer:
+            await writer.drain()
+        store = self._instances.get("agent_store")
+        if store:
+            await store.drain()
+
+    def shutdown(self) -> None:
+        """Flush anything buffered in memory before the process exits"""
+        store = self._instances.get("agent_store")
+        if store:
+            store.flush()
+        executor = self._instances.get("analysis_executor")
+        if executor:
+            executor.shutdown()
+
+    @property
+    def ready(self) -> bool:
+        return all(
+            self.warm_up_steps.get(name, {}).get("status") == "ok"
+            for name in REQUIRED_WARM_UP_STEPS
+        )
+
+    def warm_up(self, only: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """
+        Initialize every client and exercise the codecs and OpenCV kernels the
+        agents use, so their one-off setup cost is paid before traffic arrives.
+        `only` limits it to the named steps. Safe to call more than once.
+        """
+        steps = [
+            ("firebase", self._warm_firebase),
+            ("agents", lambda: self.orchestrator),
+            ("opencv", self._warm_opencv),
+            ("codecs", self._warm_codecs),
+            ("cache", self._warm_cache),
+        ]
+        if only is not None:
+            only = set(only)
+            steps = [(name, step) for name, step in steps if name in only]
+        if self.warm_up_state == "pending":
+            self.warm_up_state = "warming"
+
+        for name, step in steps:
+            attempts = self.warm_up_steps.get(name, {}).get("attempts", 0) + 1
+            started = time.perf_counter()
+            try:
+                step()
+                self.warm_up_steps[name] = {"status": "ok"}
+            except Exception as e:
+                logger.error(f"Warm-up step '{name}' failed (attempt {attempts}): {str(e)}")
+                self.warm_up_steps[name] = {"status": "failed", "error": str(e)}
+            self.warm_up_steps[name]["attempts"] = attempts
+            self.warm_up_steps[name]["ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+        if not self.ready:
+            self.warm_up_state = "failed"
+        elif self.failed_warm_up_steps():
+            # Serving; optional steps are still being retried
+            self.warm_up_state = "degraded"
+        else:
+            self.warm_up_state = "ready"
+        logger.info(f"Warm-up {self.warm_up_state}: {self.warm_up_steps}")
+        return self.status()
+
+    def failed_warm_up_steps(self) -> List[str]:
+        return [
+            name for name, step in self.warm_up_steps.items() if step["status"] != "ok"
+        ]
+
+    async def keep_warm(self, retry_seconds: float = 5, max_retry_seconds: float = 300) -> None:
+        """Warm up off the event loop, then retry failed steps with exponential backoff"""
+        await asyncio.to_thread(self.warm_up)
+        delay = retry_seconds
+        while self.failed_warm_up_steps():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_retry_seconds)
+            await asyncio.to_thread(self.warm_up, self.failed_warm_up_steps())
+
+    def status(self) -> Dict[str, Any]:
+        return {"state": self.warm_up_state, "steps": self.warm_up_steps}
+
+    def _warm_firebase(self) -> None:
+        if settings.REPLAY_MODE == "replay":
+            return
+        from app.core.firebase import get_db
+
+        get_db()
+
+    def _warm_opencv(self) -> None:
+        import cv2
+        import numpy as np
+
+        from app.core.forensic_kernels import (
+            image_statistics,
+            region_statistics,
+            stack_statistics,
+        )
+
+        rgb = np.random.default_rng(0).integers(0, 255, (64, 64, 3), dtype=np.uint8)
+        gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        image_statistics(gray)
+        stack_statistics([gray, gray])
+        region_statistics(gray, np.array([[0, 0, 32, 16]]))
+
+    def _warm_codecs(self) -> None:
+        import io
+
+        from PIL import Image, ImageChops
+
+        img = Image.new("RGB", (64, 64), (200, 200, 200))
+        for fmt in ("JPEG", "PNG"):
+            buffer = io.BytesIO()
+            img.save(buffer, format=fmt)
+            buffer.seek(0)
+            decoded = Image.open(buffer)
+            if fmt == "JPEG":
+                decoded.draft("L", (16, 16))
+            decoded.load()
+        ImageChops.difference(img, img.copy()).getextrema()
+
+    def _warm_cache(self) -> None:
+        # Opening the database creates the schema and switches it to WAL
+        self.cache
+
+
+container = ServiceContainer()
+
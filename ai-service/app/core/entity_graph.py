@@ -0,0 +1,367 @@
+"""
+Cross-receipt entity graph
+
+Accounts, phone numbers and merchant names seen on receipts are linked to
+the receipts they appeared on, so a ring reusing one account across many
+submitters and merchant names shows up even when no fraud report exists yet.
+
+Everything is interned to integer IDs. Each entity keeps append-only numpy
+arrays of (receipt id, timestamp); per-receipt arrays hold the submitter
+and merchant IDs. "How many distinct receipts, submitters and merchants
+touched this account in the last N days" is then a binary search on the
+entity's timestamps plus a linear, sort-free distinct count over that slice.
+
+The graph lives in process memory and is rebuilt from live traffic after a
+restart. Receipts older than the retention window are pruned as it grows,
+and past max_receipts the oldest receipts are evicted; either way the
+surviving receipts, entities and submitters are renumbered so the arrays and
+lookup tables shrink with them.
+"""
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.metrics import SampleWindow
+
+ENTITY_KINDS = ("account", "phone", "merchant")
+NO_ID = -1
+DAY_SECONDS = 86400
+# Expired links are only pruned once they are this far past retention, so a
+# steady stream of expiring receipts does not trigger a full pass every time
+PRUNE_SLACK_SECONDS = DAY_SECONDS
+
+
+class _Postings:
+    """Growable receipt-id / timestamp arrays for one entity"""
+
+    __slots__ = ("receipts", "times", "size", "ordered")
+
+    def __init__(self, capacity: int = 4):
+        self.receipts = np.empty(capacity, dtype=np.int32)
+        self.times = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+        # Receipts normally arrive in time order, which allows a binary search
+        self.ordered = True
+
+    def append(self, receipt: int, timestamp: float) -> None:
+        if self.size >= len(self.receipts):
+            self._resize(max(4, self.size * 2))
+        if self.size and timestamp < self.times[self.size - 1]:
+            self.ordered = False
+        self.receipts[self.size] = receipt
+        self.times[self.size] = timestamp
+        self.size += 1
+
+    def since(self, cutoff: float) -> np.ndarray:
+        """Receipt IDs with timestamp >= cutoff"""
+        times = self.times[: self.size]
+        if self.ordered:
+            start = int(np.searchsorted(times, cutoff, side="left"))
+            return self.receipts[start : self.size]
+        return self.receipts[: self.size][times >= cutoff]
+
+    def prune(self, cutoff: float) -> int:
+        """Drop entries older than cutoff; returns how many were removed"""
+        keep = self.times[: self.size] >= cutoff
+        kept = int(np.count_nonzero(keep))
+        removed = self.size - kept
+        if removed:
+            self.receipts = self.receipts[: self.size][keep]
+            self.times = self.times[: self.size][keep]
+            self.size = kept
+            # Survivors keep their relative order
+            self.ordered = self.ordered or bool(np.all(np.diff(self.times) >= 0))
+        return removed
+
+    def _resize(self, capacity: int) -> None:
+        receipts = np.empty(capacity, dtype=np.int32)
+        times = np.empty(capacity, dtype=np.float64)
+        receipts[: self.size] = self.receipts[: self.size]
+        times[: self.size] = self.times[: self.size]
+        self.receipts, self.times = receipts, times
+
+    def nbytes(self) -> int:
+        return self.receipts.nbytes + self.times.nbytes
+
+
+class EntityGraph:
+    """In-memory, incrementally updated receipt <-> entity index"""
+
+    def __init__(
+        self,
+        retention_days: float = 90,
+        prune_every: int = 10000,
+        max_receipts: Optional[int] = None,
+        clock=time.time,
+    ):
+        self.retention_days = retention_days
+        self.prune_every = prune_every
+        self.max_receipts = max_receipts
+        self.clock = clock
+        self._lock = threading.Lock()
+
+        self._entity_ids: Dict[Tuple[str, str], int] = {}
+        self._postings: List[_Postings] = []
+        self._submitter_ids: Dict[str, int] = {}
+        self._receipt_ids: Dict[str, int] = {}
+        # Indexed by receipt ID
+        self._receipt_submitter = np.full(1024, NO_ID, dtype=np.int32)
+        self._receipt_merchant = np.full(1024, NO_ID, dtype=np.int32)
+        self._receipt_time = np.zeros(1024, dtype=np.float64)
+        self._receipts = 0
+        # Scratch for distinct counts, indexed by submitter / entity ID
+        self._submitter_marks = np.zeros(1024, dtype=np.int32)
+        self._entity_marks = np.zeros(1024, dtype=np.int32)
+
+        self._adds_since_prune = 0
+        self._oldest = float("inf")
+        self.pruned_edges = 0
+        self.evicted_receipts = 0
+        self.query_us = SampleWindow()
+
+    def __len__(self) -> int:
+        return len(self._receipt_ids)
+
+    def add_receipt(
+        self,
+        receipt_id: str,
+        entities: Dict[str, Iterable[str]],
+        submitter_id: Optional[str] = None,
+        timestamp: Optional[float] = None,
+    ) -> bool:
+        """
+        Link a receipt to its entities ({"account": [...], "phone": [...],
+        "merchant": [...]}). Returns False if the receipt was already indexed,
+        so re-analysing a receipt never inflates the counts.
+        """
+        timestamp = self.clock() if timestamp is None else timestamp
+        with self._lock:
+            if receipt_id in self._receipt_ids:
+                return False
+            receipt = self._receipts
+            self._receipts += 1
+            self._receipt_ids[receipt_id] = receipt
+            self._ensure_receipt_capacity(self._receipts)
+
+            self._receipt_time[receipt] = timestamp
+            self._oldest = min(self._oldest, timestamp)
+            if submitter_id:
+                submitter = self._submitter_ids.setdefault(
+                    submitter_id, len(self._submitter_ids)
+                )
+                self._receipt_submitter[receipt] = submitter
+                self._submitter_marks = _grown(self._submitter_marks, submitter + 1)
+
+            for kind in ENTITY_KINDS:
+                for key in set(entities.get(kind) or ()):
+                    entity = self._intern(kind, key)
+                    self._postings[entity].append(receipt, timestamp)
+                    if kind == "merchant" and self._receipt_merchant[receipt] == NO_ID:
+                        self._receipt_merchant[receipt] = entity
+
+            self._adds_since_prune += 1
+            if self.max_receipts and len(self._receipt_ids) > self.max_receipts:
+                self._evict_oldest_locked()
+            elif self._adds_since_prune >= self.prune_every:
+                self._prune_locked()
+        return True
+
+    def neighbourhood(self, kind: str, key: str, days: float) -> Dict[str, int]:
+        """Distinct receipts, submitters and merchants linked to an entity"""
+        started = time.perf_counter()
+        cutoff = self.clock() - days * DAY_SECONDS
+        with self._lock:
+            entity = self._entity_ids.get((kind, key))
+            if entity is None:
+                counts = {"receipts": 0, "submitters": 0, "merchants": 0}
+            else:
+                receipts = self._postings[entity].since(cutoff)
+                counts = {
+                    "receipts": int(len(receipts)),
+                    "submitters": _distinct(
+                        self._receipt_submitter[receipts], self._submitter_marks
+                    ),
+                    "merchants": _distinct(
+                        self._receipt_merchant[receipts], self._entity_marks
+                    ),
+                }
+        self.query_us.add((time.perf_counter() - started) * 1e6)
+        return counts
+
+    def prune(self) -> int:
+        """Drop links older than the retention window"""
+        with self._lock:
+            return self._prune_locked()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            kinds = {kind: 0 for kind in ENTITY_KINDS}
+            for kind, _ in self._entity_ids:
+                kinds[kind] += 1
+            edges = sum(postings.size for postings in self._postings)
+            array_bytes = sum(postings.nbytes() for postings in self._postings)
+            array_bytes += (
+                self._submitter_marks.nbytes
+                + self._entity_marks.nbytes
+                + self._receipt_submitter.nbytes
+                + self._receipt_merchant.nbytes
+                + self._receipt_time.nbytes
+            )
+        return {
+            "receipts": len(self._receipt_ids),
+            "submitters": len(self._submitter_ids),
+            "entities": kinds,
+            "edges": edges,
+            "pruned_edges": self.pruned_edges,
+            "evicted_receipts": self.evicted_receipts,
+            "array_bytes": array_bytes,
+            "query_us": self.query_us.summary(),
+        }
+
+    def _intern(self, kind: str, key: str) -> int:
+        entity = self._entity_ids.get((kind, key))
+        if entity is None:
+            entity = len(self._postings)
+            self._entity_ids[(kind, key)] = entity
+            self._postings.append(_Postings())
+            self._entity_marks = _grown(self._entity_marks, entity + 1)
+        return entity
+
+    def _ensure_receipt_capacity(self, size: int) -> None:
+        capacity = len(self._receipt_time)
+        if size <= capacity:
+            return
+        self._receipt_time = _grown(self._receipt_time, size)
+        unassigned = np.full(len(self._receipt_time) - capacity, NO_ID, dtype=np.int32)
+        self._receipt_submitter = np.concatenate([self._receipt_submitter, unassigned])
+        self._receipt_merchant = np.concatenate([self._receipt_merchant, unassigned])
+
+    def _prune_locked(self) -> int:
+        cutoff = self.clock() - self.retention_days * DAY_SECONDS
+        self._adds_since_prune = 0
+        if self._oldest >= cutoff - PRUNE_SLACK_SECONDS:
+            return 0
+        return self._drop_before_locked(cutoff)
+
+    def _evict_oldest_locked(self) -> int:
+        """Drop the oldest receipts down to 3/4 of max_receipts"""
+        times = self._receipt_time[np.fromiter(self._receipt_ids.values(), dtype=np.int64)]
+        keep = max(1, self.max_receipts * 3 // 4)
+        # Receipts sharing the cutoff timestamp are all kept
+        cutoff = float(np.partition(times, len(times) - keep)[len(times) - keep])
+        retention_cutoff = self.clock() - self.retention_days * DAY_SECONDS
+        before = len(self._receipt_ids)
+        removed = self._drop_before_locked(max(cutoff, retention_cutoff))
+        self.evicted_receipts += before - len(self._receipt_ids)
+        self._adds_since_prune = 0
+        return removed
+
+    def _drop_before_locked(self, cutoff: float) -> int:
+        """Remove receipts and links older than cutoff, then renumber"""
+        removed = sum(postings.prune(cutoff) for postings in self._postings)
+        self.pruned_edges += removed
+
+        count = self._receipts
+        live = self._receipt_time[:count] >= cutoff
+        # Forgotten receipt IDs (e.g. after an earlier prune) are dead too
+        known = np.zeros(count, dtype=bool)
+        known[np.fromiter(self._receipt_ids.values(), dtype=np.int64)] = True
+        live &= known
+        kept = int(np.count_nonzero(live))
+        receipt_map = np.full(count, NO_ID, dtype=np.int32)
+        receipt_map[live] = np.arange(kept, dtype=np.int32)
+
+        # Entities that no longer link to any receipt
+        survivors = [
+            entity for entity, postings in enumerate(self._postings) if postings.size
+        ]
+        entity_map = np.full(len(self._postings), NO_ID, dtype=np.int32)
+        entity_map[survivors] = np.arange(len(survivors), dtype=np.int32)
+        self._postings = [self._postings[entity] for entity in survivors]
+        for postings in self._postings:
+            postings.receipts[: postings.size] = receipt_map[
+                postings.receipts[: postings.size]
+            ]
+        self._entity_ids = {
+            key: int(entity_map[entity])
+            for key, entity in self._entity_ids.items()
+            if entity_map[entity] != NO_ID
+        }
+
+        # Submitters that no longer have a receipt
+        submitters = self._receipt_submitter[:count][live]
+        used = np.unique(submitters[submitters != NO_ID])
+        submitter_map = np.full(len(self._submitter_ids), NO_ID, dtype=np.int32)
+        submitter_map[used] = np.arange(len(used), dtype=np.int32)
+        self._submitter_ids = {
+            submitter_id: int(submitter_map[submitter])
+            for submitter_id, submitter in self._submitter_ids.items()
+            if submitter_map[submitter] != NO_ID
+        }
+
+        capacity = _capacity(kept + 1)
+        receipt_time = np.zeros(capacity, dtype=np.float64)
+        receipt_time[:kept] = self._receipt_time[:count][live]
+        receipt_submitter = np.full(capacity, NO_ID, dtype=np.int32)
+        receipt_submitter[:kept] = _remapped(submitters, submitter_map)
+        receipt_merchant = np.full(capacity, NO_ID, dtype=np.int32)
+        receipt_merchant[:kept] = _remapped(
+            self._receipt_merchant[:count][live], entity_map
+        )
+        self._receipt_time = receipt_time
+        self._receipt_submitter = receipt_submitter
+        self._receipt_merchant = receipt_merchant
+        self._receipts = kept
+        self._receipt_ids = {
+            receipt_id: int(receipt_map[receipt])
+            for receipt_id, receipt in self._receipt_ids.items()
+            if receipt_map[receipt] != NO_ID
+        }
+        self._submitter_marks = np.zeros(_capacity(len(self._submitter_ids)), dtype=np.int32)
+        self._entity_marks = np.zeros(_capacity(len(self._postings)), dtype=np.int32)
+        self._oldest = float(receipt_time[:kept].min()) if kept else float("inf")
+        return removed
+
+
+def _distinct(ids: np.ndarray, marks: np.ndarray) -> int:
+    """
+    Number of distinct IDs in O(len(ids)) without sorting: every position
+    writes itself into marks[id]; repeated IDs keep only the last position,
+    so exactly one position per distinct ID reads itself back.
+    """
+    ids = ids[ids != NO_ID]
+    if not len(ids):
+        return 0
+    positions = np.arange(len(ids), dtype=np.int32)
+    marks[ids] = positions
+    return int(np.count_nonzero(marks[ids] == positions))
+
+
+def _remapped(ids: np.ndarray, mapping: np.ndarray) -> np.ndarray:
+    """ids translated through mapping, with NO_ID left as is"""
+    valid = ids != NO_ID
+    if not len(mapping):
+        return np.full(len(ids), NO_ID, dtype=np.int32)
+    return np.where(valid, mapping[np.where(valid, ids, 0)], NO_ID).astype(np.int32)
+
+
+def _capacity(size: int) -> int:
+    """Smallest doubling of 1024 that holds size elements"""
+    capacity = 1024
+    while capacity < size:
+        capacity *= 2
+    return capacity
+
+
+def _grown(array: np.ndarray, size: int) -> np.ndarray:
+    """array, doubled until it holds at least size elements"""
+    if size <= len(array):
+        return array
+    capacity = len(array)
+    while capacity < size:
+        capacity *= 2
+    grown = np.zeros(capacity, dtype=array.dtype)
+    grown[: len(array)] = array
+    return grown
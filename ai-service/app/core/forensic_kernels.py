@@ -0,0 +1,102 @@
+"""
+Noise and edge statistics for the forensic agent
+
+The single-image and batch paths both go through these functions, so a
+receipt gets the same scores whether it was analysed alone or in a batch.
+
+Laplacian variance uses a CV_16S Laplacian (exact for 8-bit input, border
+reflect-101 as before) and meanStdDev's double sums: about 4x faster than
+a CV_64F Laplacian followed by numpy's var(). OpenCV's per-image kernels
+beat a numpy pass over a stacked tensor at receipt sizes, so batches keep
+them and instead share the output buffers of each image size, reducing
+the edge counts of the whole stack at once.
+
+With a BufferArena the Laplacian and Canny outputs go into its reused
+buffers instead of fresh arrays.
+"""
+from typing import TYPE_CHECKING, Iterable, List, Optional, Sequence, Tuple
+
+from app.core.buffers import BufferArena, scratch
+
+if TYPE_CHECKING:
+    import numpy as np
+
+CANNY_LOW = 100
+CANNY_HIGH = 200
+
+
+def laplacian_variance(gray: "np.ndarray", dst: Optional["np.ndarray"] = None) -> float:
+    """Variance of the 3x3 Laplacian of an 8-bit image (or a crop of one)"""
+    import cv2
+
+    laplacian = cv2.Laplacian(gray, cv2.CV_16S, dst=dst)
+    _, std = cv2.meanStdDev(laplacian)
+    return float(std[0, 0]) ** 2
+
+
+def region_statistics(
+    gray: "np.ndarray", regions: "np.ndarray", arena: Optional[BufferArena] = None
+) -> Tuple[List[float], int]:
+    """Laplacian variance of each (x, y, w, h) region and Canny edge pixels over all of them"""
+    return crop_statistics(
+        (gray[y : y + h, x : x + w] for x, y, w, h in regions.tolist()), arena
+    )
+
+
+def crop_statistics(
+    crops: Iterable["np.ndarray"], arena: Optional[BufferArena] = None
+) -> Tuple[List[float], int]:
+    """Laplacian variance of each crop and Canny edge pixels over all of them"""
+    import cv2
+    import numpy as np
+
+    variances = []
+    edge_pixels = 0
+    for crop in crops:
+        variances.append(
+            laplacian_variance(crop, dst=scratch(arena, "stats.laplacian", crop.shape, np.int16))
+        )
+        edges = cv2.Canny(
+            crop, CANNY_LOW, CANNY_HIGH, edges=scratch(arena, "stats.edges", crop.shape, np.uint8)
+        )
+        edge_pixels += int(np.count_nonzero(edges))
+    return variances, edge_pixels
+
+
+def image_statistics(
+    gray: "np.ndarray", arena: Optional[BufferArena] = None
+) -> Tuple[float, int]:
+    """Laplacian variance and Canny edge pixel count of a whole image"""
+    import cv2
+    import numpy as np
+
+    variance = laplacian_variance(
+        gray, dst=scratch(arena, "stats.laplacian", gray.shape, np.int16)
+    )
+    edges = cv2.Canny(
+        gray, CANNY_LOW, CANNY_HIGH, edges=scratch(arena, "stats.edges", gray.shape, np.uint8)
+    )
+    return variance, int(np.count_nonzero(edges))
+
+
+def stack_statistics(
+    grays: Sequence["np.ndarray"], arena: Optional[BufferArena] = None
+) -> Tuple[List[float], List[int]]:
+    """Laplacian variance and Canny edge pixel count of each of several same-size images"""
+    import cv2
+    import numpy as np
+
+    count = len(grays)
+    shape = grays[0].shape
+    laplacian = scratch(arena, "stats.laplacian", shape, np.int16)
+    edges = scratch(arena, "stats.edge_stack", (count,) + shape, np.uint8)
+    variances = []
+    for index, gray in enumerate(grays):
+        if gray.shape != shape:
+            raise ValueError(f"Image {index} is {gray.shape}, expected {shape}")
+        variances.append(laplacian_variance(gray, dst=laplacian))
+        written = cv2.Canny(gray, CANNY_LOW, CANNY_HIGH, edges=edges[index])
+        if not np.shares_memory(written, edges):
+            edges[index] = written
+    edge_pixels = np.count_nonzero(edges.reshape(count, -1), axis=1)
+    return variances, [int(pixels) for pixels in edge_pixels]
@@ -0,0 +1,189 @@
+"""
+Idempotent analyses keyed by receipt
+
+When the backend's request times out and the user retries, the retry
+carries the same receipt_id (and image). Instead of starting a second
+analysis, the retry attaches to the one still running, or gets its result
+straight away if it finished within the TTL.
+
+The analysis itself runs as its own task. Callers only wait on it
+(shielded), so a caller that gives up does not cancel the work the next
+retry is about to attach to. Failed analyses, and results the caller
+marks as not worth keeping, are forgotten so the next request retries.
+If every caller has gone and none attaches within abandon_grace_seconds,
+the analysis is cancelled: no one is left to receive it.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    task: Optional[asyncio.Task] = None
+    result: Optional[Dict[str, Any]] = None
+    completed_at: float = 0.0
+    waiters: int = 0
+    abandon_timer: Optional[asyncio.TimerHandle] = None
+
+
+class IdempotencyStore:
+    """In-progress and recently completed analyses, by request key"""
+
+    def __init__(
+        self,
+        ttl_seconds: float = 600,
+        max_entries: int = 2000,
+        should_store: Optional[Callable[[Dict[str, Any]], bool]] = None,
+        abandon_grace_seconds: Optional[float] = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.should_store = should_store or (lambda result: True)
+        # None keeps unwaited analyses running to completion
+        self.abandon_grace_seconds = abandon_grace_seconds
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self.counters = {
+            "started": 0,
+            "joined": 0,
+            "stored_hits": 0,
+            "failed": 0,
+            "abandoned": 0,
+            "expired": 0,
+            "evicted": 0,
+        }
+
+    async def run(
+        self, key: Hashable, analyze: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Tuple[Dict[str, Any], str]:
+        """
+        Result for key, running analyze() only if no analysis for it is in
+        progress or stored. Returns (result, status) where status is
+        "started", "joined" or "stored". The result may be shared between
+        callers and must not be modified.
+        """
+        self._expire()
+        entry = self._entries.get(key)
+        if entry and entry.result is not None and self._expired(entry):
+            del self._entries[key]
+            self.counters["expired"] += 1
+            entry = None
+        if entry and entry.result is not None:
+            self.counters["stored_hits"] += 1
+            return entry.result, "stored"
+
+        if entry and entry.task:
+            self.counters["joined"] += 1
+            status = "joined"
+        else:
+            self.counters["started"] += 1
+            status = "started"
+            entry = self._entries[key] = _Entry()
+            entry.task = asyncio.create_task(self._execute(key, entry, analyze))
+            # Keeps a failure no caller is waiting for from being logged as unretrieved
+            entry.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+            self._evict()
+
+        entry.waiters += 1
+        if entry.abandon_timer:
+            entry.abandon_timer.cancel()
+            entry.abandon_timer = None
+        try:
+            return await asyncio.shield(entry.task), status
+        finally:
+            entry.waiters -= 1
+            if entry.waiters == 0 and entry.task and self.abandon_grace_seconds is not None:
+                entry.abandon_timer = asyncio.get_running_loop().call_later(
+                    self.abandon_grace_seconds, self._abandon, key, entry
+                )
+
+    async def _execute(
+        self,
+        key: Hashable,
+        entry: _Entry,
+        analyze: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        try:
+            result = await analyze()
+        except asyncio.CancelledError:
+            self._forget(key, entry)
+            raise
+        except BaseException:
+            self.counters["failed"] += 1
+            self._forget(key, entry)
+            raise
+        entry.task = None
+        if self.should_store(result):
+            entry.result = result
+            entry.completed_at = time.monotonic()
+        else:
+            self._forget(key, entry)
+        return result
+
+    def _abandon(self, key: Hashable, entry: _Entry) -> None:
+        entry.abandon_timer = None
+        if entry.waiters or not entry.task or entry.task.done():
+            return
+        logger.info(f"Cancelling analysis {key!r}: no caller left")
+        self.counters["abandoned"] += 1
+        entry.task.cancel()
+        self._forget(key, entry)
+
+    def _forget(self, key: Hashable, entry: _Entry) -> None:
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+
+    def _expired(self, entry: _Entry) -> bool:
+        return time.monotonic() - entry.completed_at > self.ttl_seconds
+
+    def _expire(self) -> None:
+        """Drop completed entries past the TTL, from the oldest started"""
+        expired = []
+        for key, entry in self._entries.items():
+            if entry.result is None:
+                continue  # still running
+            if not self._expired(entry):
+                break
+            expired.append(key)
+        for key in expired:
+            del self._entries[key]
+        self.counters["expired"] += len(expired)
+
+    def _evict(self) -> None:
+        """Keep at most max_entries, dropping the oldest completed ones"""
+        excess = len(self._entries) - self.max_entries
+        if excess <= 0:
+            return
+        evicted = []
+        for key, entry in self._entries.items():
+            if len(evicted) >= excess:
+                break
+            if entry.result is not None:
+                evicted.append(key)
+        for key in evicted:
+            del self._entries[key]
+        self.counters["evicted"] += len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        in_progress = sum(1 for entry in self._entries.values() if entry.task)
+        counters = self.counters
+        requests = counters["started"] + counters["joined"] + counters["stored_hits"]
+        return {
+            **counters,
+            "in_progress": in_progress,
+            "stored": len(self._entries) - in_progress,
+            "waiters": sum(entry.waiters for entry in self._entries.values()),
+            # Analyses not run because a retry reused another one
+            "deduplicated_rate": round(
+                (counters["joined"] + counters["stored_hits"]) / requests, 3
+            )
+            if requests
+            else 0.0,
+            "ttl_seconds": self.ttl_seconds,
+            "max_entries": self.max_entries,
+        }
@@ -0,0 +1,255 @@
+"""
+Streaming image header parser
+
+Walks JPEG segments / PNG chunks up to the first scan or IDAT and collects
+the raw EXIF (TIFF) block, XMP packet, ICC profile and text chunks without
+ever decoding pixel data. Bytes can be fed incrementally, so the same
+scanner works on a file on disk or on an upload that is still arriving.
+"""
+import re
+import struct
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+JPEG_SOI = b"\xff\xd8"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+EXIF_HEADER = b"Exif\x00\x00"
+XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+ICC_HEADER = b"ICC_PROFILE\x00"
+
+# SOF markers carry frame dimensions; C4 (DHT), C8 (JPG) and CC (DAC) do not
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8, 0xD9}
+
+CREATOR_TOOL_PATTERN = re.compile(
+    rb'xmp:CreatorTool(?:="([^"]*)"|>([^<]*)</xmp:CreatorTool>)'
+)
+
+READ_CHUNK_SIZE = 16 * 1024
+
+
+@dataclass
+class ImageHeaders:
+    """Raw header blocks found before the pixel data"""
+
+    format: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    exif: Optional[bytes] = None
+    xmp: Optional[bytes] = None
+    icc_profile: Optional[bytes] = None
+    text: Dict[str, str] = field(default_factory=dict)
+    bytes_scanned: int = 0
+
+    @property
+    def creator_tool(self) -> Optional[str]:
+        if not self.xmp:
+            return None
+        match = CREATOR_TOOL_PATTERN.search(self.xmp)
+        if not match:
+            return None
+        value = match.group(1) or match.group(2) or b""
+        return value.decode("utf-8", "replace").strip() or None
+
+    @property
+    def icc_description(self) -> Optional[str]:
+        if not self.icc_profile:
+            return None
+        return parse_icc_description(self.icc_profile)
+
+
+class ImageHeaderScanner:
+    """Incremental JPEG/PNG header scanner"""
+
+    def __init__(self):
+        self.headers = ImageHeaders()
+        self.done = False
+        self._buffer = bytearray()
+        self._offset = 0
+        self._icc_chunks: Dict[int, bytes] = {}
+
+    def feed(self, data: bytes) -> bool:
+        """Consume more bytes; returns True once the pixel data is reached"""
+        if self.done:
+            return True
+
+        self._buffer.extend(data)
+        self.headers.bytes_scanned += len(data)
+
+        if self.headers.format is None:
+            if len(self._buffer) < len(PNG_SIGNATURE):
+                return False
+            if self._buffer.startswith(JPEG_SOI):
+                self.headers.format = "JPEG"
+                self._offset = len(JPEG_SOI)
+            elif self._buffer.startswith(PNG_SIGNATURE):
+                self.headers.format = "PNG"
+                self._offset = len(PNG_SIGNATURE)
+            else:
+                self.headers.format = "UNKNOWN"
+                self._finish()
+                return True
+
+        if self.headers.format == "JPEG":
+            self._scan_jpeg()
+        else:
+            self._scan_png()
+
+        # Drop consumed bytes so the buffer never holds more than one segment
+        if self._offset:
+            del self._buffer[: self._offset]
+            self._offset = 0
+
+        return self.done
+
+    def close(self) -> ImageHeaders:
+        """Finish scanning (e.g. at EOF) and return what was collected"""
+        self._finish()
+        return self.headers
+
+    def _finish(self) -> None:
+        if self._icc_chunks and self.headers.icc_profile is None:
+            self.headers.icc_profile = b"".join(
+                self._icc_chunks[seq] for seq in sorted(self._icc_chunks)
+            )
+        self._buffer = bytearray()
+        self.done = True
+
+    def _scan_jpeg(self) -> None:
+        buf = self._buffer
+        while not self.done:
+            # Skip fill bytes before a marker
+            while self._offset < len(buf) and buf[self._offset] == 0xFF and (
+                self._offset + 1 < len(buf) and buf[self._offset + 1] == 0xFF
+            ):
+                self._offset += 1
+
+            if self._offset + 2 > len(buf):
+                return
+            if buf[self._offset] != 0xFF:
+                # Corrupt stream, stop rather than guess
+                self._finish()
+                return
+
+            marker = buf[self._offset + 1]
+            if marker in STANDALONE_MARKERS:
+                self._offset += 2
+                if marker == 0xD9:
+                    self._finish()
+                continue
+
+            if self._offset + 4 > len(buf):
+                return
+            (length,) = struct.unpack(">H", buf[self._offset + 2 : self._offset + 4])
+            end = self._offset + 2 + length
+            if marker == 0xDA:
+                # Start of scan: everything after this is entropy-coded pixels
+                self._finish()
+                return
+            if end > len(buf):
+                return
+
+            payload = bytes(buf[self._offset + 4 : end])
+            self._handle_jpeg_segment(marker, payload)
+            self._offset = end
+
+    def _handle_jpeg_segment(self, marker: int, payload: bytes) -> None:
+        if marker == 0xE1:
+            if payload.startswith(EXIF_HEADER) and self.headers.exif is None:
+                self.headers.exif = payload[len(EXIF_HEADER) :]
+            elif payload.startswith(XMP_HEADER) and self.headers.xmp is None:
+                self.headers.xmp = payload[len(XMP_HEADER) :]
+        elif marker == 0xE2 and payload.startswith(ICC_HEADER) and len(payload) > len(ICC_HEADER) + 2:
+            seq = payload[len(ICC_HEADER)]
+            self._icc_chunks[seq] = payload[len(ICC_HEADER) + 2 :]
+        elif marker == 0xFE:
+            self.headers.text.setdefault("Comment", payload.decode("latin-1").strip("\x00 "))
+        elif marker in SOF_MARKERS and len(payload) >= 5:
+            height, width = struct.unpack(">HH", payload[1:5])
+            self.headers.width, self.headers.height = width, height
+
+    def _scan_png(self) -> None:
+        buf = self._buffer
+        while not self.done:
+            if self._offset + 8 > len(buf):
+                return
+            length, chunk_type = struct.unpack(">I4s", buf[self._offset : self._offset + 8])
+            if chunk_type in (b"IDAT", b"IEND"):
+                self._finish()
+                return
+            end = self._offset + 8 + length + 4  # trailing CRC
+            if end > len(buf):
+                return
+
+            data = bytes(buf[self._offset + 8 : self._offset + 8 + length])
+            try:
+                self._handle_png_chunk(chunk_type, data)
+            except (ValueError, zlib.error, struct.error):
+                pass  # A damaged ancillary chunk should not abort the scan
+            self._offset = end
+
+    def _handle_png_chunk(self, chunk_type: bytes, data: bytes) -> None:
+        if chunk_type == b"IHDR":
+            self.headers.width, self.headers.height = struct.unpack(">II", data[:8])
+        elif chunk_type == b"eXIf":
+            self.headers.exif = data
+        elif chunk_type == b"iCCP":
+            _, rest = data.split(b"\x00", 1)
+            self.headers.icc_profile = zlib.decompress(rest[1:])
+        elif chunk_type == b"tEXt":
+            key, value = data.split(b"\x00", 1)
+            self.headers.text[key.decode("latin-1")] = value.decode("latin-1")
+        elif chunk_type == b"zTXt":
+            key, rest = data.split(b"\x00", 1)
+            self.headers.text[key.decode("latin-1")] = zlib.decompress(rest[1:]).decode("latin-1")
+        elif chunk_type == b"iTXt":
+            key, rest = data.split(b"\x00", 1)
+            compressed = rest[0] == 1
+            _, _, text = rest[2:].split(b"\x00", 2)
+            if compressed:
+                text = zlib.decompress(text)
+            if key == b"XML:com.adobe.xmp":
+                self.headers.xmp = text
+            else:
+                self.headers.text[key.decode("latin-1")] = text.decode("utf-8", "replace")
+
+
+def read_image_headers(image_path: str) -> ImageHeaders:
+    """Scan a file's headers, reading only as far as the pixel data"""
+    scanner = ImageHeaderScanner()
+    with open(image_path, "rb") as f:
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk or scanner.feed(chunk):
+                break
+    return scanner.close()
+
+
+def parse_icc_description(profile: bytes) -> Optional[str]:
+    """Return the 'desc' tag of an ICC profile (v2 'desc' or v4 'mluc')"""
+    try:
+        (tag_count,) = struct.unpack(">I", profile[128:132])
+        for i in range(tag_count):
+            entry = 132 + i * 12
+            signature, offset, size = struct.unpack(">4sII", profile[entry : entry + 12])
+            if signature != b"desc":
+                continue
+
+            tag = profile[offset : offset + size]
+            if tag[:4] == b"desc":
+                (count,) = struct.unpack(">I", tag[8:12])
+                return tag[12 : 12 + count].split(b"\x00", 1)[0].decode("latin-1").strip() or None
+            if tag[:4] == b"mluc":
+                records: List = []
+                (record_count,) = struct.unpack(">I", tag[8:12])
+                for r in range(record_count):
+                    rec = 16 + r * 12
+                    _, length, str_offset = struct.unpack(">4sII", tag[rec : rec + 12])
+                    records.append(tag[str_offset : str_offset + length].decode("utf-16-be"))
+                return records[0].strip("\x00 ") if records else None
+            return None
+    except (struct.error, UnicodeDecodeError):
+        return None
+    return None
@@ -0,0 +1,88 @@
+"""
+Image decoding helpers shared by the agents
+"""
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Any
+
+from PIL import Image
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# JPEG DCT-domain scaling supported by libjpeg through PIL's draft()
+DRAFT_SCALES = (1, 2, 4, 8)
+
+
+@dataclass
+class DecodedImage:
+    """Grayscale pixels plus how they were decoded"""
+
+    gray: "np.ndarray"
+    method: str
+    scale: int
+    source_size: tuple
+    decode_ms: float
+
+    @property
+    def array_bytes(self) -> int:
+        return int(self.gray.nbytes)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "method": self.method,
+            "scale": self.scale,
+            "source_size": list(self.source_size),
+            "decoded_size": [int(self.gray.shape[1]), int(self.gray.shape[0])],
+            "decode_ms": round(self.decode_ms, 2),
+            "array_bytes": self.array_bytes,
+        }
+
+
+def decode_grayscale(image_path: str, scale: int = 1) -> DecodedImage:
+    """
+    Decode an image straight to 8-bit grayscale, optionally downscaled.
+
+    JPEGs use draft() so libjpeg only reconstructs 1/scale of the DCT
+    coefficients and skips the colour conversion entirely. Other formats
+    are decoded in full and reduced with box filtering so scores stay
+    comparable across formats.
+    """
+    if scale not in DRAFT_SCALES:
+        raise ValueError(f"Unsupported decode scale {scale}, expected one of {DRAFT_SCALES}")
+
+    import numpy as np
+
+    started = time.perf_counter()
+    with Image.open(image_path) as img:
+        source_size = img.size
+        method = "full"
+
+        if scale > 1 and img.format == "JPEG":
+            img.draft("L", (source_size[0] // scale, source_size[1] // scale))
+            method = "draft"
+
+        gray_img = img.convert("L")
+        if scale > 1 and method != "draft":
+            gray_img = gray_img.reduce(scale)
+            method = "reduce"
+
+        gray = np.asarray(gray_img)
+
+    return DecodedImage(
+        gray=gray,
+        method=method,
+        scale=scale,
+        source_size=source_size,
+        decode_ms=(time.perf_counter() - started) * 1000,
+    )
+
+
+def file_sha256(image_path: str) -> str:
+    """Content hash of an image file, used as a cache and dedup key"""
+    digest = hashlib.sha256()
+    with open(image_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
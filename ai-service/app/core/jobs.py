@@ -0,0 +1,457 @@
+"""
+Asynchronous analysis job queue
+
+Submissions go into a bounded priority queue served by a fixed pool of
+worker tasks. When the queue is full callers get QueueFullError with a
+retry-after estimate instead of piling more work onto the event loop.
+Jobs can optionally be persisted to a local SQLite file so queued work
+survives a restart. Every uvicorn worker on the host shares that file, so
+each job row records the process that owns it and a restarted process only
+takes over jobs whose owner has died, claiming each one atomically.
+
+Finished jobs are POSTed to their callback_url only when its origin is in
+the configured allowlist and it does not resolve to a private, loopback or
+link-local address.
+"""
+import asyncio
+import ipaddress
+import itertools
+import json
+import logging
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.core.metrics import SampleWindow
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {"high": 0, "normal": 5, "low": 9}
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue cannot accept more work"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Analysis queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class CallbackRejected(ValueError):
+    """Raised for a callback URL the service must not POST to"""
+
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def _origin(url: str) -> Optional[str]:
+    """scheme://host[:port] of an absolute http(s) URL, None for anything else"""
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return None
+    if parts.scheme not in _DEFAULT_PORTS or not parts.hostname:
+        return None
+    host = f"[{parts.hostname}]" if ":" in parts.hostname else parts.hostname
+    origin = f"{parts.scheme}://{host}"
+    if port and port != _DEFAULT_PORTS[parts.scheme]:
+        origin += f":{port}"
+    return origin
+
+
+def _internal_address(host: str) -> bool:
+    """True for IP literals that are not publicly routable"""
+    try:
+        address = ipaddress.ip_address(host.split("%", 1)[0])
+    except ValueError:
+        return False
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return not address.is_global or address.is_multicast
+
+
+def parse_origins(value: str) -> List[str]:
+    """Comma-separated allowlist setting -> normalized origins"""
+    origins = []
+    for entry in value.split(","):
+        origin = _origin(entry)
+        if entry.strip() and origin is None:
+            logger.warning(f"Ignoring invalid callback origin: {entry.strip()}")
+        elif origin:
+            origins.append(origin)
+    return origins
+
+
+def check_callback_url(url: str, allowed_origins: Iterable[str]) -> str:
+    """The URL, if its origin is allowed and its host is not an internal IP literal"""
+    origin = _origin(url)
+    if origin is None:
+        raise CallbackRejected("callback_url must be an absolute http(s) URL")
+    parts = urlsplit(url.strip())
+    if parts.username or parts.password:
+        raise CallbackRejected("callback_url must not contain credentials")
+    if origin not in allowed_origins:
+        raise CallbackRejected(f"callback_url origin {origin} is not allowed")
+    if _internal_address(parts.hostname):
+        raise CallbackRejected(f"callback_url host {parts.hostname} is not a public address")
+    return url.strip()
+
+
+async def check_callback_target(url: str) -> None:
+    """Every address the callback host resolves to must be public (no DNS tricks)"""
+    parts = urlsplit(url)
+    port = parts.port or _DEFAULT_PORTS[parts.scheme]
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            parts.hostname, port, type=socket.SOCK_STREAM
+        )
+    except socket.gaierror as e:
+        raise CallbackRejected(f"callback_url host {parts.hostname} does not resolve: {e}")
+    for *_, sockaddr in infos:
+        if _internal_address(sockaddr[0]):
+            raise CallbackRejected(
+                f"callback_url host {parts.hostname} resolves to internal address {sockaddr[0]}"
+            )
+
+
+@dataclass
+class AnalysisJob:
+    receipt_id: str
+    image_url: str
+    priority: str = "normal"
+    callback_url: Optional[str] = None
+    submitter_id: Optional[str] = None
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    def public(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("callback_url")
+        if self.started_at:
+            data["wait_seconds"] = round(self.started_at - self.submitted_at, 3)
+        if self.finished_at and self.started_at:
+            data["service_seconds"] = round(self.finished_at - self.started_at, 3)
+        return data
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by another user
+    return True
+
+
+class JobStore:
+    """
+    SQLite persistence for jobs (optional)
+
+    The connection is shared by the asyncio.to_thread calls of one process,
+    so every use of it holds a lock. Rows carry the owning process
+    ("<pid>:<random>") so processes sharing the file never run each
+    other's jobs.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS analysis_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    submitted_at REAL NOT NULL,
+                    owner TEXT
+                )
+                """
+            )
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(analysis_jobs)")]
+            if "owner" not in columns:
+                # Files written before jobs had owners
+                try:
+                    self._conn.execute("ALTER TABLE analysis_jobs ADD COLUMN owner TEXT")
+                except sqlite3.OperationalError:
+                    pass  # another worker added it first
+            self._conn.commit()
+
+    def save(self, job: AnalysisJob) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis_jobs "
+                "(job_id, payload, status, submitted_at, owner) VALUES (?, ?, ?, ?, ?)",
+                (
+                    job.job_id,
+                    json.dumps(asdict(job), default=str),
+                    job.status,
+                    job.submitted_at,
+                    self.owner,
+                ),
+            )
+            self._conn.commit()
+
+    def claim_unfinished(self) -> List[AnalysisJob]:
+        """
+        Take over queued/running jobs whose owner process is gone
+
+        Each claim is a compare-and-set on (status, owner), so when several
+        workers restart together every job is claimed by exactly one.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, payload, status, owner FROM analysis_jobs "
+                "WHERE status IN ('queued', 'running') ORDER BY submitted_at"
+            ).fetchall()
+            claimed = []
+            for job_id, payload, status, owner in rows:
+                if owner and not self._orphaned(owner):
+                    continue
+                cursor = self._conn.execute(
+                    "UPDATE analysis_jobs SET status = 'queued', owner = ? "
+                    "WHERE job_id = ? AND status = ? AND owner IS ?",
+                    (self.owner, job_id, status, owner),
+                )
+                self._conn.commit()
+                if cursor.rowcount == 1:
+                    job = AnalysisJob(**json.loads(payload))
+                    job.status = "queued"
+                    claimed.append(job)
+            return claimed
+
+    def _orphaned(self, owner: str) -> bool:
+        if owner == self.owner:
+            return False
+        pid = owner.split(":", 1)[0]
+        return not pid.isdigit() or int(pid) == os.getpid() or not _process_alive(int(pid))
+
+    def load(self, job_id: str) -> Optional[AnalysisJob]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM analysis_jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return AnalysisJob(**json.loads(row[0])) if row else None
+
+    def purge(self, older_than: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM analysis_jobs WHERE status IN ('completed', 'failed') "
+                "AND submitted_at < ?",
+                (older_than,),
+            )
+            self._conn.commit()
+
+
+class AnalysisJobQueue:
+    """Bounded priority queue of receipt analyses with a fixed worker pool"""
+
+    def __init__(
+        self,
+        run_job: Callable[[AnalysisJob], Awaitable[Dict[str, Any]]],
+        max_size: int = 50,
+        workers: int = 2,
+        db_path: Optional[str] = None,
+        result_ttl_seconds: int = 3600,
+        max_finished: int = 1000,
+        callback_origins: Iterable[str] = (),
+    ):
+        self.run_job = run_job
+        self.max_size = max_size
+        self.worker_count = workers
+        self.result_ttl_seconds = result_ttl_seconds
+        self.max_finished = max_finished
+        self.callback_origins = frozenset(callback_origins)
+        self.store = JobStore(db_path) if db_path else None
+
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers = []
+        self._jobs: "OrderedDict[str, AnalysisJob]" = OrderedDict()
+        self._sequence = itertools.count()
+        self._busy = 0
+
+        self.wait_times = SampleWindow()
+        self.service_times = SampleWindow()
+        self.counters = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+    async def start(self) -> None:
+        if self._queue is not None:
+            return
+        # The depth bound is enforced in submit() so restored jobs always fit
+        self._queue = asyncio.PriorityQueue()
+
+        if self.store:
+            # Anything queued or mid-flight in a process that has since
+            # stopped runs again, here or in whichever worker claimed it first
+            for job in await asyncio.to_thread(self.store.claim_unfinished):
+                self._jobs[job.job_id] = job
+                self._enqueue(job)
+            if self._jobs:
+                logger.info(f"Restored {len(self._jobs)} unfinished analysis jobs")
+
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.worker_count)
+        ]
+        logger.info(
+            f"Analysis job queue started: {self.worker_count} workers, max depth {self.max_size}"
+        )
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(
+        self,
+        receipt_id: str,
+        image_url: str,
+        priority: str = "normal",
+        callback_url: Optional[str] = None,
+        submitter_id: Optional[str] = None,
+    ) -> AnalysisJob:
+        if self._queue is None:
+            raise RuntimeError("Job queue not started")
+        if callback_url is not None:
+            callback_url = check_callback_url(callback_url, self.callback_origins)
+        if self._queue.qsize() >= self.max_size:
+            self.counters["rejected"] += 1
+            raise QueueFullError(self.retry_after())
+
+        job = AnalysisJob(
+            receipt_id=receipt_id,
+            image_url=image_url,
+            priority=priority,
+            callback_url=callback_url,
+            submitter_id=submitter_id,
+        )
+        self._enqueue(job)
+        self._jobs[job.job_id] = job
+        self.counters["submitted"] += 1
+        await self._persist(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[AnalysisJob]:
+        job = self._jobs.get(job_id)
+        if job is None and self.store:
+            job = await asyncio.to_thread(self.store.load, job_id)
+        return job
+
+    def retry_after(self) -> int:
+        """Seconds until a queue slot is likely free, from the recent service time"""
+        service = self.service_times.mean() or 10.0
+        return max(1, math.ceil(service / max(self.worker_count, 1)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self._queue.qsize() if self._queue else 0,
+            "max_size": self.max_size,
+            "workers": self.worker_count,
+            "busy_workers": self._busy,
+            "wait_seconds": self.wait_times.summary(),
+            "service_seconds": self.service_times.summary(),
+            **self.counters,
+        }
+
+    def _enqueue(self, job: AnalysisJob) -> None:
+        rank = PRIORITIES.get(job.priority, PRIORITIES["normal"])
+        self._queue.put_nowait((rank, next(self._sequence), job.job_id))
+
+    async def _persist(self, job: AnalysisJob) -> None:
+        if not self.store:
+            return
+        try:
+            await asyncio.to_thread(self.store.save, job)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to persist job {job.job_id}: {str(e)}")
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None:
+                self._queue.task_done()
+                continue
+
+            self._busy += 1
+            job.status = "running"
+            job.started_at = time.time()
+            self.wait_times.add(job.started_at - job.submitted_at)
+            await self._persist(job)
+
+            try:
+                job.result = await self.run_job(job)
+                job.status = "completed"
+                self.counters["completed"] += 1
+            except asyncio.CancelledError:
+                job.status = "queued"
+                await self._persist(job)
+                raise
+            except Exception as e:
+                logger.error(f"Analysis job {job.job_id} failed: {str(e)}")
+                job.status = "failed"
+                job.error = str(e)
+                self.counters["failed"] += 1
+            finally:
+                self._busy -= 1
+                self._queue.task_done()
+
+            job.finished_at = time.time()
+            self.service_times.add(job.finished_at - job.started_at)
+            await self._persist(job)
+            await self._evict_finished()
+
+            if job.callback_url:
+                await self._send_callback(job)
+
+    async def _evict_finished(self) -> None:
+        cutoff = time.time() - self.result_ttl_seconds
+        finished = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.status in ("completed", "failed")
+        ]
+        excess = len(finished) - self.max_finished
+        for job_id in finished:
+            job = self._jobs[job_id]
+            if excess > 0 or job.finished_at < cutoff:
+                del self._jobs[job_id]
+                excess -= 1
+        if self.store:
+            await asyncio.to_thread(self.store.purge, cutoff)
+
+    async def _send_callback(self, job: AnalysisJob) -> None:
+        try:
+            # Checked again: restored jobs predate the current allowlist, and
+            # the host's DNS can change after submission
+            url = check_callback_url(job.callback_url, self.callback_origins)
+            await check_callback_target(url)
+        except CallbackRejected as e:
+            logger.warning(f"Callback for job {job.job_id} refused: {str(e)}")
+            return
+        try:
+            async with httpx.AsyncClient(follow_redirects=False) as client:
+                response = await client.post(url, json=job.public(), timeout=10.0)
+                response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Callback for job {job.job_id} failed: {str(e)}")
@@ -0,0 +1,110 @@
+"""
+Incremental JSON field parser
+
+Gemini streams its JSON answer in chunks of a few dozen tokens. JSONFieldStream
+is fed those chunks and reports each top-level field of the object as soon as
+its value is complete, so work that needs only one field (account numbers,
+merchant name) can start while the rest is still being generated. Text before
+the opening brace (a ```json fence) and after the closing one is ignored.
+The full response is still parsed normally at the end; this only gives early
+sight of it.
+"""
+import json
+from typing import Any, List, Optional, Tuple
+
+WHITESPACE = " \t\r\n"
+
+
+class JSONFieldStream:
+    """Yields (key, value) for each completed top-level field of a streamed object"""
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._expect = "key"  # key | colon | value
+        self._key: Optional[str] = None
+        self._key_start: Optional[int] = None
+        self._value_start: Optional[int] = None
+        self.done = False
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """Consume the next chunk; returns the fields it completed"""
+        if self.done or not text:
+            return []
+        self._buffer += text
+        fields: List[Tuple[str, Any]] = []
+        buffer = self._buffer
+
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect == "key":
+                        self._key = self._decode(buffer[self._key_start : i + 1])
+                        self._expect = "colon"
+                continue
+
+            if self._depth == 0:
+                # Anything before the object (markdown fences) is skipped
+                if char == "{":
+                    self._depth = 1
+                    self._expect = "key"
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    if self._expect == "key":
+                        self._key_start = i
+                    elif self._value_start is None:
+                        self._value_start = i
+            elif char in "{[":
+                if self._depth == 1 and self._value_start is None:
+                    self._value_start = i
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete(buffer, i, fields)
+                    self.done = True
+                    break
+            elif self._depth == 1:
+                if char == ":":
+                    self._expect = "value"
+                    self._value_start = None
+                elif char == ",":
+                    self._complete(buffer, i, fields)
+                    self._expect = "key"
+                elif self._expect == "value" and self._value_start is None and char not in WHITESPACE:
+                    # Numbers, true/false/null
+                    self._value_start = i
+
+        self._pos = len(buffer)
+        return fields
+
+    def _complete(self, buffer: str, end: int, fields: List[Tuple[str, Any]]) -> None:
+        """Decode the value that just ended at buffer[end]"""
+        if self._key is not None and self._value_start is not None:
+            raw = buffer[self._value_start : end].strip()
+            try:
+                fields.append((self._key, json.loads(raw)))
+            except ValueError:
+                pass  # malformed value; the final parse decides what to do
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+
+    @staticmethod
+    def _decode(raw: str) -> Optional[str]:
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
@@ -0,0 +1,172 @@
+"""
+Priority-aware load shedding
+
+Every request is matched to a route class. Critical classes (health probes,
+metrics) are always admitted. Other classes have a priority and an optional
+in-flight limit; the last `reserved` slots of the shared in-flight budget
+are kept for high-priority classes (account checks), so a burst of
+analyses cannot starve them. Low-priority work is also shed while the event
+loop is lagging, since admitting more of it only makes the lag worse.
+
+Shed requests get 429 (their class is at its own limit) or 503 (the service
+as a whole is overloaded), both with Retry-After. This is a plain ASGI
+middleware so streamed responses stay counted until their last byte.
+"""
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = ("critical", "high", "low")
+
+
+@dataclass
+class RouteClass:
+    name: str
+    priority: str  # critical | high | low
+    # (method or "*", path prefix) pairs; the longest matching prefix wins
+    # and "/" only matches itself
+    routes: Tuple[Tuple[str, str], ...] = ()
+    max_inflight: Optional[int] = None
+
+    def __post_init__(self):
+        if self.priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{self.priority}'")
+
+
+class LoadSheddingMiddleware:
+    """ASGI middleware admitting requests by route class and priority"""
+
+    def __init__(
+        self,
+        app,
+        classes: List[RouteClass],
+        default_class: str = "default",
+        max_inflight: int = 64,
+        reserved: int = 16,
+        lag_limit_ms: Optional[float] = None,
+        lag_source: Optional[Callable[[], float]] = None,
+        retry_after: int = 5,
+        metrics_name: Optional[str] = "load_shedding",
+    ):
+        self.app = app
+        self.classes = {route_class.name: route_class for route_class in classes}
+        if default_class not in self.classes:
+            raise ValueError(f"Default route class '{default_class}' is not defined")
+        self.default_class = self.classes[default_class]
+        self.max_inflight = max_inflight
+        self.reserved = reserved
+        self.lag_limit_ms = lag_limit_ms
+        self.lag_source = lag_source
+        self.retry_after = retry_after
+
+        # Longest prefix first so /api/analyze-receipt/jobs beats /api/analyze-receipt
+        self._routes = sorted(
+            (
+                (prefix, method, route_class)
+                for route_class in classes
+                for method, prefix in route_class.routes
+            ),
+            key=lambda route: len(route[0]),
+            reverse=True,
+        )
+        self.inflight = 0
+        self.counters: Dict[str, Dict[str, int]] = {
+            name: {"inflight": 0, "admitted": 0, "shed_429": 0, "shed_503": 0}
+            for name in self.classes
+        }
+        # Starlette builds middleware lazily, so it registers its own metrics
+        if metrics_name:
+            metrics.register(metrics_name, self.stats)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route_class = self._classify(scope["method"], scope["path"])
+        counters = self.counters[route_class.name]
+        rejection = self._admission(route_class)
+        if rejection:
+            status, reason = rejection
+            counters[f"shed_{status}"] += 1
+            logger.warning(
+                f"Shed {scope['method']} {scope['path']} ({route_class.name}): {reason}"
+            )
+            await self._reject(send, status, reason)
+            return
+
+        self.inflight += 1
+        counters["inflight"] += 1
+        counters["admitted"] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.inflight -= 1
+            counters["inflight"] -= 1
+
+    def _classify(self, method: str, path: str) -> RouteClass:
+        for prefix, route_method, route_class in self._routes:
+            if route_method in ("*", method) and (
+                path == prefix or (prefix != "/" and path.startswith(prefix + "/"))
+            ):
+                return route_class
+        return self.default_class
+
+    def _admission(self, route_class: RouteClass) -> Optional[Tuple[int, str]]:
+        """None to admit, else (status code, reason)"""
+        if route_class.priority == "critical":
+            return None
+
+        inflight = self.counters[route_class.name]["inflight"]
+        if route_class.max_inflight is not None and inflight >= route_class.max_inflight:
+            return 429, f"{inflight} {route_class.name} requests already in flight"
+
+        # High priority may use the reserved slots; low priority may not
+        budget = self.max_inflight
+        if route_class.priority == "low":
+            budget -= self.reserved
+        if self.inflight >= budget:
+            return 503, f"service at capacity ({self.inflight} requests in flight)"
+
+        if route_class.priority == "low" and self.lag_limit_ms and self.lag_source:
+            lag_ms = self.lag_source()
+            if lag_ms >= self.lag_limit_ms:
+                return 503, f"event loop lagging {lag_ms:.0f} ms"
+        return None
+
+    async def _reject(self, send, status: int, reason: str) -> None:
+        body = json.dumps(
+            {"success": False, "error": "Service overloaded", "message": reason}
+        ).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(self.retry_after).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "reserved": self.reserved,
+            "classes": {
+                name: {
+                    "priority": self.classes[name].priority,
+                    "max_inflight": self.classes[name].max_inflight,
+                    **counters,
+                }
+                for name, counters in self.counters.items()
+            },
+        }
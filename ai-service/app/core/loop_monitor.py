@@ -0,0 +1,160 @@
+"""
+Event loop lag monitor
+
+A sampler task sleeps for a fixed interval and measures how late it wakes
+up; the overshoot is the time the loop spent running something else
+without yielding. Lag percentiles are exported under /metrics.
+
+In debug mode a watchdog thread also watches the sampler's heartbeat. When
+the loop has not ticked for longer than the threshold it grabs the loop
+thread's stack with sys._current_frames(), so the log names the coroutine
+and the exact call (sync Firestore .get(), OpenCV, file I/O...) that is
+holding the loop.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from app.core.metrics import SampleWindow
+
+logger = logging.getLogger(__name__)
+
+CO_COROUTINE = 0x0080
+
+
+class LoopLagMonitor:
+    """Measures event loop lag and optionally captures blocking stacks"""
+
+    def __init__(
+        self,
+        interval: float = 0.25,
+        block_threshold: float = 0.1,
+        capture_stacks: bool = False,
+        stack_depth: int = 12,
+    ):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.capture_stacks = capture_stacks
+        self.stack_depth = stack_depth
+
+        self.lag_ms = SampleWindow()
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.blocked = 0
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=50)
+
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self._pending: Optional[Dict[str, Any]] = None
+
+    async def start(self) -> None:
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._sample())
+        if self.capture_stacks:
+            self._watchdog = threading.Thread(
+                target=self._watch, name="loop-watchdog", daemon=True
+            )
+            self._watchdog.start()
+        logger.info(
+            f"Loop lag monitor started (every {self.interval * 1000:.0f} ms, "
+            f"stacks {'on' if self.capture_stacks else 'off'})"
+        )
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    async def _sample(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+
+            lag = max(0.0, now - started - self.interval)
+            lag_ms = lag * 1000
+            self.lag_ms.add(lag_ms)
+            self.last_lag_ms = lag_ms
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag >= self.block_threshold:
+                self.blocked += 1
+                self._settle_event(lag_ms)
+
+    def _settle_event(self, lag_ms: float) -> None:
+        """Record a blocking episode once the loop is running again"""
+        event = self._pending or {"at": time.time()}
+        self._pending = None
+        event["blocked_ms"] = round(lag_ms, 1)
+        self.events.append(event)
+
+        if "stack" in event:
+            logger.warning(
+                f"Event loop blocked for {lag_ms:.0f} ms in {event['coroutine']}:\n"
+                + "\n".join(event["stack"])
+            )
+        else:
+            logger.warning(f"Event loop blocked for {lag_ms:.0f} ms")
+
+    def _watch(self) -> None:
+        """Watchdog thread: snapshot the loop thread's stack while it is stuck"""
+        limit = self.interval + self.block_threshold
+        while not self._stop.wait(self.block_threshold / 2):
+            stalled = time.monotonic() - self._heartbeat
+            if stalled < limit or self._pending is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            self._pending = {
+                "at": time.time(),
+                "coroutine": _blocking_coroutine(frame),
+                "stack": _format_stack(frame, self.stack_depth),
+            }
+
+    def current_lag_ms(self) -> float:
+        """Lag of the latest sample, or how long the loop has been stalled"""
+        stalled_ms = (time.monotonic() - self._heartbeat - self.interval) * 1000
+        return max(self.last_lag_ms, stalled_ms) if self._task else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "lag_ms": self.lag_ms.summary(),
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "blocked": self.blocked,
+            "block_threshold_ms": self.block_threshold * 1000,
+            "capture_stacks": self.capture_stacks,
+            "recent_blocks": list(self.events)[-5:],
+        }
+
+
+def _blocking_coroutine(frame) -> str:
+    """Innermost coroutine on the stack (the one that did not yield)"""
+    while frame is not None:
+        if frame.f_code.co_flags & CO_COROUTINE:
+            # co_qualname is Python 3.11+
+            return getattr(frame.f_code, "co_qualname", frame.f_code.co_name)
+        frame = frame.f_back
+    return "<no coroutine>"
+
+
+def _format_stack(frame, depth: int) -> List[str]:
+    return [
+        f"{entry.filename}:{entry.lineno} in {entry.name}"
+        for entry in traceback.extract_stack(frame)[-depth:]
+    ]
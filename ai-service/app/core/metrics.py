@@ -0,0 +1,56 @@
+"""
+In-process metrics registry
+
+Components register a snapshot function under a name; GET /metrics returns
+every snapshot as JSON. No external metrics backend is required.
+"""
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+_sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register(name: str, source: Callable[[], Dict[str, Any]]) -> None:
+    """Expose a component's counters under /metrics -> name"""
+    _sources[name] = source
+
+
+def snapshot() -> Dict[str, Any]:
+    result = {}
+    for name, source in list(_sources.items()):
+        try:
+            result[name] = source()
+        except Exception as e:
+            logger.warning(f"Metrics source '{name}' failed: {str(e)}")
+            result[name] = {"error": str(e)}
+    return result
+
+
+def percentiles(values: Iterable[float], points=(50, 95, 99)) -> Dict[str, float]:
+    """Nearest-rank percentiles, e.g. {"p50": .., "p95": .., "p99": ..}"""
+    ordered = sorted(values)
+    if not ordered:
+        return {f"p{p}": 0.0 for p in points}
+    last = len(ordered) - 1
+    return {f"p{p}": round(ordered[min(last, int(round(p / 100 * last)))], 3) for p in points}
+
+
+class SampleWindow:
+    """Keeps the most recent N samples of a measurement"""
+
+    def __init__(self, size: int = 1000):
+        self.samples: Deque[float] = deque(maxlen=size)
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        self.samples.append(value)
+        self.count += 1
+
+    def mean(self) -> float:
+        return sum(self.samples) / len(self.samples) if self.samples else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {"count": self.count, "mean": round(self.mean(), 3), **percentiles(self.samples)}
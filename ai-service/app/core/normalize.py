@@ -0,0 +1,263 @@
+"""
+Image ingestion normalization
+
+Runs once per analysis, before any agent decodes the image:
+
+- Decompression bombs are rejected from the header dimensions alone, before
+  a single pixel is decoded. The limit is on the pixels that would have to
+  be held in memory: JPEGs can be decoded at 1/8 scale through draft(), so
+  only other formats are held to the full pixel count.
+- Images above the pixel budget are downscaled (JPEG via draft, then a
+  high-quality resize), so no agent ever works on more than the budget.
+- EXIF orientation is applied, so text lines are horizontal for the text
+  detector and Gemini.
+- The colour mode becomes RGB: transparent PNG screenshots are composited
+  onto white and palette, grayscale, CMYK and 16-bit images are converted.
+
+Images that need none of this (the common phone JPEG) are passed through
+untouched. Otherwise the normalized copy is written next to the original,
+under a unique name since concurrent analyses may normalize the same file:
+JPEGs keep their quantization tables and chroma subsampling so compression
+forensics stay meaningful, everything else becomes PNG. The original is
+still what the metadata agent reads, since the copy carries no EXIF.
+"""
+import logging
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from app.core.imaging import DRAFT_SCALES
+from app.core.metrics import SampleWindow
+
+logger = logging.getLogger(__name__)
+
+EXIF_ORIENTATION = 0x0112
+# Bytes per pixel of each decoded mode, for the memory estimate
+MODE_BYTES = {"1": 1, "L": 1, "P": 1, "LA": 2, "RGB": 3, "RGBA": 4, "CMYK": 4, "I;16": 2, "I": 4, "F": 4}
+
+
+class ImageRejectedError(ValueError):
+    """The image is too large to decode safely"""
+
+
+def decodable_pixels(format: Optional[str], width: int, height: int) -> int:
+    """Fewest pixels an image of this format and size can be decoded to"""
+    pixels = width * height
+    if format == "JPEG":
+        return pixels // (DRAFT_SCALES[-1] ** 2)
+    return pixels
+
+
+def check_dimensions(
+    format: Optional[str], width: Optional[int], height: Optional[int], max_decode_pixels: int
+) -> None:
+    """Raise ImageRejectedError when even the smallest decode exceeds the limit"""
+    if not width or not height:
+        return
+    if decodable_pixels(format, width, height) > max_decode_pixels:
+        raise ImageRejectedError(
+            f"Image of {width}x{height} ({width * height / 1e6:.0f} MP) exceeds the "
+            f"{max_decode_pixels / 1e6:.0f} MP decode limit"
+        )
+
+
+@dataclass
+class NormalizedImage:
+    """Where the agents should read the image from, and what was changed"""
+
+    path: str
+    source_path: str
+    source_size: Tuple[int, int]
+    size: Tuple[int, int]
+    source_mode: str
+    changes: list = field(default_factory=list)
+    # Largest decoded pixel buffers held at once, estimated from their modes
+    peak_pixel_bytes: int = 0
+    normalize_ms: float = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "changes": self.changes,
+            "source_size": list(self.source_size),
+            "size": list(self.size),
+            "source_mode": self.source_mode,
+            "peak_pixel_bytes": self.peak_pixel_bytes,
+            "normalize_ms": round(self.normalize_ms, 2),
+        }
+
+
+class ImageNormalizer:
+    """Guards and normalizes images before analysis"""
+
+    def __init__(self, max_pixels: int = 16_000_000, max_decode_pixels: int = 40_000_000):
+        self.max_pixels = max_pixels
+        self.max_decode_pixels = max_decode_pixels
+        self.counters = {
+            "images": 0,
+            "unchanged": 0,
+            "rejected": 0,
+            "downscaled": 0,
+            "rotated": 0,
+            "converted": 0,
+        }
+        self.peak_pixel_bytes = SampleWindow()
+        self.normalize_ms = SampleWindow()
+
+    def normalize(self, image_path: str) -> NormalizedImage:
+        """Normalize one image (blocking; run in a worker thread)"""
+        started = time.perf_counter()
+        self.counters["images"] += 1
+        try:
+            img = Image.open(image_path)
+        except Image.DecompressionBombError as e:
+            # Beyond even PIL's own limit
+            self.counters["rejected"] += 1
+            raise ImageRejectedError(str(e)) from e
+        with img:
+            # Only the header has been read at this point
+            try:
+                check_dimensions(img.format, img.width, img.height, self.max_decode_pixels)
+            except ImageRejectedError:
+                self.counters["rejected"] += 1
+                raise
+
+            result = NormalizedImage(
+                path=image_path,
+                source_path=image_path,
+                source_size=img.size,
+                size=img.size,
+                source_mode=img.mode,
+            )
+            orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+            oversized = img.width * img.height > self.max_pixels
+            if not oversized and orientation in (0, 1) and img.mode in ("RGB", "L"):
+                self.counters["unchanged"] += 1
+                return self._finish(result, started)
+
+            source_format = img.format
+            save_options = self._save_options(img)
+            if oversized and img.format == "JPEG":
+                # Let libjpeg decode at reduced scale
+                img.draft(img.mode, self._draft_target(img.size))
+                if img.size != result.source_size:
+                    result.changes.append(f"draft 1/{result.source_size[0] // img.size[0]}")
+            img.load()
+            peak = self._bytes(img)
+
+            if img.width * img.height > self.max_pixels:
+                ratio = (self.max_pixels / (img.width * img.height)) ** 0.5
+                target = (max(1, int(img.width * ratio)), max(1, int(img.height * ratio)))
+                resized = img.resize(target, Image.LANCZOS, reducing_gap=2.0)
+                peak = max(peak, self._bytes(img) + self._bytes(resized))
+                resized.info = img.info
+                img = resized
+            if img.size != result.source_size:
+                result.changes.append("downscaled")
+                self.counters["downscaled"] += 1
+
+            if orientation not in (0, 1):
+                transposed = ImageOps.exif_transpose(img)
+                peak = max(peak, self._bytes(img) + self._bytes(transposed))
+                img = transposed
+                result.changes.append(f"orientation {orientation}")
+                self.counters["rotated"] += 1
+
+            if img.mode not in ("RGB", "L"):
+                converted = self._to_rgb(img)
+                peak = max(peak, self._bytes(img) + self._bytes(converted))
+                result.changes.append(f"{img.mode} -> RGB")
+                self.counters["converted"] += 1
+                img = converted
+
+            result.size = img.size
+            result.peak_pixel_bytes = peak
+            result.path = self._write(image_path, img, source_format, save_options)
+        return self._finish(result, started)
+
+    def _finish(self, result: NormalizedImage, started: float) -> NormalizedImage:
+        if not result.peak_pixel_bytes and result.changes == []:
+            # Untouched: the agents decode it themselves, at most once in full
+            width, height = result.source_size
+            result.peak_pixel_bytes = width * height * MODE_BYTES.get(result.source_mode, 4)
+        result.normalize_ms = (time.perf_counter() - started) * 1000
+        self.peak_pixel_bytes.add(result.peak_pixel_bytes)
+        self.normalize_ms.add(result.normalize_ms)
+        if result.changes:
+            logger.info(f"Normalized {os.path.basename(result.source_path)}: {', '.join(result.changes)}")
+        return result
+
+    def _draft_target(self, size: Tuple[int, int]) -> Tuple[int, int]:
+        """
+        Requested draft size: the first DCT scale that fits the budget, so
+        the full-resolution pixels are never held. PIL picks the largest
+        scale whose result is not below the request.
+        """
+        width, height = size
+        for scale in DRAFT_SCALES:
+            if (width // scale) * (height // scale) <= self.max_pixels:
+                break
+        return -(-width // scale), -(-height // scale)
+
+    @staticmethod
+    def _bytes(img: Image.Image) -> int:
+        return img.width * img.height * MODE_BYTES.get(img.mode, 4)
+
+    @staticmethod
+    def _to_rgb(img: Image.Image) -> Image.Image:
+        if img.mode == "P":
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        if img.mode in ("RGBA", "LA", "PA"):
+            rgba = img.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            return background
+        if img.mode.startswith("I"):
+            # 16-bit PNGs: keep the top 8 bits
+            img = img.convert("I").point(lambda value: value * (1 / 256)).convert("L")
+        return img.convert("RGB")
+
+    @staticmethod
+    def _save_options(img: Image.Image) -> Dict[str, Any]:
+        if img.format != "JPEG":
+            return {}
+        from PIL import JpegImagePlugin
+
+        options: Dict[str, Any] = {}
+        if getattr(img, "quantization", None):
+            options["qtables"] = img.quantization
+        sampling = JpegImagePlugin.get_sampling(img)
+        if sampling >= 0:
+            options["subsampling"] = sampling
+        return options
+
+    @staticmethod
+    def _write(
+        image_path: str, img: Image.Image, source_format: Optional[str], options: Dict[str, Any]
+    ) -> str:
+        directory, name = os.path.split(os.path.splitext(image_path)[0])
+        jpeg = source_format == "JPEG" and img.mode in ("RGB", "L")
+        suffix = ".normalized.jpg" if jpeg else ".normalized.png"
+        handle, path = tempfile.mkstemp(prefix=f"{name}.", suffix=suffix, dir=directory)
+        try:
+            with os.fdopen(handle, "wb") as f:
+                if jpeg:
+                    img.save(f, format="JPEG", **options)
+                else:
+                    img.save(f, format="PNG", compress_level=1)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "max_pixels": self.max_pixels,
+            "max_decode_pixels": self.max_decode_pixels,
+            "peak_pixel_bytes": self.peak_pixel_bytes.summary(),
+            "normalize_ms": self.normalize_ms.summary(),
+        }
@@ -0,0 +1,213 @@
+"""
+Per-request profiling
+
+SamplingProfiler is a background thread that snapshots every thread's
+Python stack with sys._current_frames() at a fixed interval and folds them
+into "frame;frame;frame" -> samples counts (the flamegraph.pl / speedscope
+input format). cpu_timed() wraps one awaitable and measures the CPU time
+spent in its own steps on the event loop thread, which is how agents that
+interleave on one loop get separate CPU figures. Work it hands to the
+CancellableExecutor is measured on the worker thread and reported back
+through add_offloaded_cpu(), so pool-bound agents are not shown as idle.
+
+Nothing here runs unless a request opts in, so there is no cost otherwise.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Awaitable, Dict, List, Optional
+
+# Leaf frames of threads that are parked, not working
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("thread.py", "_worker"),
+    ("queue.py", "get"),
+}
+
+
+class SamplingProfiler:
+    """Wall-clock stack sampler for every thread in the process"""
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.thread_samples: Counter = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+        self._duration = 0.0
+
+    def start(self) -> "SamplingProfiler":
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(
+            target=self._run, name="request-profiler", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self._duration = time.perf_counter() - self._started
+        return self
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = self._fold(frame)
+                self.samples += 1
+                if stack is None:
+                    self.idle_samples += 1
+                    continue
+                self.stacks[stack] += 1
+                self.thread_samples[names.get(ident, str(ident))] += 1
+
+    def _fold(self, frame) -> Optional[str]:
+        code = frame.f_code
+        if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+            return None
+        frames: List[str] = []
+        while frame is not None and len(frames) < self.max_depth:
+            code = frame.f_code
+            frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(frames))
+
+    def folded(self) -> str:
+        """Folded stacks, one "stack count" line each"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def summary(self, limit: int = 10) -> Dict[str, Any]:
+        """Compact flame summary: hottest stacks and self time per function"""
+        busy = sum(self.stacks.values())
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+
+        def share(count: int) -> float:
+            return round(100 * count / busy, 1) if busy else 0.0
+
+        return {
+            "interval_ms": self.interval * 1000,
+            "duration_ms": round(self._duration * 1000, 2),
+            "samples": self.samples,
+            "busy_samples": busy,
+            "threads": dict(self.thread_samples.most_common()),
+            "top_functions": [
+                {"function": leaf, "samples": count, "percent": share(count)}
+                for leaf, count in leaves.most_common(limit)
+            ],
+            "top_stacks": [
+                {"stack": _tail(stack), "samples": count, "percent": share(count)}
+                for stack, count in self.stacks.most_common(limit)
+            ],
+        }
+
+
+def _tail(stack: str, frames: int = 8) -> str:
+    """The innermost frames of a folded stack"""
+    parts = stack.split(";")
+    return ";".join(parts[-frames:]) if len(parts) > frames else stack
+
+
+# Worker-thread CPU seconds of the awaitable being measured by cpu_timed(),
+# a one-item list; tasks it creates inherit it along with the context
+_offloaded_cpu: ContextVar[Optional[List[float]]] = ContextVar("offloaded_cpu", default=None)
+
+
+def add_offloaded_cpu(seconds: float) -> None:
+    """Credit CPU time used on another thread to the awaitable being measured, if any"""
+    offloaded = _offloaded_cpu.get()
+    if offloaded is not None:
+        offloaded[0] += seconds
+
+
+class _CPUTimed:
+    """Awaitable proxy that adds up thread CPU time of each step it drives"""
+
+    def __init__(self, awaitable: Awaitable[Any], timing: Dict[str, Any]):
+        self._awaitable = awaitable
+        self._timing = timing
+
+    def __await__(self):
+        offloaded = [0.0]
+        outer = _offloaded_cpu.get()
+        _offloaded_cpu.set(offloaded)
+        steps = self._awaitable.__await__()
+        value, error = None, None
+        cpu = 0.0
+        try:
+            while True:
+                started = time.thread_time()
+                try:
+                    if error is not None:
+                        yielded = steps.throw(error)
+                    else:
+                        yielded = steps.send(value)
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    cpu += time.thread_time() - started
+                try:
+                    value, error = (yield yielded), None
+                except BaseException as e:
+                    value, error = None, e
+        finally:
+            _offloaded_cpu.set(outer)
+            self._timing["cpu_ms"] = round((cpu + offloaded[0]) * 1000, 2)
+            self._timing["offloaded_cpu_ms"] = round(offloaded[0] * 1000, 2)
+
+
+def cpu_timed(awaitable: Awaitable[Any], timing: Dict[str, Any]) -> Awaitable[Any]:
+    """
+    Await awaitable, recording its CPU time as timing["cpu_ms"]: its own
+    steps on the event loop plus its executor jobs, the latter also as
+    timing["offloaded_cpu_ms"]
+    """
+    return _CPUTimed(awaitable, timing)
+
+
+def stage_times(nodes: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Wall and CPU milliseconds per pipeline node from a GraphRun report"""
+    return {
+        name: {
+            "status": timing.get("status"),
+            "wall_ms": timing.get("duration_ms", 0.0),
+            "cpu_ms": timing.get("cpu_ms"),
+            "offloaded_cpu_ms": timing.get("offloaded_cpu_ms"),
+        }
+        for name, timing in nodes.items()
+    }
+
+
+def write_profile(
+    directory: str, name: str, report: Dict[str, Any], folded: str
+) -> Dict[str, str]:
+    """
+    Write <name>.json (summary) and <name>.folded (full stacks). name comes
+    from the request, so anything but [A-Za-z0-9_-] is replaced to keep the
+    files inside directory.
+    """
+    os.makedirs(directory, exist_ok=True)
+    safe_name = re.sub(r"[^A-Za-z0-9_-]", "_", name)[:64] or "profile"
+    base = os.path.join(directory, f"{safe_name}-{int(time.time() * 1000)}")
+    with open(base + ".json", "w") as f:
+        json.dump(report, f, indent=2)
+    with open(base + ".folded", "w") as f:
+        f.write(folded)
+    return {"summary": base + ".json", "folded": base + ".folded"}
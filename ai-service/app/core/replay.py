@@ -0,0 +1,208 @@
+"""
+Record/replay of external calls
+
+In record mode each Gemini response and Firestore query result is written
+to REPLAY_DIR together with how long it took. In replay mode the same
+calls are answered from those files, after sleeping for the recorded
+latency times REPLAY_LATENCY_SCALE, so load tests reproduce production
+behaviour without Gemini spend or Firestore reads. Streamed calls also keep
+when each chunk arrived and are replayed chunk by chunk on that schedule.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.core.metrics import SampleWindow
+
+logger = logging.getLogger(__name__)
+
+REPLAY_MODES = ("off", "record", "replay")
+
+
+class ReplayMissError(LookupError):
+    """Raised in replay mode when a call was never recorded"""
+
+
+class TrafficReplay:
+    """Wraps external calls so they can be recorded to or served from disk"""
+
+    def __init__(self, mode: str, directory: str, latency_scale: float = 1.0):
+        if mode not in REPLAY_MODES:
+            raise ValueError(f"Unknown replay mode '{mode}', expected one of {REPLAY_MODES}")
+        self.mode = mode
+        self.directory = directory
+        self.latency_scale = latency_scale
+        self._latency: Dict[str, SampleWindow] = defaultdict(SampleWindow)
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"recorded": 0, "replayed": 0, "misses": 0}
+        )
+        if mode != "off":
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, kind: str, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+        return os.path.join(self.directory, kind, f"{digest}.json")
+
+    async def call(
+        self, kind: str, key: str, fetch: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Run fetch() (off/record) or return its recorded result (replay).
+        kind groups calls ("vision", "firestore"); key identifies the request
+        and must be stable across runs. Results must be JSON serializable.
+        """
+        if self.mode == "replay":
+            return await self._replay(kind, key)
+
+        started = time.perf_counter()
+        result = await fetch()
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        if self.mode == "record":
+            await self._record(kind, key, latency_ms, result)
+        return result
+
+    async def call_streamed(
+        self,
+        kind: str,
+        key: str,
+        fetch: Callable[[Callable[[str], None]], Awaitable[str]],
+        on_chunk: Callable[[str], None],
+    ) -> str:
+        """
+        Like call() for a streamed text response. fetch(on_chunk) calls
+        on_chunk for each piece of text and returns the whole text. Records
+        keep (offset ms, text length so far) per chunk; replays deliver the
+        same pieces at the same offsets. Entries recorded without chunks are
+        replayed as a single chunk.
+        """
+        if self.mode == "replay":
+            return await self._replay(kind, key, on_chunk)
+
+        started = time.perf_counter()
+        chunks: List[List[float]] = []
+        received = 0
+
+        def record_chunk(text: str) -> None:
+            nonlocal received
+            received += len(text)
+            chunks.append([round((time.perf_counter() - started) * 1000, 2), received])
+            on_chunk(text)
+
+        result = await fetch(record_chunk if self.mode == "record" else on_chunk)
+        if self.mode == "record":
+            latency_ms = (time.perf_counter() - started) * 1000
+            await self._record(kind, key, latency_ms, result, chunks=chunks)
+        return result
+
+    async def _record(
+        self, kind: str, key: str, latency_ms: float, result: Any, **extra: Any
+    ) -> None:
+        entry = {
+            "kind": kind,
+            "key": key,
+            "latency_ms": round(latency_ms, 2),
+            "recorded_at": time.time(),
+            "result": result,
+            **extra,
+        }
+        await asyncio.to_thread(self._write, self._path(kind, key), entry)
+        self._counters[kind]["recorded"] += 1
+        self._latency[kind].add(latency_ms)
+
+    async def _replay(
+        self, kind: str, key: str, on_chunk: Optional[Callable[[str], None]] = None
+    ) -> Any:
+        path = self._path(kind, key)
+        try:
+            entry = await asyncio.to_thread(self._read, path)
+        except FileNotFoundError:
+            self._counters[kind]["misses"] += 1
+            raise ReplayMissError(f"No recorded {kind} response for {key[:80]}")
+
+        delay_ms = entry["latency_ms"] * self.latency_scale
+        result = entry["result"]
+        if on_chunk and isinstance(result, str):
+            chunks = entry.get("chunks") or [[entry["latency_ms"], len(result)]]
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            sent = 0
+            for offset_ms, end in chunks:
+                wait = started + offset_ms * self.latency_scale / 1000 - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                on_chunk(result[sent:end])
+                sent = end
+            remaining = started + delay_ms / 1000 - loop.time()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+        elif delay_ms > 0:
+            await asyncio.sleep(delay_ms / 1000)
+        self._counters[kind]["replayed"] += 1
+        self._latency[kind].add(delay_ms)
+        return result
+
+    def save_image(self, image_path: str, image_hash: str) -> None:
+        """Keep a copy of a recorded input so the traffic can be replayed later"""
+        if self.mode != "record":
+            return
+        extension = os.path.splitext(image_path)[1]
+        target = os.path.join(self.directory, "images", image_hash + extension)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(image_path, target)
+
+    @staticmethod
+    def _write(path: str, entry: Dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f, default=str)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read(path: str) -> Dict[str, Any]:
+        with open(path) as f:
+            return json.load(f)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "directory": self.directory,
+            "latency_scale": self.latency_scale,
+            "calls": {
+                kind: {**counts, "latency_ms": self._latency[kind].summary()}
+                for kind, counts in self._counters.items()
+            },
+        }
+
+
+async def passthrough(
+    replay: Optional[TrafficReplay],
+    kind: str,
+    key: str,
+    fetch: Callable[[], Awaitable[Any]],
+) -> Any:
+    """replay.call() when a harness is configured, otherwise just fetch()"""
+    if replay is None:
+        return await fetch()
+    return await replay.call(kind, key, fetch)
+
+
+async def passthrough_streamed(
+    replay: Optional[TrafficReplay],
+    kind: str,
+    key: str,
+    fetch: Callable[[Callable[[str], None]], Awaitable[str]],
+    on_chunk: Callable[[str], None],
+) -> str:
+    """replay.call_streamed() when a harness is configured, otherwise fetch(on_chunk)"""
+    if replay is None:
+        return await fetch(on_chunk)
+    return await replay.call_streamed(kind, key, fetch, on_chunk)
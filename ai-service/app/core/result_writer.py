@@ -0,0 +1,348 @@
+"""
+Write-behind persistence of analysis results to Firestore
+
+A result sink: record() only appends to an in-memory buffer, so analyses
+never wait on Firestore. A background task flushes the buffer with batched
+writes of up to 500 documents (Firestore's per-batch limit) whenever a full
+batch is waiting or the flush window has passed. Failed batches are retried
+a bounded number of times; batches that still fail, and records arriving
+while the buffer is at its limit, are appended to a local JSONL spill file
+and written back once Firestore accepts writes again. A spill file is only
+deleted once every record read back from it has been committed (or spilled
+again), so a crash while writing back replays it instead of losing it.
+
+Documents go to one collection, keyed "<receipt_id>_<recorded_at ms>" so a
+re-written spill record overwrites itself instead of duplicating.
+"""
+import asyncio
+import glob
+import json
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.core.metrics import SampleWindow
+
+logger = logging.getLogger(__name__)
+
+FIRESTORE_BATCH_LIMIT = 500
+
+Record = Tuple[str, Dict[str, Any]]
+# (buffered at, record, spill file it was read back from)
+Buffered = Tuple[float, Record, Optional[str]]
+
+
+def firestore_safe(value: Any, in_array: bool = False) -> Any:
+    """
+    Plain JSON-compatible data Firestore accepts: numpy scalars become
+    Python numbers, NaN becomes None, and arrays nested directly in arrays
+    (unsupported by Firestore) are stored as JSON strings.
+    """
+    if isinstance(value, dict):
+        return {str(key): firestore_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if in_array:
+            return json.dumps(firestore_safe(list(value)), default=str)
+        return [firestore_safe(item, in_array=True) for item in value]
+    if hasattr(value, "item") and callable(value.item):
+        # numpy scalars (np.float64, np.bool_, ...)
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def build_document(
+    receipt_id: str, agent_results: Dict[str, Any], final: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Audit document: the verdict plus every agent's raw output"""
+    return firestore_safe(
+        {
+            "receipt_id": receipt_id,
+            "recorded_at": time.time(),
+            "trust_score": final.get("trust_score"),
+            "verdict": final.get("verdict"),
+            "issues": final.get("issues", []),
+            "recommendation": final.get("recommendation"),
+            "agents": agent_results,
+        }
+    )
+
+
+class FirestoreResultWriter:
+    """Buffers analysis documents and writes them to Firestore in batches"""
+
+    def __init__(
+        self,
+        db_factory: Callable[[], Any],
+        collection: str = "analysis_results",
+        batch_size: int = FIRESTORE_BATCH_LIMIT,
+        flush_seconds: float = 2.0,
+        max_retries: int = 3,
+        retry_base_seconds: float = 0.5,
+        max_backlog: int = 5000,
+        spill_dir: Optional[str] = None,
+    ):
+        self.db_factory = db_factory
+        self.collection = collection
+        self.batch_size = min(batch_size, FIRESTORE_BATCH_LIMIT)
+        self.flush_seconds = flush_seconds
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.max_backlog = max_backlog
+        self.spill_dir = spill_dir
+        # One spill file per process, so uvicorn workers never interleave lines
+        self.spill_path = (
+            os.path.join(spill_dir, f"results-{os.getpid()}.jsonl") if spill_dir else None
+        )
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+        self._buffer: Deque[Buffered] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._recovering = None  # open spill file being written back
+        self._recovering_path: Optional[str] = None
+        # Claimed spill files -> records read back but not yet committed
+        self._unsettled: Dict[str, int] = {}
+        self._read_through: set = set()
+        self._stopping = False
+        # After a batch fails for good, Firestore is left alone for a while
+        self._failures = 0
+        self._resume_at = 0.0
+
+        self.counters = {
+            "recorded": 0,
+            "written": 0,
+            "batches": 0,
+            "retries": 0,
+            "failed_batches": 0,
+            "spilled": 0,
+            "recovered": 0,
+            "dropped": 0,
+        }
+        self.flush_ms = SampleWindow()
+        self.batch_sizes = SampleWindow()
+
+    async def record(
+        self, receipt_id: str, agent_results: Dict[str, Any], final: Dict[str, Any]
+    ) -> None:
+        """Result sink hook called by the orchestrator after each analysis"""
+        document = build_document(receipt_id, agent_results, final)
+        doc_id = f"{receipt_id}_{int(document['recorded_at'] * 1000)}"
+        self.counters["recorded"] += 1
+        if len(self._buffer) >= self.max_backlog:
+            # Firestore is not keeping up; park it on disk instead of growing
+            await asyncio.to_thread(self._spill, [(doc_id, document)])
+            return
+        self._buffer.append((time.monotonic(), (doc_id, document), None))
+        self._ensure_started()
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while await self._flush_batch():
+                    if len(self._buffer) < self.batch_size:
+                        break
+            except Exception as e:
+                logger.error(f"Result writer flush failed: {str(e)}")
+
+    async def _flush_batch(self) -> bool:
+        """Write up to one batch; returns whether anything was taken"""
+        if time.monotonic() < self._resume_at:
+            return False
+        if len(self._buffer) < self.batch_size and self.spill_dir:
+            await asyncio.to_thread(self._recover, self.batch_size - len(self._buffer))
+        if not self._buffer:
+            return False
+        batch, sources = self._take_batch()
+
+        started = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            try:
+                await asyncio.to_thread(self._commit, batch)
+                break
+            except Exception as e:
+                if attempt == self.max_retries or self._stopping:
+                    self.counters["failed_batches"] += 1
+                    self._failures += 1
+                    pause = min(60.0, self.flush_seconds * 2**self._failures)
+                    self._resume_at = time.monotonic() + pause
+                    logger.error(
+                        f"Result batch of {len(batch)} failed after {attempt + 1} attempts, "
+                        f"pausing writes for {pause:.0f}s: {str(e)}"
+                    )
+                    if await asyncio.to_thread(self._spill, batch):
+                        await asyncio.to_thread(self._settle, sources)
+                    return False
+                self.counters["retries"] += 1
+                await asyncio.sleep(self.retry_base_seconds * 2**attempt)
+
+        self._failures = 0
+        await asyncio.to_thread(self._settle, sources)
+        self.flush_ms.add((time.perf_counter() - started) * 1000)
+        self.batch_sizes.add(len(batch))
+        self.counters["batches"] += 1
+        self.counters["written"] += len(batch)
+        return True
+
+    def _take_batch(self) -> Tuple[List[Record], List[Optional[str]]]:
+        taken = [
+            self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))
+        ]
+        return [record for _, record, _ in taken], [source for _, _, source in taken]
+
+    def _settle(self, sources: List[Optional[str]]) -> None:
+        """Records from these spill files are safe; delete files fully written back"""
+        for source in sources:
+            if source is not None:
+                self._unsettled[source] -= 1
+        for path in [p for p in self._read_through if not self._unsettled.get(p)]:
+            self._read_through.discard(path)
+            self._unsettled.pop(path, None)
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.error(f"Failed to remove written-back spill file {path}: {str(e)}")
+
+    def _commit(self, batch: List[Record]) -> None:
+        db = self.db_factory()
+        write = db.batch()
+        collection = db.collection(self.collection)
+        for doc_id, document in batch:
+            write.set(collection.document(doc_id), document)
+        write.commit()
+
+    def _spill(self, batch: List[Record]) -> bool:
+        """Append records to the spill file; returns whether they were kept"""
+        if not self.spill_path:
+            self.counters["dropped"] += len(batch)
+            logger.error(f"Dropped {len(batch)} analysis results (no spill directory)")
+            return False
+        try:
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for doc_id, document in batch:
+                    f.write(json.dumps({"id": doc_id, "document": document}) + "\n")
+            self.counters["spilled"] += len(batch)
+            return True
+        except OSError as e:
+            self.counters["dropped"] += len(batch)
+            logger.error(f"Failed to spill {len(batch)} analysis results: {str(e)}")
+            return False
+
+    def _recover(self, limit: int) -> None:
+        """Move up to limit spilled records back into the buffer"""
+        recovered = 0
+        while recovered < limit:
+            if self._recovering is None and not self._claim_spill_file():
+                break
+            line = self._recovering.readline()
+            if not line:
+                # Deleted by _settle once its records are committed
+                self._recovering.close()
+                self._read_through.add(self._recovering_path)
+                self._recovering = self._recovering_path = None
+                self._settle([])
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn final line from a crash mid-write
+            path = self._recovering_path
+            self._buffer.append((time.monotonic(), (entry["id"], entry["document"]), path))
+            self._unsettled[path] = self._unsettled.get(path, 0) + 1
+            recovered += 1
+        self.counters["recovered"] += recovered
+
+    def _claim_spill_file(self) -> bool:
+        """
+        Take ownership of a spill file (ours, one left by an earlier process,
+        or one a crashed worker was writing back) by renaming it, so no other
+        worker replays it too
+        """
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, "results-*.jsonl*"))):
+            base, _, owner = path.partition(".recovering-")
+            if path in self._unsettled:
+                continue  # ours, still being written back
+            # Our own PID on a file we never claimed is a previous incarnation
+            # (containers restart with the same PID)
+            if owner and int(owner) != os.getpid() and _process_alive(int(owner)):
+                continue
+            claimed = f"{base}.recovering-{os.getpid()}"
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue  # claimed by another worker first
+            self._recovering = open(claimed, encoding="utf-8")
+            self._recovering_path = claimed
+            return True
+        return False
+
+    async def drain(self) -> None:
+        """Flush everything buffered (shutdown); what cannot be written is spilled"""
+        self._stopping = True
+        if self._task:
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+        while self._buffer:
+            batch, sources = self._take_batch()
+            try:
+                await asyncio.to_thread(self._commit, batch)
+                self.counters["batches"] += 1
+                self.counters["written"] += len(batch)
+            except Exception as e:
+                logger.error(f"Result batch failed during shutdown: {str(e)}")
+                if not await asyncio.to_thread(self._spill, batch):
+                    continue
+            await asyncio.to_thread(self._settle, sources)
+        if self._recovering:
+            # Put the unread rest back where the next process will find it
+            self._recovering.close()
+            os.rename(self._recovering_path, self._recovering_path.rsplit(".recovering-", 1)[0])
+            self._recovering = self._recovering_path = None
+
+    def stats(self) -> Dict[str, Any]:
+        spill_bytes = 0
+        if self.spill_dir:
+            spill_bytes = sum(
+                os.path.getsize(path)
+                for path in glob.glob(os.path.join(self.spill_dir, "results-*"))
+                if os.path.exists(path)
+            )
+        oldest = self._buffer[0][0] if self._buffer else None
+        return {
+            **self.counters,
+            "collection": self.collection,
+            "backlog": len(self._buffer),
+            "oldest_buffered_seconds": round(time.monotonic() - oldest, 3) if oldest else 0.0,
+            "spill_bytes": spill_bytes,
+            "flush_ms": self.flush_ms.summary(),
+            "batch_size": self.batch_sizes.summary(),
+        }
@@ -0,0 +1,203 @@
+"""
+Layout fingerprints for known receipt templates
+
+A fingerprint is a 64-bit perceptual hash of the whole slip plus a coarse
+grid of where text boxes sit. Canonical screenshots of each bank app's
+transfer slip are fingerprinted once into an index file; incoming receipts
+are matched against it with a nearest-neighbour search.
+
+    python -m app.core.templates build templates/ --out templates.json
+
+where templates/<template_name>/ holds one or more genuine screenshots and
+an optional meta.json ({"institution": "Opay", "fields": [...]}).
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from app.core.imaging import decode_grayscale
+from app.core.text_regions import detect_text_regions
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+GRID_ROWS = 16
+GRID_COLS = 8
+# Weight of the text-box grid against phash bits in the L1 match distance
+GEOMETRY_WEIGHT = 4.0
+# Coverage change that marks a grid cell as deviating from the template
+DEVIATING_CELL_DELTA = 0.25
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+
+@dataclass
+class LayoutFingerprint:
+    """Perceptual hash bits and text-box occupancy grid of one image"""
+
+    hash_bits: "np.ndarray"  # (64,) of 0/1
+    grid: "np.ndarray"  # (GRID_ROWS, GRID_COLS) text coverage per cell, 0-1
+
+    def vector(self) -> "np.ndarray":
+        import numpy as np
+
+        return np.concatenate([self.hash_bits, self.grid.ravel() * GEOMETRY_WEIGHT])
+
+
+def layout_fingerprint(image_path: str, scale: int = 4) -> LayoutFingerprint:
+    """Fingerprint an image from a reduced grayscale decode (blocking)"""
+    import cv2
+    import imagehash
+    import numpy as np
+    from PIL import Image
+
+    gray = decode_grayscale(image_path, scale).gray
+    hash_bits = imagehash.phash(Image.fromarray(gray)).hash.ravel().astype(np.float64)
+
+    mask = np.zeros(gray.shape, dtype=np.float32)
+    for x, y, w, h in detect_text_regions(gray).tolist():
+        mask[y : y + h, x : x + w] = 1.0
+    grid = cv2.resize(mask, (GRID_COLS, GRID_ROWS), interpolation=cv2.INTER_AREA)
+
+    return LayoutFingerprint(hash_bits=hash_bits, grid=grid.astype(np.float64))
+
+
+@dataclass
+class TemplateMatch:
+    template: str
+    institution: Optional[str]
+    fields: List[str]
+    hash_distance: int
+    layout_distance: float
+    # [row, col] grid cells whose text coverage differs from the template
+    deviating_cells: List[List[int]] = field(default_factory=list)
+
+
+class TemplateIndex:
+    """Nearest-neighbour index over template exemplar fingerprints"""
+
+    def __init__(self, templates: List[Dict[str, Any]]):
+        import numpy as np
+        from sklearn.neighbors import NearestNeighbors
+
+        self.templates = templates
+        self._labels: List[int] = []
+        vectors = []
+        for i, template in enumerate(templates):
+            for exemplar in template["exemplars"]:
+                vectors.append(exemplar)
+                self._labels.append(i)
+        self._vectors = np.asarray(vectors, dtype=np.float64)
+
+        self._nn = None
+        if len(self._vectors):
+            # L1 on 0/1 hash bits is the Hamming distance
+            self._nn = NearestNeighbors(n_neighbors=1, metric="manhattan")
+            self._nn.fit(self._vectors)
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+    @classmethod
+    def load(cls, path: str) -> "TemplateIndex":
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["templates"])
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump({"version": 1, "templates": self.templates}, f)
+
+    def nearest(self, fingerprint: LayoutFingerprint) -> Optional[TemplateMatch]:
+        if self._nn is None:
+            return None
+        import numpy as np
+
+        vector = fingerprint.vector()
+        _, indices = self._nn.kneighbors(vector.reshape(1, -1))
+        exemplar = self._vectors[indices[0, 0]]
+        template = self.templates[self._labels[indices[0, 0]]]
+
+        hash_distance = int(np.abs(exemplar[:HASH_BITS] - vector[:HASH_BITS]).sum())
+        grid_delta = (vector[HASH_BITS:] - exemplar[HASH_BITS:]) / GEOMETRY_WEIGHT
+        grid_delta = grid_delta.reshape(GRID_ROWS, GRID_COLS)
+        deviating = np.argwhere(np.abs(grid_delta) > DEVIATING_CELL_DELTA)
+        return TemplateMatch(
+            template=template["name"],
+            institution=template.get("institution"),
+            fields=template.get("fields", []),
+            hash_distance=hash_distance,
+            layout_distance=round(float(np.abs(grid_delta).mean()), 4),
+            deviating_cells=deviating.tolist(),
+        )
+
+
+def build_index(directory: str) -> TemplateIndex:
+    """Fingerprint every exemplar under directory/<template_name>/"""
+    templates = []
+    for template_dir in sorted(glob.glob(os.path.join(directory, "*"))):
+        if not os.path.isdir(template_dir):
+            continue
+        meta_path = os.path.join(template_dir, "meta.json")
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+
+        exemplars = [
+            layout_fingerprint(path).vector().round(4).tolist()
+            for path in sorted(glob.glob(os.path.join(template_dir, "*")))
+            if path.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+        if not exemplars:
+            logger.warning(f"No exemplar images for template {template_dir}")
+            continue
+        templates.append(
+            {
+                "name": os.path.basename(template_dir),
+                "institution": meta.get("institution"),
+                "fields": meta.get("fields", []),
+                "exemplars": exemplars,
+            }
+        )
+    return TemplateIndex(templates)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build or query a template index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Fingerprint template exemplars")
+    build.add_argument("directory")
+    build.add_argument("--out", default="templates.json")
+    match = commands.add_parser("match", help="Match images against an index")
+    match.add_argument("index")
+    match.add_argument("images", nargs="+")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        index = build_index(args.directory)
+        index.save(args.out)
+        exemplars = sum(len(t["exemplars"]) for t in index.templates)
+        print(f"Wrote {len(index)} templates ({exemplars} exemplars) to {args.out}")
+        return 0
+
+    index = TemplateIndex.load(args.index)
+    for image_path in args.images:
+        started = time.perf_counter()
+        found = index.nearest(layout_fingerprint(image_path))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        summary = found.__dict__ if found else None
+        print(json.dumps({"image": image_path, "match": summary, "ms": round(elapsed_ms, 2)}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
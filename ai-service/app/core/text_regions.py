@@ -0,0 +1,140 @@
+"""
+Local text detection
+A row profile for the fast pre-screen's "is there text at all" check, and a
+morphological-gradient + connected-components detector that finds text
+boxes so forensic tests can run on text areas only.
+"""
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+from app.core.buffers import BufferArena, scratch
+from app.core.imaging import decode_grayscale
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Intensity step between neighbouring pixels that counts as a glyph edge
+EDGE_STEP = 40
+# Share of a row's pixels that must be glyph edges for it to count as text
+TEXT_ROW_DENSITY = 0.02
+# Minimum height (rows) of a text line at the analysed scale
+MIN_LINE_HEIGHT = 2
+
+
+def text_line_profile(gray: "np.ndarray") -> Dict[str, Any]:
+    """Text lines as runs of rows with dense horizontal intensity changes"""
+    import numpy as np
+
+    if gray.shape[0] < 2 or gray.shape[1] < 2:
+        return {"text_lines": 0, "text_row_fraction": 0.0}
+
+    steps = np.abs(np.diff(gray.astype(np.int16), axis=1)) > EDGE_STEP
+    text_rows = steps.mean(axis=1) > TEXT_ROW_DENSITY
+
+    # Run starts/ends of consecutive text rows
+    edges = np.diff(text_rows.astype(np.int8), prepend=0, append=0)
+    heights = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    return {
+        "text_lines": int(np.count_nonzero(heights >= MIN_LINE_HEIGHT)),
+        "text_row_fraction": round(float(text_rows.mean()), 4),
+    }
+
+
+def check_text_regions(image_path: str, scale: int = 4) -> Dict[str, Any]:
+    """Decode at 1/scale and profile text rows (blocking; run in a thread)"""
+    started = time.perf_counter()
+    decoded = decode_grayscale(image_path, scale)
+    profile = text_line_profile(decoded.gray)
+    profile["analysed_size"] = [decoded.gray.shape[1], decoded.gray.shape[0]]
+    profile["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return profile
+
+
+# Detector tuning, in pixels of the (downscaled) grayscale it runs on
+GRADIENT_KERNEL = (3, 3)
+LINE_CLOSE_KERNEL = (9, 1)  # joins glyphs into words and lines
+MIN_BOX_WIDTH = 8
+MIN_BOX_HEIGHT = 3
+MAX_BOX_HEIGHT_RATIO = 0.2  # taller components are photos/logos, not text
+MIN_FILL_RATIO = 0.25
+BOX_PADDING = 2
+MAX_REGIONS = 64
+
+
+def detect_text_regions(
+    gray: "np.ndarray", arena: Optional[BufferArena] = None
+) -> "np.ndarray":
+    """
+    Text boxes as an (N, 4) int array of x, y, w, h, largest first
+
+    Glyph strokes light up in the morphological gradient; Otsu binarizes
+    it, a horizontal closing merges characters into lines, and connected
+    components are filtered by size and fill ratio in one vectorized pass.
+    The full-size intermediates are written into the arena when given.
+    """
+    import cv2
+    import numpy as np
+
+    height, width = gray.shape[:2]
+    gradient = cv2.morphologyEx(
+        gray,
+        cv2.MORPH_GRADIENT,
+        cv2.getStructuringElement(cv2.MORPH_ELLIPSE, GRADIENT_KERNEL),
+        dst=scratch(arena, "text.gradient", gray.shape, np.uint8),
+    )
+    _, binary = cv2.threshold(
+        gradient,
+        0,
+        255,
+        cv2.THRESH_BINARY | cv2.THRESH_OTSU,
+        dst=scratch(arena, "text.binary", gray.shape, np.uint8),
+    )
+    binary = cv2.morphologyEx(
+        binary,
+        cv2.MORPH_CLOSE,
+        cv2.getStructuringElement(cv2.MORPH_RECT, LINE_CLOSE_KERNEL),
+        dst=scratch(arena, "text.closed", gray.shape, np.uint8),
+    )
+
+    _, _, stats, _ = cv2.connectedComponentsWithStats(
+        binary, labels=scratch(arena, "text.labels", gray.shape, np.int32), connectivity=8
+    )
+    stats = stats[1:]  # drop the background component
+    x, y, w, h, area = stats.T
+    keep = (
+        (w >= MIN_BOX_WIDTH)
+        & (h >= MIN_BOX_HEIGHT)
+        & (h <= height * MAX_BOX_HEIGHT_RATIO)
+        & (w >= h)
+        & (area >= MIN_FILL_RATIO * w * h)
+    )
+    boxes = stats[keep, :4].astype(np.int32)
+    boxes = boxes[np.argsort(-(boxes[:, 2] * boxes[:, 3]), kind="stable")][:MAX_REGIONS]
+
+    # Pad so ROI crops include the stroke edges, clipped to the image
+    x0 = np.clip(boxes[:, 0] - BOX_PADDING, 0, width)
+    y0 = np.clip(boxes[:, 1] - BOX_PADDING, 0, height)
+    x1 = np.clip(boxes[:, 0] + boxes[:, 2] + BOX_PADDING, 0, width)
+    y1 = np.clip(boxes[:, 1] + boxes[:, 3] + BOX_PADDING, 0, height)
+    return np.stack([x0, y0, x1 - x0, y1 - y0], axis=1)
+
+
+def scale_boxes(
+    boxes: "np.ndarray",
+    from_size: Tuple[int, int],
+    to_size: Tuple[int, int],
+    align: int = 1,
+) -> "np.ndarray":
+    """
+    Map x, y, w, h boxes between resolutions, optionally snapped outwards
+    to an align-pixel grid (8 keeps JPEG blocks intact for ELA crops)
+    """
+    import numpy as np
+
+    fx = to_size[0] / from_size[0]
+    fy = to_size[1] / from_size[1]
+    x0 = np.floor(boxes[:, 0] * fx / align) * align
+    y0 = np.floor(boxes[:, 1] * fy / align) * align
+    x1 = np.minimum(np.ceil((boxes[:, 0] + boxes[:, 2]) * fx / align) * align, to_size[0])
+    y1 = np.minimum(np.ceil((boxes[:, 1] + boxes[:, 3]) * fy / align) * align, to_size[1])
+    return np.stack([x0, y0, x1 - x0, y1 - y0], axis=1).astype(np.int32)
@@ -0,0 +1,290 @@
+"""
+Streaming multipart uploads
+
+The request body is fed to python-multipart's push parser chunk by chunk as
+it arrives. Bytes of the image part go straight to a temp file while they
+are hashed and run through ImageHeaderScanner, so the content hash and the
+EXIF/XMP headers are ready the moment the upload ends; header-only work
+(the metadata agent) can even start before that. Form fields are collected
+into a dict.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from app.core.image_headers import ImageHeaders, ImageHeaderScanner
+
+logger = logging.getLogger(__name__)
+
+# Non-file form fields are small (ids, mode); anything bigger is refused
+MAX_FIELD_BYTES = 4096
+
+
+class UploadError(Exception):
+    """Malformed or oversized upload"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class StreamedUpload:
+    """An image part written to disk while it was received"""
+
+    path: str
+    filename: Optional[str]
+    size: int
+    sha256: str
+    headers: ImageHeaders
+    fields: Dict[str, str] = field(default_factory=dict)
+    # Milliseconds since the first body byte
+    headers_ready_ms: Optional[float] = None
+    received_ms: float = 0.0
+
+
+class StreamingMultipartReader:
+    """
+    Push-parses one multipart/form-data body, spooling the file field to disk
+
+    on_headers is awaited once the image headers have been fully scanned,
+    usually within the first few KB, while the rest is still uploading.
+    """
+
+    def __init__(
+        self,
+        content_type: str,
+        file_field: str = "image",
+        directory: Optional[str] = None,
+        max_bytes: int = 15 * 1024 * 1024,
+        on_headers: Optional[Callable[[ImageHeaders], Awaitable[None]]] = None,
+    ):
+        from multipart.multipart import MultipartParser, parse_options_header
+
+        mime, options = parse_options_header(content_type or "")
+        boundary = options.get(b"boundary")
+        if mime != b"multipart/form-data" or not boundary:
+            raise UploadError("Expected multipart/form-data with a boundary", 415)
+
+        self.file_field = file_field
+        self.directory = directory or tempfile.gettempdir()
+        self.max_bytes = max_bytes
+        self.on_headers = on_headers
+
+        self.fields: Dict[str, str] = {}
+        self._scanner = ImageHeaderScanner()
+        self._digest = hashlib.sha256()
+        self._file = None
+        self._path: Optional[str] = None
+        self._filename: Optional[str] = None
+        self._size = 0
+        self._started = 0.0
+        self._headers_ready_ms: Optional[float] = None
+
+        # Per-part parser state
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._part_headers: Dict[str, str] = {}
+        self._part_name: Optional[str] = None
+        self._part_is_file = False
+        self._field_value = bytearray()
+        self._file_chunks: List[bytes] = []
+        self._error: Optional[UploadError] = None
+
+        self._parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+            },
+        )
+
+    async def read(self, chunks: AsyncIterator[bytes]) -> StreamedUpload:
+        self._started = time.perf_counter()
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                self._parser.write(chunk)
+                if self._error:
+                    raise self._error
+                await self._drain()
+            self._parser.finalize()
+            await self._drain()
+        except UploadError:
+            self._discard()
+            raise
+        except Exception as e:
+            self._discard()
+            raise UploadError(f"Malformed multipart body: {str(e)}")
+        finally:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+        if self._path is None:
+            raise UploadError(f"Missing file field '{self.file_field}'")
+        if self._size == 0:
+            self._discard()
+            raise UploadError("Uploaded image is empty")
+
+        return StreamedUpload(
+            path=self._path,
+            filename=self._filename,
+            size=self._size,
+            sha256=self._digest.hexdigest(),
+            headers=self._scanner.close(),
+            fields=self.fields,
+            headers_ready_ms=self._headers_ready_ms,
+            received_ms=round((time.perf_counter() - self._started) * 1000, 2),
+        )
+
+    async def _drain(self) -> None:
+        """Write, hash and header-scan the image bytes from the last chunk"""
+        if not self._file_chunks:
+            return
+        data = b"".join(self._file_chunks)
+        self._file_chunks = []
+
+        await asyncio.to_thread(self._write, data)
+        if not self._scanner.done and self._scanner.feed(data):
+            self._headers_ready_ms = round((time.perf_counter() - self._started) * 1000, 2)
+            if self.on_headers:
+                await self.on_headers(self._scanner.headers)
+
+    def _write(self, data: bytes) -> None:
+        self._digest.update(data)
+        self._file.write(data)
+
+    def _discard(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+        if self._path and os.path.exists(self._path):
+            os.remove(self._path)
+
+    # python-multipart callbacks (synchronous, called from parser.write)
+
+    def _on_part_begin(self) -> None:
+        self._part_headers = {}
+        self._part_name = None
+        self._part_is_file = False
+        self._field_value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field.extend(data[start:end])
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value.extend(data[start:end])
+
+    def _on_header_end(self) -> None:
+        name = self._header_field.decode("latin-1").lower()
+        self._part_headers[name] = self._header_value.decode("latin-1")
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+
+    def _on_headers_finished(self) -> None:
+        from multipart.multipart import parse_options_header
+
+        _, options = parse_options_header(self._part_headers.get("content-disposition", ""))
+        self._part_name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        self._part_is_file = self._part_name == self.file_field
+        if self._part_is_file:
+            if self._path is not None:
+                self._error = UploadError(f"More than one '{self.file_field}' part")
+                return
+            self._filename = filename.decode("utf-8", "replace") if filename else None
+            handle, self._path = tempfile.mkstemp(
+                prefix="upload-", suffix=".img", dir=self.directory
+            )
+            self._file = os.fdopen(handle, "wb")
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._error:
+            return
+        if self._part_is_file:
+            self._size += end - start
+            if self._size > self.max_bytes:
+                self._error = UploadError(
+                    f"Image larger than {self.max_bytes // (1024 * 1024)} MB", 413
+                )
+                return
+            self._file_chunks.append(bytes(data[start:end]))
+        else:
+            self._field_value.extend(data[start:end])
+            if len(self._field_value) > MAX_FIELD_BYTES:
+                self._error = UploadError(f"Form field '{self._part_name}' too large")
+
+    def _on_part_end(self) -> None:
+        if not self._part_is_file and self._part_name:
+            self.fields[self._part_name] = self._field_value.decode("utf-8", "replace")
+
+
+class BackgroundArchiver:
+    """
+    Uploads received images to Cloudinary off the request path
+
+    Images are stored under their content hash, never overwriting, so one
+    client cannot replace an image archived for another receipt.
+    """
+
+    def __init__(self, folder: str = "receipts", enabled: bool = True):
+        self.folder = folder
+        self.enabled = enabled
+        self.counters = {"scheduled": 0, "archived": 0, "failed": 0}
+        self.seconds: List[float] = []
+        self._tasks: set = set()
+
+    def schedule(self, image_path: str, sha256: str) -> Optional[asyncio.Task]:
+        """Archive task for the image (None when disabled); keep the file until it ends"""
+        if not self.enabled:
+            return None
+        task = asyncio.create_task(self._archive(image_path, sha256))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self.counters["scheduled"] += 1
+        return task
+
+    async def _archive(self, image_path: str, public_id: str) -> None:
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._upload, image_path, public_id)
+            self.counters["archived"] += 1
+            logger.info(f"Archived upload {public_id} to Cloudinary")
+        except Exception as e:
+            self.counters["failed"] += 1
+            logger.error(f"Cloudinary archival failed for {public_id}: {str(e)}")
+        finally:
+            self.seconds = (self.seconds + [time.perf_counter() - started])[-100:]
+
+    def _upload(self, image_path: str, public_id: str) -> Dict[str, Any]:
+        import cloudinary.uploader  # configured from CLOUDINARY_URL
+
+        return cloudinary.uploader.upload(
+            image_path, folder=self.folder, public_id=public_id, overwrite=False
+        )
+
+    async def drain(self) -> None:
+        """Wait for in-flight archival (shutdown)"""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "in_flight": len(self._tasks),
+            "mean_seconds": round(sum(self.seconds) / len(self.seconds), 3)
+            if self.seconds
+            else 0.0,
+        }
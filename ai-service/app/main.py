@@ -1,12 +1,16 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+import asyncio
 import structlog
 import uvicorn
 import os
 
 from app.config import settings
-from app.core import firebase  # ✅ Initialize Firebase early
+from app.core import metrics
+from app.core.container import container  # ✅ Heavy clients are created lazily
+from app.core.load_shedding import LoadSheddingMiddleware, RouteClass
+from app.core.loop_monitor import LoopLagMonitor
 
 # Import routers
 from app.routers import receipts, accounts
@@ -33,6 +37,49 @@ app = FastAPI(
     redoc_url="/redoc",
 )
 
+loop_monitor = LoopLagMonitor(
+    interval=settings.LOOP_MONITOR_INTERVAL_MS / 1000,
+    block_threshold=settings.LOOP_BLOCK_THRESHOLD_MS / 1000,
+    capture_stacks=settings.LOOP_BLOCK_STACKS,
+)
+metrics.register("event_loop", loop_monitor.stats)
+
+# ============================================================
+# 🚦 Load Shedding (added before CORS so rejections still get CORS headers)
+# ============================================================
+if settings.SHED_ENABLED:
+    app.add_middleware(
+        LoadSheddingMiddleware,
+        classes=[
+            # Probes must answer during bursts or Render restarts the instance
+            RouteClass(
+                "critical",
+                "critical",
+                routes=(("GET", "/"), ("GET", "/health"), ("GET", "/metrics")),
+            ),
+            RouteClass(
+                "account",
+                "high",
+                routes=(("POST", "/api/check-account"),),
+                max_inflight=settings.SHED_ACCOUNT_MAX_INFLIGHT,
+            ),
+            RouteClass(
+                "analysis",
+                "low",
+                routes=(("POST", "/api/analyze-receipt"),),
+                max_inflight=settings.SHED_ANALYSIS_MAX_INFLIGHT,
+            ),
+            # Submitting/polling jobs is cheap; the queue has its own 429
+            RouteClass("jobs", "low", routes=(("*", "/api/analyze-receipt/jobs"),)),
+            RouteClass("default", "low"),
+        ],
+        max_inflight=settings.SHED_MAX_INFLIGHT,
+        reserved=settings.SHED_RESERVED_INFLIGHT,
+        lag_limit_ms=settings.SHED_LOOP_LAG_MS,
+        lag_source=loop_monitor.current_lag_ms,
+        retry_after=settings.SHED_RETRY_AFTER_SECONDS,
+    )
+
 # ============================================================
 # 🌍 CORS Setup
 # ============================================================
@@ -55,6 +102,39 @@ app.add_middleware(
 app.include_router(receipts.router, prefix="/api", tags=["receipts"])
 app.include_router(accounts.router, prefix="/api", tags=["accounts"])
 
+# ============================================================
+# 🔄 Lifecycle
+# ============================================================
+_background_tasks = set()
+
+
+@app.on_event("startup")
+async def start_background_workers():
+    await receipts.job_queue.start()
+    if settings.LOOP_MONITOR_ENABLED:
+        await loop_monitor.start()
+
+    # Warm up off the event loop so liveness answers immediately
+    if settings.WARM_UP_ON_STARTUP:
+        task = asyncio.create_task(
+            container.keep_warm(
+                settings.WARM_UP_RETRY_SECONDS, settings.WARM_UP_RETRY_MAX_SECONDS
+            )
+        )
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    for task in list(_background_tasks):
+        task.cancel()
+    await receipts.job_queue.stop()
+    await receipts.upload_archiver.drain()
+    await container.drain()
+    await loop_monitor.stop()
+    await asyncio.to_thread(container.shutdown)
+
 # ============================================================
 # 🩺 Health & Root Routes
 # ============================================================
@@ -69,11 +149,25 @@ async def root():
     }
 
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is up and the event loop is responsive"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: the required warm-up steps have succeeded"""
+    status = container.status()
+    return JSONResponse(status_code=200 if container.ready else 503, content=status)
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
+        "ready": container.ready,
         "environment": settings.ENVIRONMENT,
         "agents": {
             "vision": "ready",
@@ -84,6 +178,11 @@ async def health_check():
         },
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Queue, cache and latency counters from all service components"""
+    return metrics.snapshot()
+
 # ============================================================
 # ⚠️ Global Exception Handler
 # ============================================================
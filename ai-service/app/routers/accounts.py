@@ -2,14 +2,10 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Dict, Any
 import logging
-from app.agents.reputation_agent import ReputationAgent
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Initialize reputation agent
-reputation_agent = ReputationAgent()
-
 
 class CheckAccountRequest(BaseModel):
     account_hash: str
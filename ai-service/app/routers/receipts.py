@@ -1,49 +1,183 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import AsyncIterator, Awaitable, Callable, Dict, Any, Literal, Optional, Tuple
+import asyncio
+import hmac
+import json
 import logging
 import os
+import time
 import httpx
-from app.agents.orchestrator import ReceiptAnalysisOrchestrator
-from app.agents.vision_agent import VisionAgent
-from app.agents.forensic_agent import ForensicAgent
-from app.agents.metadata_agent import MetadataAgent
-from app.agents.reputation_agent import ReputationAgent
-from app.agents.reasoning_agent import ReasoningAgent
+from app.config import settings
+from app.core import metrics
+from app.core.cancellation import RequestAbandoned, RequestCanceller
+from app.core.container import container
+from app.core.idempotency import IdempotencyStore
+from app.core.jobs import (
+    AnalysisJob,
+    AnalysisJobQueue,
+    CallbackRejected,
+    QueueFullError,
+    parse_origins,
+)
+from app.core.profiler import SamplingProfiler, stage_times, write_profile
+from app.core.normalize import ImageRejectedError, check_dimensions
+from app.core.uploads import BackgroundArchiver, StreamingMultipartReader, UploadError
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Initialize agents
-from app.config import settings
-gemini_api_key = settings.GEMINI_API_KEY
-vision_agent = VisionAgent(gemini_api_key) if gemini_api_key else None
-forensic_agent = ForensicAgent()
-metadata_agent = MetadataAgent()
-reputation_agent = ReputationAgent()
-reasoning_agent = ReasoningAgent()
-
-# Initialize orchestrator
-if vision_agent:
-    orchestrator = ReceiptAnalysisOrchestrator(
-        vision_agent=vision_agent,
-        forensic_agent=forensic_agent,
-        metadata_agent=metadata_agent,
-        reputation_agent=reputation_agent,
-        reasoning_agent=reasoning_agent,
-    )
-else:
-    logger.warning("Gemini API key not configured. Vision agent disabled.")
-    orchestrator = None
+
+def get_orchestrator():
+    """Shared orchestrator; 503 when the service is not configured for analysis"""
+    orchestrator = container.orchestrator
+    if not orchestrator:
+        raise HTTPException(
+            status_code=503,
+            detail="AI service not properly configured. Check GEMINI_API_KEY.",
+        )
+    return orchestrator
+
+
+def profiling_requested(
+    profile: bool = Query(False, description="Admin only: profile this analysis"),
+    x_profile: Optional[str] = Header(None),
+    x_admin_token: Optional[str] = Header(None),
+) -> bool:
+    """Opt-in per-request profiling, via ?profile=true or X-Profile: 1, for admins"""
+    if not profile and x_profile not in ("1", "true"):
+        return False
+    if not settings.ADMIN_TOKEN or not hmac.compare_digest(
+        x_admin_token or "", settings.ADMIN_TOKEN
+    ):
+        raise HTTPException(status_code=403, detail="Profiling requires a valid X-Admin-Token")
+    return True
+
+
+# The sampler sees every thread, so only one request is profiled at a time
+_profile_lock = asyncio.Lock()
 
 
 class AnalyzeReceiptRequest(BaseModel):
     image_url: str
     receipt_id: str
+    # Uploading user, linked to the receipt's accounts by the network agent
+    submitter_id: Optional[str] = None
+
+
+class AnalyzeReceiptModeRequest(AnalyzeReceiptRequest):
+    # fast: local pre-screen, escalated to full only when inconclusive
+    mode: Literal["full", "fast"] = "full"
+
+
+class SubmitAnalysisJobRequest(AnalyzeReceiptRequest):
+    priority: Literal["high", "normal", "low"] = "normal"
+    callback_url: Optional[str] = None
+
+
+async def _run_job(job: AnalysisJob) -> Dict[str, Any]:
+    orchestrator = get_orchestrator()
+    image_path = await download_image(job.image_url, job.receipt_id)
+    try:
+        return await orchestrator.analyze_receipt(
+            image_path, job.receipt_id, submitter_id=job.submitter_id, batch_vision=True
+        )
+    finally:
+        _remove_download(image_path)
+
+
+# Submit/poll mode: bounded queue drained by a fixed pool of workers. A vision
+# batch only fills with jobs running at the same time, so batching needs at
+# least VISION_BATCH_SIZE of them (forensic work stays bounded by its executor)
+job_queue = AnalysisJobQueue(
+    _run_job,
+    max_size=settings.JOB_QUEUE_MAX_SIZE,
+    workers=max(settings.JOB_WORKERS, settings.VISION_BATCH_SIZE),
+    db_path=settings.JOB_DB_PATH,
+    result_ttl_seconds=settings.JOB_RESULT_TTL_SECONDS,
+    callback_origins=parse_origins(settings.JOB_CALLBACK_ORIGINS),
+)
+metrics.register("job_queue", job_queue.stats)
+
+# Direct uploads are archived to Cloudinary after the fact, off the request path
+upload_archiver = BackgroundArchiver(
+    folder=settings.UPLOAD_ARCHIVE_FOLDER, enabled=settings.UPLOAD_ARCHIVE_ENABLED
+)
+metrics.register("upload_archive", upload_archiver.stats)
+
+
+def _complete(result: Dict[str, Any]) -> bool:
+    """Only finished analyses are kept; error placeholders should be retried"""
+    return not any(issue.get("type") == "analysis_error" for issue in result.get("issues", []))
+
+
+# Retries of a receipt (e.g. after the backend's timeout) reuse its analysis
+idempotency = IdempotencyStore(
+    ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+    max_entries=settings.IDEMPOTENCY_MAX_ENTRIES,
+    should_store=_complete,
+    abandon_grace_seconds=settings.IDEMPOTENCY_ABANDON_GRACE_SECONDS,
+)
+metrics.register("idempotency", idempotency.stats)
+
+# Analyses are cancelled once the client has gone or its deadline has passed
+request_canceller = RequestCanceller(poll_seconds=settings.CANCEL_POLL_SECONDS)
+metrics.register("abandoned_requests", request_canceller.stats)
+
+
+def request_deadline(
+    x_request_timeout_ms: Optional[str] = Header(None),
+) -> Optional[float]:
+    """time.monotonic() deadline from the caller's X-Request-Timeout-Ms, if any"""
+    if not x_request_timeout_ms:
+        return None
+    try:
+        timeout_ms = float(x_request_timeout_ms)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="X-Request-Timeout-Ms must be a number")
+    return time.monotonic() + max(timeout_ms, 0.0) / 1000
+
+
+async def _unless_abandoned(
+    analysis: Awaitable[Dict[str, Any]],
+    http_request: Request,
+    deadline: Optional[float],
+    receipt_id: str,
+):
+    """Await analysis, cancelling it if the client disconnects or the deadline passes"""
+    try:
+        return await request_canceller.run(analysis, http_request.is_disconnected, deadline)
+    except RequestAbandoned as e:
+        logger.info(f"Abandoned analysis of receipt {receipt_id}: {e.reason}")
+        if e.reason == "deadline":
+            raise HTTPException(status_code=504, detail="Analysis did not finish within X-Request-Timeout-Ms")
+        # Nobody is left to read it; 499 as in nginx's "client closed request"
+        raise HTTPException(status_code=499, detail="Client disconnected")
+
+
+async def _idempotent(
+    key: tuple, analyze: Callable[[], Awaitable[Dict[str, Any]]]
+) -> Tuple[Dict[str, Any], str]:
+    """Run analyze() once per key; repeats attach to it or get its stored result"""
+    if not settings.IDEMPOTENCY_ENABLED:
+        return await analyze(), "started"
+    result, status = await idempotency.run(key, analyze)
+    if status != "started":
+        logger.info(f"Receipt {key[1]} {status} an earlier analysis")
+        # The stored result is shared; annotate a copy
+        result = {**result, "idempotency": {"status": status}}
+    return result, status
 
 
 @router.post("/analyze-receipt")
-async def analyze_receipt(request: AnalyzeReceiptRequest) -> Dict[str, Any]:
+async def analyze_receipt(
+    request: AnalyzeReceiptModeRequest,
+    http_request: Request,
+    orchestrator=Depends(get_orchestrator),
+    profiling: bool = Depends(profiling_requested),
+    deadline: Optional[float] = Depends(request_deadline),
+) -> Dict[str, Any]:
     """
     Analyze receipt image for authenticity using multi-agent system
 
@@ -53,32 +187,403 @@ async def analyze_receipt(request: AnalyzeReceiptRequest) -> Dict[str, Any]:
     - Metadata Agent: EXIF data analysis
     - Reputation Agent: Merchant/account verification
     - Reasoning Agent: Synthesis and verdict
+
+    mode="fast" runs only the local agents plus a text check and returns
+    their verdict when it is conclusive; otherwise the full analysis runs.
+
+    Admins can add ?profile=true (or X-Profile: 1) with X-Admin-Token to get
+    a sampled flame summary and per-stage wall/CPU times under "profile".
+
+    Repeating a request (same receipt_id, image_url and mode) while its
+    analysis is running, or within IDEMPOTENCY_TTL_SECONDS of it finishing,
+    returns that analysis instead of starting another; such responses carry
+    "idempotency": {"status": "joined" | "stored"}.
+
+    The analysis is cancelled when the client disconnects, or when the
+    X-Request-Timeout-Ms header (the caller's own timeout) runs out, which
+    returns 504. An analysis other requests are attached to keeps running.
     """
+    if profiling:
+        if _profile_lock.locked():
+            raise HTTPException(status_code=409, detail="Another request is being profiled")
+        async with _profile_lock:
+            return await _profiled_analysis(request, orchestrator)
+    result, _ = await _unless_abandoned(
+        _idempotent(
+            ("analyze", request.receipt_id, request.mode, request.image_url),
+            lambda: _analyze(request, orchestrator),
+        ),
+        http_request,
+        deadline,
+        request.receipt_id,
+    )
+    return result
+
+
+async def _analyze(
+    request: AnalyzeReceiptModeRequest,
+    orchestrator,
+    measure_cpu: bool = False,
+    timings: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
     try:
         logger.info(f"Received analysis request for receipt: {request.receipt_id}")
 
-        if not orchestrator:
-            raise HTTPException(
-                status_code=503,
-                detail="AI service not properly configured. Check GEMINI_API_KEY.",
-            )
-
         # Download image from Cloudinary
+        started = time.perf_counter()
         image_path = await download_image(request.image_url, request.receipt_id)
+        if timings is not None:
+            timings["download_ms"] = round((time.perf_counter() - started) * 1000, 2)
 
         # Run multi-agent analysis
-        result = await orchestrator.analyze_receipt(image_path, request.receipt_id)
+        try:
+            if request.mode == "fast":
+                result = await orchestrator.analyze_receipt_fast(
+                    image_path,
+                    request.receipt_id,
+                    submitter_id=request.submitter_id,
+                    measure_cpu=measure_cpu,
+                )
+            else:
+                result = await orchestrator.analyze_receipt(
+                    image_path,
+                    request.receipt_id,
+                    submitter_id=request.submitter_id,
+                    measure_cpu=measure_cpu,
+                )
+        finally:
+            _remove_download(image_path)
 
         logger.info(f"Analysis completed for receipt: {request.receipt_id}")
         return result
 
+    except ImageRejectedError as e:
+        logger.warning(f"Rejected image for receipt {request.receipt_id}: {str(e)}")
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logger.error(f"Analysis failed for receipt {request.receipt_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _profiled_analysis(
+    request: AnalyzeReceiptModeRequest, orchestrator
+) -> Dict[str, Any]:
+    """Run one analysis under the sampling profiler and attach the report"""
+    timings: Dict[str, Any] = {}
+    profiler = SamplingProfiler(interval=settings.PROFILE_INTERVAL_MS / 1000).start()
+    cpu_started = time.process_time()
+    try:
+        result = await _analyze(request, orchestrator, measure_cpu=True, timings=timings)
+    finally:
+        profiler.stop()
+
+    stages = stage_times(result.get("pipeline", {}).get("nodes", {}))
+    prescreen = result.get("prescreen") or {}
+    for name, times in stage_times(prescreen.get("pipeline", {}).get("nodes", {})).items():
+        stages[f"prescreen.{name}"] = times
+    report = {
+        "receipt_id": request.receipt_id,
+        "download_ms": timings.get("download_ms"),
+        "process_cpu_ms": round((time.process_time() - cpu_started) * 1000, 2),
+        "stages": stages,
+        "flame": profiler.summary(),
+    }
+    if settings.PROFILE_DIR:
+        report["files"] = await asyncio.to_thread(
+            write_profile,
+            settings.PROFILE_DIR,
+            request.receipt_id,
+            report,
+            profiler.folded(),
+        )
+    logger.info(
+        f"Profiled receipt {request.receipt_id}: "
+        f"{profiler.summary(limit=1)['top_functions']}"
+    )
+    result["profile"] = report
+    return result
+
+
+def _remove_after(path: str, archive: Optional[asyncio.Task]) -> None:
+    """Delete a spooled upload once its archival no longer needs it"""
+
+    def remove(_=None) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    if archive is None or archive.done():
+        remove()
+    else:
+        archive.add_done_callback(remove)
+
+
+@router.post("/analyze-receipt/upload")
+async def analyze_receipt_upload(
+    request: Request,
+    orchestrator=Depends(get_orchestrator),
+    deadline: Optional[float] = Depends(request_deadline),
+) -> Dict[str, Any]:
+    """
+    Analyze a receipt uploaded directly as multipart/form-data
+
+    Fields: image (the file), receipt_id, optional submitter_id and mode
+    ("full" or "fast"). Skips the client -> Cloudinary -> service round
+    trip of /analyze-receipt: the body is parsed as it streams in, hashed
+    and header-scanned on the way to disk, and the metadata agent starts as
+    soon as the EXIF/XMP headers have arrived. Decompression bombs are
+    refused (413) from the header dimensions, before the rest of the body
+    is read. The image is archived to Cloudinary in the background once
+    received. Disconnects and X-Request-Timeout-Ms cancel the analysis as
+    for /analyze-receipt.
+    """
+    started = time.perf_counter()
+    metadata_task: Optional[asyncio.Task] = None
+
+    async def on_headers(headers) -> None:
+        nonlocal metadata_task
+        try:
+            check_dimensions(
+                headers.format,
+                headers.width,
+                headers.height,
+                int(settings.IMAGE_DECODE_MAX_MEGAPIXELS * 1_000_000),
+            )
+        except ImageRejectedError as e:
+            raise UploadError(str(e), status_code=413)
+        metadata_task = asyncio.create_task(
+            orchestrator.metadata_agent.analyze_headers(headers)
+        )
+
+    try:
+        reader = StreamingMultipartReader(
+            request.headers.get("content-type", ""),
+            max_bytes=settings.UPLOAD_MAX_MB * 1024 * 1024,
+            on_headers=on_headers,
+        )
+        upload = await reader.read(request.stream())
+    except UploadError as e:
+        if metadata_task:
+            metadata_task.cancel()
+        logger.warning(f"Rejected receipt upload: {str(e)}")
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    receipt_id = upload.fields.get("receipt_id")
+    mode = upload.fields.get("mode", "full")
+    if not receipt_id or mode not in ("full", "fast"):
+        if metadata_task:
+            metadata_task.cancel()
+        os.remove(upload.path)
+        raise HTTPException(
+            status_code=422, detail="receipt_id is required and mode must be full or fast"
+        )
+    submitter_id = upload.fields.get("submitter_id") or None
+    logger.info(
+        f"Received upload for receipt {receipt_id}: {upload.size} bytes in "
+        f"{upload.received_ms} ms (headers after {upload.headers_ready_ms} ms)"
+    )
+
+    # Set once analyze() owns the spooled file; until then it is ours to remove
+    analysis_started = False
+
+    async def analyze() -> Dict[str, Any]:
+        nonlocal analysis_started
+        analysis_started = True
+        archive = upload_archiver.schedule(upload.path, upload.sha256)
+        try:
+            # Headers that never completed (truncated file) fall back to the agent
+            precomputed = {"metadata": await metadata_task} if metadata_task else {}
+            if mode == "fast":
+                result = await orchestrator.analyze_receipt_fast(
+                    upload.path,
+                    receipt_id,
+                    submitter_id=submitter_id,
+                    precomputed=precomputed,
+                    image_hash=upload.sha256,
+                )
+            else:
+                result = await orchestrator.analyze_receipt(
+                    upload.path,
+                    receipt_id,
+                    precomputed=precomputed,
+                    submitter_id=submitter_id,
+                    image_hash=upload.sha256,
+                )
+        except ImageRejectedError as e:
+            logger.warning(f"Rejected uploaded image for receipt {receipt_id}: {str(e)}")
+            raise HTTPException(status_code=413, detail=str(e))
+        except Exception as e:
+            logger.error(f"Analysis failed for uploaded receipt {receipt_id}: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            _remove_after(upload.path, archive)
+
+        result["upload"] = {
+            "bytes": upload.size,
+            "sha256": upload.sha256,
+            "received_ms": upload.received_ms,
+            "headers_ready_ms": upload.headers_ready_ms,
+            "total_ms": round((time.perf_counter() - started) * 1000, 2),
+            "archive": "scheduled" if archive else "disabled",
+        }
+        logger.info(f"Analysis completed for uploaded receipt: {receipt_id}")
+        return result
+
+    try:
+        result, status = await _unless_abandoned(
+            _idempotent(("upload", receipt_id, mode, upload.sha256), analyze),
+            request,
+            deadline,
+            receipt_id,
+        )
+    except HTTPException:
+        if metadata_task:
+            metadata_task.cancel()
+        # Deadline already past, or joined another request that failed or
+        # was abandoned: this request's analyze() never took the file
+        if not analysis_started:
+            os.remove(upload.path)
+        raise
+    if status != "started":
+        # Same image already analyzed (and archived) under this receipt
+        if metadata_task:
+            metadata_task.cancel()
+        os.remove(upload.path)
+    return result
+
+
+@router.post("/analyze-receipt/jobs", status_code=202)
+async def submit_analysis_job(
+    request: SubmitAnalysisJobRequest, orchestrator=Depends(get_orchestrator)
+) -> Dict[str, Any]:
+    """
+    Queue a receipt analysis and return immediately
+
+    Poll GET /analyze-receipt/jobs/{job_id} for the result, or pass
+    callback_url to have the finished job POSTed back (its origin must be
+    in JOB_CALLBACK_ORIGINS, else 400). Returns 429 with a Retry-After
+    header when the queue is full.
+    """
+    try:
+        job = await job_queue.submit(
+            request.receipt_id,
+            request.image_url,
+            priority=request.priority,
+            callback_url=request.callback_url,
+            submitter_id=request.submitter_id,
+        )
+    except QueueFullError as e:
+        logger.warning(f"Rejected analysis job for receipt {request.receipt_id}: queue full")
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except CallbackRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    logger.info(f"Queued analysis job {job.job_id} for receipt: {request.receipt_id}")
+    return {
+        "job_id": job.job_id,
+        "receipt_id": job.receipt_id,
+        "status": job.status,
+        "status_url": f"/api/analyze-receipt/jobs/{job.job_id}",
+        "queue_depth": job_queue.stats()["depth"],
+    }
+
+
+@router.get("/analyze-receipt/jobs/{job_id}")
+async def get_analysis_job(job_id: str) -> Dict[str, Any]:
+    """Status of a queued analysis, including the result once completed"""
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job.public()
+
+
+@router.post("/analyze-receipt/stream")
+async def analyze_receipt_stream(
+    request: AnalyzeReceiptRequest, orchestrator=Depends(get_orchestrator)
+) -> StreamingResponse:
+    """
+    Same analysis as /analyze-receipt, streamed as server-sent events
+
+    Events, in order of arrival:
+    - agent: one per agent as it finishes (forensic/metadata usually first)
+    - provisional: score from the local agents while Gemini is still running
+    - result: the final payload, identical to /analyze-receipt
+    - error: analysis could not be completed
+
+    A repeat of a running or recently finished /analyze-receipt (full mode)
+    or stream request for the same receipt and image gets only the result.
+    """
+    logger.info(f"Received streaming analysis request for receipt: {request.receipt_id}")
+    return StreamingResponse(
+        _analysis_events(request, orchestrator),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _analysis_events(
+    request: AnalyzeReceiptRequest, orchestrator
+) -> AsyncIterator[str]:
+    """Run the orchestrator in the background and relay its events as SSE frames"""
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def on_event(event: str, data: Dict[str, Any]) -> None:
+        await queue.put((event, data))
+
+    async def analyze() -> Dict[str, Any]:
+        image_path = await download_image(request.image_url, request.receipt_id)
+        try:
+            return await orchestrator.analyze_receipt(
+                image_path,
+                request.receipt_id,
+                on_event=on_event,
+                submitter_id=request.submitter_id,
+            )
+        finally:
+            _remove_download(image_path)
+
+    async def run() -> None:
+        try:
+            result, _ = await _idempotent(
+                ("analyze", request.receipt_id, "full", request.image_url), analyze
+            )
+            await queue.put(("result", result))
+        except Exception as e:
+            logger.error(f"Streaming analysis failed for receipt {request.receipt_id}: {str(e)}")
+            await queue.put(("error", {"receipt_id": request.receipt_id, "detail": str(e)}))
+        finally:
+            await queue.put(None)
+
+    task = asyncio.create_task(run())
+    try:
+        yield _sse("started", {"receipt_id": request.receipt_id})
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            yield _sse(*item)
+    finally:
+        # Client went away before the analysis finished
+        if not task.done():
+            task.cancel()
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
 async def download_image(image_url: str, receipt_id: str) -> str:
-    """Download image from Cloudinary to local temp storage"""
+    """
+    Download image from Cloudinary to local temp storage
+
+    Every call gets its own file: a fast and a full analysis of the same
+    receipt, or two job workers, may download it at the same time.
+    """
     try:
         import tempfile
 
@@ -91,13 +596,14 @@ async def download_image(image_url: str, receipt_id: str) -> str:
             response.raise_for_status()
 
             # Save to temp file
-            temp_dir = tempfile.gettempdir()
-            image_path = os.path.join(temp_dir, f"{receipt_id}.jpg")
-
-            with open(image_path, "wb") as f:
+            handle, image_path = tempfile.mkstemp(prefix="download-", suffix=".jpg")
+            with os.fdopen(handle, "wb") as f:
                 f.write(response.content)
 
-            logger.info(f"✅ Image downloaded successfully: {image_path} ({len(response.content)} bytes)")
+            logger.info(
+                f"✅ Image for receipt {receipt_id} downloaded successfully: "
+                f"{image_path} ({len(response.content)} bytes)"
+            )
             return image_path
 
     except httpx.HTTPStatusError as e:
@@ -106,3 +612,11 @@ async def download_image(image_url: str, receipt_id: str) -> str:
     except Exception as e:
         logger.error(f"❌ Failed to download image: {str(e)}")
         raise Exception(f"Image download failed: {str(e)}")
+
+
+def _remove_download(path: str) -> None:
+    """Delete a downloaded image once its analysis is done"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
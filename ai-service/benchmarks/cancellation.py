@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+CPU spent on analyses nobody is waiting for, with and without cancelling
+abandoned requests.
+
+--requests analyses of an image run through the orchestrator with a real
+forensic agent on a CancellableExecutor (--workers threads) and a
+simulated Gemini call of --gemini-seconds. --abandon-rate of the clients
+send X-Request-Timeout-Ms shorter than the analysis (--timeout-ms). Without
+cancellation their analyses run to completion anyway; with it they are
+cancelled at the deadline, pending agents never start and queued forensic
+jobs are dropped.
+Usage: python benchmarks/cancellation.py --image receipt.jpg --requests 40
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+
+class SimulatedVision:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    async def analyze(self, image_path, *args, **kwargs):
+        await asyncio.sleep(self.seconds)
+        return {
+            "ocr_text": "OPay Transfer Successful NGN 25,000.00 to 0123456789",
+            "confidence": 90,
+            "merchant_name": "OPay",
+            "account_numbers": ["0123456789"],
+            "visual_anomalies": [],
+        }
+
+
+class SimulatedReputation:
+    async def analyze(self, *args, **kwargs):
+        await asyncio.sleep(0.05)
+        return {"accounts_analyzed": [], "total_fraud_reports": 0, "merchant": None}
+
+
+async def run_mode(args, cancel: bool) -> dict:
+    from app.agents.forensic_agent import ForensicAgent
+    from app.agents.metadata_agent import MetadataAgent
+    from app.agents.orchestrator import ReceiptAnalysisOrchestrator
+    from app.agents.reasoning_agent import ReasoningAgent
+    from app.core.cancellation import CancellableExecutor, RequestAbandoned, RequestCanceller
+    from app.core.metrics import percentiles
+
+    executor = CancellableExecutor(max_workers=args.workers)
+    orchestrator = ReceiptAnalysisOrchestrator(
+        vision_agent=SimulatedVision(args.gemini_seconds),
+        forensic_agent=ForensicAgent(decode_scale=args.decode_scale, executor=executor),
+        metadata_agent=MetadataAgent(),
+        reputation_agent=SimulatedReputation(),
+        reasoning_agent=ReasoningAgent(),
+        executor=executor,
+    )
+    canceller = RequestCanceller()
+    answered = []
+    abandoned = 0
+
+    async def client(index: int) -> None:
+        nonlocal abandoned
+        gives_up = random.random() < args.abandon_rate
+        deadline = time.monotonic() + args.timeout_ms / 1000 if gives_up else None
+        analysis = orchestrator.analyze_receipt(args.image, f"receipt-{index}")
+        started = time.perf_counter()
+        if cancel:
+            try:
+                await canceller.run(analysis, deadline=deadline)
+                answered.append(time.perf_counter() - started)
+            except RequestAbandoned:
+                abandoned += 1
+            return
+        task = asyncio.ensure_future(analysis)
+        try:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+            answered.append(time.perf_counter() - started)
+        except asyncio.TimeoutError:
+            # The client is gone but the analysis carries on
+            abandoned += 1
+            await task
+
+    random.seed(5)
+    cpu_started = time.process_time()
+    clients = []
+    for index in range(args.requests):
+        clients.append(asyncio.create_task(client(index)))
+        await asyncio.sleep(args.interval_ms / 1000)
+    await asyncio.gather(*clients)
+    cpu = time.process_time() - cpu_started
+    executor.shutdown()
+    return {
+        "cpu_seconds": cpu,
+        "answered": len(answered),
+        "abandoned": abandoned,
+        "latency": percentiles(answered),
+        "executor": executor.stats(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--image", required=True)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--abandon-rate", type=float, default=0.5)
+    parser.add_argument("--timeout-ms", type=float, default=100)
+    parser.add_argument("--interval-ms", type=float, default=50)
+    parser.add_argument("--gemini-seconds", type=float, default=1.5)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--decode-scale", type=int, default=1)
+    args = parser.parse_args()
+
+    for label, cancel in (("no cancel", False), ("cancel", True)):
+        result = asyncio.run(run_mode(args, cancel))
+        executor = result["executor"]
+        print(
+            f"{label:9s} process CPU {result['cpu_seconds']:.2f} s  "
+            f"answered {result['answered']} (p50 {result['latency']['p50']:.2f} s, "
+            f"p95 {result['latency']['p95']:.2f} s)  abandoned {result['abandoned']}"
+        )
+        print(
+            f"          pool jobs completed {executor['completed']}, cancelled queued "
+            f"{executor['cancelled_queued']} / running {executor['cancelled_running']}, "
+            f"CPU saved ~{executor['cpu_seconds']['saved']:.2f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
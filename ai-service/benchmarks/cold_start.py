@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Measure cold-start cost: importing app.main, then the warm-up routine.
+
+Each run is a fresh interpreter, as after a Render idle spin-down.
+Usage: python benchmarks/cold_start.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app.main
+import_ms = (time.perf_counter() - started) * 1000
+from app.core.container import container
+started = time.perf_counter()
+status = container.warm_up()
+warm_ms = (time.perf_counter() - started) * 1000
+print(json.dumps({"import_ms": import_ms, "warm_up_ms": warm_ms, "steps": status["steps"]}))
+"""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE],
+            cwd=SERVICE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        rows.append(json.loads(output.strip().splitlines()[-1]))
+
+    for key in ("import_ms", "warm_up_ms"):
+        values = [row[key] for row in rows]
+        print(f"{key:<12} median {statistics.median(values):8.1f}  min {min(values):8.1f}  max {max(values):8.1f}")
+    print("last warm-up steps:", json.dumps(rows[-1]["steps"]))
+
+
+if __name__ == "__main__":
+    main()
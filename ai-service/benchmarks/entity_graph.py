@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Entity graph build and query cost on synthetic traffic.
+
+Receipts draw accounts, phones and merchants from Zipf-like pools so a few
+entities are very hot (the worst case for a window query), then per-query
+latency is measured for the 100 hottest accounts and for accounts drawn
+uniformly.
+Usage: python benchmarks/entity_graph.py [--receipts 500000] [--days 90]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+from app.core.entity_graph import DAY_SECONDS, EntityGraph  # noqa: E402
+from app.core.metrics import percentiles  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--receipts", type=int, default=500_000)
+    parser.add_argument("--days", type=float, default=90)
+    parser.add_argument("--window-days", type=float, default=30)
+    parser.add_argument("--queries", type=int, default=20_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    n = args.receipts
+    accounts = rng.zipf(1.3, n) % (n // 4)
+    phones = rng.zipf(1.3, n) % (n // 4)
+    merchants = rng.zipf(1.5, n) % 5000
+    submitters = rng.integers(0, n // 10, n)
+    now = time.time()
+    timestamps = np.sort(now - rng.random(n) * args.days * DAY_SECONDS)
+
+    graph = EntityGraph(retention_days=args.days, clock=lambda: now)
+    started = time.perf_counter()
+    for i in range(n):
+        graph.add_receipt(
+            f"r{i}",
+            {
+                "account": [f"a{accounts[i]}"],
+                "phone": [f"p{phones[i]}"],
+                "merchant": [f"m{merchants[i]}"],
+            },
+            submitter_id=f"u{submitters[i]}",
+            timestamp=float(timestamps[i]),
+        )
+    build = time.perf_counter() - started
+
+    hot, counts = np.unique(accounts, return_counts=True)
+    hot = hot[np.argsort(-counts)][:100]
+    typical = rng.choice(np.unique(accounts), args.queries)
+    results = {}
+    for label, keys in (("hot", np.resize(hot, args.queries)), ("typical", typical)):
+        samples = []
+        for key in keys.tolist():
+            started = time.perf_counter()
+            graph.neighbourhood("account", f"a{key}", args.window_days)
+            samples.append((time.perf_counter() - started) * 1e6)
+        results[label] = percentiles(samples)
+
+    top = graph.neighbourhood("account", f"a{hot[0]}", args.window_days)
+    stats = graph.stats()
+    print(f"build    {n:,} receipts in {build:.2f} s ({n / build:,.0f}/s)")
+    print(f"graph    {stats['edges']:,} edges, {stats['array_bytes'] / 1e6:.1f} MB of arrays")
+    print(f"hottest  {top}")
+    for label, values in results.items():
+        print(f"query    {label:7s} p50 {values['p50']} us  p99 {values['p99']} us")
+
+
+if __name__ == "__main__":
+    main()
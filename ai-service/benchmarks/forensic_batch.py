@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Forensic throughput in images per second per core: one image at a time
+(analyze_sync) vs batches (analyze_batch_sync), plus the noise/edge
+statistics on their own against the CV_64F Laplacian + numpy var() they
+replaced.
+
+Runs on one thread, so CPU seconds are those of a single core. Every
+batch result is checked against the single-image result for the same
+image.
+Usage: python benchmarks/forensic_batch.py receipt.jpg photo.png --images 64 --batch 16
+"""
+import argparse
+import os
+import sys
+import time
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+
+def comparable(result: dict) -> dict:
+    # Timings differ from run to run
+    result = {key: value for key, value in result.items() if key != "decode"}
+    result["regions"] = {
+        key: value for key, value in result["regions"].items() if key != "detect_ms"
+    }
+    return result
+
+
+def old_statistics(gray, regions):
+    """The per-image code before the shared kernels"""
+    import cv2
+    import numpy as np
+
+    if len(regions) >= 3:
+        crops = [gray[y : y + h, x : x + w] for x, y, w, h in regions.tolist()]
+        [cv2.Laplacian(crop, cv2.CV_64F).var() for crop in crops]
+        sum(int(np.count_nonzero(cv2.Canny(crop, 100, 200))) for crop in crops)
+    else:
+        cv2.Laplacian(gray, cv2.CV_64F).var()
+        np.count_nonzero(cv2.Canny(gray, 100, 200))
+
+
+def new_statistics(loaded):
+    from app.core.forensic_kernels import region_statistics, stack_statistics
+
+    by_shape = {}
+    for gray, regions in loaded:
+        if regions is None:
+            by_shape.setdefault(gray.shape, []).append(gray)
+        else:
+            region_statistics(gray, regions)
+    for grays in by_shape.values():
+        stack_statistics(grays)
+
+
+def timed(fn, *args):
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = fn(*args)
+    return result, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--images", dest="count", type=int, default=64)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--decode-scale", type=int, default=4)
+    args = parser.parse_args()
+
+    import logging
+
+    logging.disable(logging.INFO)
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    import cv2
+
+    from app.agents.forensic_agent import ForensicAgent
+
+    cv2.setNumThreads(1)
+    agent = ForensicAgent(decode_scale=args.decode_scale)
+    paths = [args.images[index % len(args.images)] for index in range(args.count)]
+    agent.analyze_sync(paths[0])  # warm codecs and kernels
+
+    single, single_wall, single_cpu = timed(lambda: [agent.analyze_sync(path) for path in paths])
+
+    def batched():
+        results = []
+        for start in range(0, len(paths), args.batch):
+            results.extend(agent.analyze_batch_sync(paths[start : start + args.batch]))
+        return results
+
+    batch, batch_wall, batch_cpu = timed(batched)
+    mismatches = sum(
+        1 for one, many in zip(single, batch) if comparable(one) != comparable(many)
+    )
+    print(
+        f"single     {len(paths) / single_cpu:7.1f} images/s per core "
+        f"(wall {len(paths) / single_wall:.1f}/s)"
+    )
+    print(
+        f"batch {args.batch:<4d} {len(paths) / batch_cpu:7.1f} images/s per core "
+        f"(wall {len(paths) / batch_wall:.1f}/s)  results differing from single: {mismatches}"
+    )
+
+    # Statistics only, on already decoded full-resolution images
+    import numpy as np
+
+    check = lambda: None
+    loaded = []
+    for path in paths[: args.batch]:
+        image = agent._load(agent._prepare(path, check), check)
+        loaded.append((np.asarray(image.gray), image.regions))
+    _, _, old_cpu = timed(
+        lambda: [
+            old_statistics(gray, regions if regions is not None else np.empty((0, 4)))
+            for gray, regions in loaded
+        ]
+    )
+    _, _, new_cpu = timed(new_statistics, loaded)
+    print(
+        f"statistics CV_64F + var() {old_cpu / len(loaded) * 1000:.2f} ms/image, "
+        f"shared kernels {new_cpu / len(loaded) * 1000:.2f} ms/image"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Allocator churn and RSS growth of the forensic agent over a long soak,
+with fresh intermediates vs the per-thread buffer arena.
+
+Each mode runs in a fresh subprocess: --runs analyses cycling through the
+given images on one worker thread, like the analysis executor. "fresh"
+uses an arena with no budget, so every scratch array and encode buffer is
+allocated anew (and counted); "arena" keeps them between runs. Reported:
+scratch allocations and minor page faults per analysis (fresh memory
+being touched), RSS after warm-up and at the end, time per analysis, and
+after the soak the largest tracemalloc peak of one analysis (numpy and
+BytesIO memory).
+PIL's own image buffers (decode, crops, ELA differences) are not covered
+by the arena and show up in both modes.
+Usage: python benchmarks/forensic_buffers.py receipt.jpg photo.png --runs 2000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def child(images, runs: int, arena_mb: float) -> None:
+    """Runs in the subprocess; prints one JSON line"""
+    import logging
+
+    logging.disable(logging.INFO)
+    from app.agents.forensic_agent import ForensicAgent
+    from app.core.buffers import ArenaPool
+
+    arenas = ArenaPool(int(arena_mb * 1024 * 1024))
+    agent = ForensicAgent(arenas=arenas)
+    report = {}
+
+    def soak() -> None:
+        for image_path in images:  # warm-up: codecs, kernels, arena sizes
+            agent.analyze_sync(image_path)
+        before = arenas.stats()
+        report["rss_warm_mb"] = rss_mb()
+        faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+        samples = []
+        started = time.perf_counter()
+        for index in range(runs):
+            agent.analyze_sync(images[index % len(images)])
+            if index % max(1, runs // 20) == 0:
+                samples.append(rss_mb())
+        report["ms_per_analysis"] = (time.perf_counter() - started) * 1000 / runs
+        report["faults_per_analysis"] = (
+            resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults
+        ) / runs
+        after = arenas.stats()
+        allocations = (after["grown"] + after["oversize"]) - (before["grown"] + before["oversize"])
+        report["allocations_per_analysis"] = allocations / runs
+        report["allocated_mb_per_analysis"] = (after["allocated_mb"] - before["allocated_mb"]) / runs
+        report["scratch_requests_per_analysis"] = (after["requests"] - before["requests"]) / runs
+        report["rss_end_mb"] = rss_mb()
+        report["rss_max_mb"] = max(samples + [report["rss_end_mb"]])
+        report["arena_mb"] = after["held_mb"]
+
+        tracemalloc.start()
+        peaks = []
+        for image_path in images:
+            tracemalloc.reset_peak()
+            agent.analyze_sync(image_path)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        report["traced_peak_mb"] = max(peaks) / 1024 / 1024
+
+    # One worker thread, as on the analysis executor
+    worker = threading.Thread(target=soak)
+    worker.start()
+    worker.join()
+    print(json.dumps(report))
+
+
+def run(images, runs: int, arena_mb: float) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", str(arena_mb), "--runs", str(runs), *images],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--runs", type=int, default=2000)
+    parser.add_argument("--arena-mb", type=float, default=64)
+    parser.add_argument("--child", type=float, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        child(args.images, args.runs, args.child)
+        return
+
+    for label, arena_mb in (("fresh", 0), ("arena", args.arena_mb)):
+        report = run(args.images, args.runs, arena_mb)
+        print(
+            f"{label:5s} {report['allocations_per_analysis']:5.1f} of "
+            f"{report['scratch_requests_per_analysis']:.0f} scratch buffers "
+            f"({report['allocated_mb_per_analysis']:.2f} MB) allocated/analysis  "
+            f"{report['faults_per_analysis']:7.0f} minor faults/analysis  "
+            f"RSS {report['rss_warm_mb']:.0f} -> {report['rss_end_mb']:.0f} MB "
+            f"(max {report['rss_max_mb']:.0f})  arena {report['arena_mb']:.1f} MB  "
+            f"traced peak {report['traced_peak_mb']:.2f} MB  "
+            f"{report['ms_per_analysis']:.1f} ms/analysis"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Compare ForensicAgent decode cost at full resolution vs JPEG draft decoding.
+
+Each run happens in a fresh process so peak RSS is per request.
+Usage: python benchmarks/forensic_decode.py receipt.jpg [--scales 1 4 8]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _run(image_path: str, scale: int, queue) -> None:
+    from app.agents.forensic_agent import ForensicAgent
+
+    agent = ForensicAgent(decode_scale=scale)
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    started = time.perf_counter()
+    result = asyncio.run(agent.analyze(image_path))
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put(
+        {
+            "scale": scale,
+            "total_ms": round(elapsed_ms, 1),
+            "peak_rss_delta_mb": round((peak_kb - baseline_kb) / 1024, 1),
+            "manipulation_score": result["manipulation_score"],
+            "noise_score": round(result["noise_score"], 2),
+            "edge_score": result["edge_score"],
+            "decode": result["decode"],
+        }
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    for image_path in args.images:
+        print(f"== {image_path}")
+        for scale in args.scales:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_run, args=(image_path, scale, queue))
+            proc.start()
+            row = queue.get()
+            proc.join()
+            print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Analyses run under a client timeout storm, with and without the
+receipt_id idempotency store.
+
+--receipts receipts arrive over --arrival-seconds. Each analysis takes
+--analysis-seconds (+/- 50%, simulated: Gemini latency plus local CPU); the
+client gives up after --timeout-seconds and retries, up to --retries times,
+after --retry-delay-seconds. Without the store every attempt starts a new
+analysis; with it, retries attach to the running one or get its result.
+Usage: python benchmarks/idempotency.py --receipts 200 --timeout-seconds 2
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+
+async def storm(args, store) -> dict:
+    from app.core.metrics import percentiles
+
+    started_analyses = 0
+    answered_after = []
+    unanswered = 0
+
+    async def analysis(receipt_id: str):
+        nonlocal started_analyses
+        started_analyses += 1
+        await asyncio.sleep(args.analysis_seconds * random.uniform(0.5, 1.5))
+        return {"receipt_id": receipt_id, "verdict": "authentic", "issues": []}
+
+    async def client(receipt_id: str):
+        nonlocal unanswered
+        first_sent = time.perf_counter()
+        for attempt in range(args.retries + 1):
+            if store:
+                call = store.run(receipt_id, lambda: analysis(receipt_id))
+            else:
+                call = analysis(receipt_id)
+            try:
+                await asyncio.wait_for(call, timeout=args.timeout_seconds)
+                answered_after.append(time.perf_counter() - first_sent)
+                return
+            except asyncio.TimeoutError:
+                await asyncio.sleep(args.retry_delay_seconds)
+        unanswered += 1
+
+    random.seed(11)
+    clients = []
+    for index in range(args.receipts):
+        clients.append(asyncio.create_task(client(f"receipt-{index}")))
+        await asyncio.sleep(args.arrival_seconds / args.receipts)
+    await asyncio.gather(*clients)
+    return {
+        "analyses": started_analyses,
+        "answered": len(answered_after),
+        "unanswered": unanswered,
+        "latency": percentiles(answered_after),
+    }
+
+
+async def run(args) -> None:
+    from app.core.idempotency import IdempotencyStore
+
+    for label, store in (("no store", None), ("idempotent", IdempotencyStore())):
+        result = await storm(args, store)
+        print(
+            f"{label:10s} {result['analyses']:5d} analyses for {args.receipts} receipts  "
+            f"answered {result['answered']} (gave up {result['unanswered']})  "
+            f"time to answer p50 {result['latency']['p50']:.2f} s "
+            f"p95 {result['latency']['p95']:.2f} s"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--receipts", type=int, default=200)
+    parser.add_argument("--arrival-seconds", type=float, default=5)
+    parser.add_argument("--analysis-seconds", type=float, default=2.5)
+    parser.add_argument("--timeout-seconds", type=float, default=2.0)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--retry-delay-seconds", type=float, default=0.2)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
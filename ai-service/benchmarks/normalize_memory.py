@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Peak memory per analysis with and without the normalization stage.
+
+Each image is analyzed in a fresh subprocess by the local agents (forensic,
+metadata, text check) plus a full decode standing in for the Gemini upload,
+once on the original file and once after ImageNormalizer. The peak RSS
+growth over the idle process (ru_maxrss) is reported along with the
+normalizer's own estimate of its largest pixel buffers. Images the
+normalizer rejects are never decoded.
+Usage: python benchmarks/normalize_memory.py a.jpg b.png [--max-megapixels 16]
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+for name in ("GEMINI_API_KEY", "FIREBASE_PROJECT_ID", "CLOUDINARY_URL"):
+    os.environ.setdefault(name, "benchmark")
+
+
+def peak_rss_mb() -> float:
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def analyze(image_path: str) -> None:
+    from PIL import Image
+
+    from app.agents.forensic_agent import ForensicAgent
+    from app.agents.metadata_agent import MetadataAgent
+    from app.core.text_regions import check_text_regions
+
+    with Image.open(image_path) as img:
+        img.load()
+    await ForensicAgent().analyze(image_path)
+    await MetadataAgent().analyze(image_path)
+    check_text_regions(image_path)
+
+
+def child(image_path: str, normalize: bool, max_pixels: int, max_decode_pixels: int) -> None:
+    """Runs in the subprocess; prints one JSON line"""
+    import cv2  # noqa: F401 - imported before the baseline so it is not counted
+    from PIL import Image  # noqa: F401
+
+    from app.agents.forensic_agent import ForensicAgent  # noqa: F401
+    from app.core.normalize import ImageNormalizer, ImageRejectedError
+
+    baseline = peak_rss_mb()
+    report = {"rejected": False, "peak_pixel_bytes": None, "changes": []}
+    started = time.perf_counter()
+    path = image_path
+    try:
+        if normalize:
+            normalized = ImageNormalizer(max_pixels, max_decode_pixels).normalize(image_path)
+            report.update(
+                peak_pixel_bytes=normalized.peak_pixel_bytes, changes=normalized.changes
+            )
+            path = normalized.path
+        asyncio.run(analyze(path))
+    except ImageRejectedError as e:
+        report.update(rejected=True, error=str(e))
+    finally:
+        if path != image_path:
+            os.remove(path)
+    report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    report["peak_growth_mb"] = round(peak_rss_mb() - baseline, 1)
+    print(json.dumps(report))
+
+
+def measure(image_path: str, normalize: bool, args) -> dict:
+    # Work on a copy; the normalized file is written next to it
+    directory = tempfile.mkdtemp(prefix="normalize-bench-")
+    try:
+        copy = os.path.join(directory, os.path.basename(image_path))
+        shutil.copy(image_path, copy)
+        output = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--child",
+                copy,
+                "--normalize" if normalize else "--original",
+                "--max-megapixels",
+                str(args.max_megapixels),
+                "--decode-max-megapixels",
+                str(args.decode_max_megapixels),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--max-megapixels", type=float, default=16)
+    parser.add_argument("--decode-max-megapixels", type=float, default=40)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--normalize", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--original", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    max_pixels = int(args.max_megapixels * 1_000_000)
+    max_decode_pixels = int(args.decode_max_megapixels * 1_000_000)
+    if args.child:
+        child(args.images[0], args.normalize, max_pixels, max_decode_pixels)
+        return
+
+    from PIL import Image
+
+    print(
+        f"{'image':28s} {'size':>11s} {'mode':>5s}  {'original MB':>11s}  "
+        f"{'normalized MB':>13s}  {'est. pixels MB':>14s}  changes"
+    )
+    for image_path in args.images:
+        Image.MAX_IMAGE_PIXELS = None
+        with Image.open(image_path) as img:
+            size, mode = f"{img.width}x{img.height}", img.mode
+        try:
+            original = measure(image_path, False, args)
+            original_text = f"{original['peak_growth_mb']:11.1f}"
+        except subprocess.CalledProcessError:
+            original_text = f"{'failed':>11s}"
+        normalized = measure(image_path, True, args)
+        if normalized["rejected"]:
+            normalized_text, estimate, changes = f"{'rejected':>13s}", "", normalized["error"]
+        else:
+            normalized_text = f"{normalized['peak_growth_mb']:13.1f}"
+            estimate = f"{normalized['peak_pixel_bytes'] / 1e6:.1f}"
+            changes = ", ".join(normalized["changes"]) or "unchanged"
+        print(
+            f"{os.path.basename(image_path)[:28]:28s} {size:>11s} {mode:>5s}  {original_text}  "
+            f"{normalized_text}  {estimate:>14s}  {changes}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Replay recorded traffic through the orchestrator and report latency/throughput.
+
+Record first by running the service with REPLAY_MODE=record (Gemini responses,
+Firestore results and input images land in REPLAY_DIR). This script then
+re-issues the recorded analyses at their original arrival times with Gemini
+and Firestore served from disk; forensic and metadata agents run for real.
+Usage: python benchmarks/replay_load.py replay-data [--speed 2] [--latency-scale 1]
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+
+def load_arrivals(directory: str):
+    """(arrival offset seconds, image path) per recorded vision call"""
+    images = {
+        os.path.splitext(os.path.basename(path))[0]: path
+        for path in glob.glob(os.path.join(directory, "images", "*"))
+    }
+    arrivals = []
+    for path in glob.glob(os.path.join(directory, "vision", "*.json")):
+        with open(path) as f:
+            entry = json.load(f)
+        # key is "<model>:<image sha256>:<prompt variant>"
+        image_hash = entry["key"].split(":")[1]
+        if image_hash in images:
+            started = entry["recorded_at"] - entry["latency_ms"] / 1000
+            arrivals.append((started, images[image_hash]))
+    arrivals.sort()
+    if not arrivals:
+        return []
+    first = arrivals[0][0]
+    return [(started - first, image_path) for started, image_path in arrivals]
+
+
+async def run(arrivals, speed: float, repeat: int):
+    from app.core.container import container
+    from app.core.metrics import percentiles
+
+    orchestrator = container.orchestrator
+    latencies = []
+    verdicts = {}
+
+    async def one(index: int, delay: float, image_path: str):
+        await asyncio.sleep(delay)
+        started = time.perf_counter()
+        result = await orchestrator.analyze_receipt(image_path, f"replay-{index}")
+        latencies.append(time.perf_counter() - started)
+        verdicts[result["verdict"]] = verdicts.get(result["verdict"], 0) + 1
+
+    span = (arrivals[-1][0] / speed) if arrivals else 0
+    tasks = []
+    for round_index in range(repeat):
+        for i, (offset, image_path) in enumerate(arrivals):
+            delay = round_index * span + offset / speed
+            tasks.append(one(round_index * len(arrivals) + i, delay, image_path))
+
+    started = time.perf_counter()
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "latency_seconds": percentiles(latencies),
+        "verdicts": verdicts,
+        "replay": container.replay.stats(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("directory", help="REPLAY_DIR used while recording")
+    parser.add_argument("--speed", type=float, default=1.0, help="Arrival rate multiplier")
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the trace N times")
+    args = parser.parse_args()
+
+    # Must be set before app.config is imported
+    os.environ["REPLAY_MODE"] = "replay"
+    os.environ["REPLAY_DIR"] = os.path.abspath(args.directory)
+    os.environ["REPLAY_LATENCY_SCALE"] = str(args.latency_scale)
+    os.environ["AGENT_STORE_DIR"] = ""
+
+    arrivals = load_arrivals(args.directory)
+    if not arrivals:
+        sys.exit(f"No recorded vision calls with images in {args.directory}")
+
+    report = asyncio.run(run(arrivals, args.speed, args.repeat))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Re-score synthetic history with the vectorized batch scorer.
+
+Writes --records rows as NPZ shards, checks a sample against
+ReasoningAgent row by row, then times loading and re-scoring.
+Usage: python benchmarks/rescore.py [--records 1000000] [--shard-size 100000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from app.agents.batch_scorer import compare_rules, score_columns  # noqa: E402
+from app.agents.reasoning_agent import ReasoningAgent  # noqa: E402
+from app.core.agent_store import AgentOutputStore, extract_row, load_shards  # noqa: E402
+
+
+def synthetic_results(rng: np.random.Generator) -> dict:
+    """Agent outputs shaped like the real ones, with agents sometimes missing"""
+    results = {}
+    if rng.random() < 0.9:
+        results["vision"] = {
+            "confidence": int(rng.integers(0, 101)),
+            "ocr_text": "x" * int(rng.integers(0, 60)),
+        }
+    if rng.random() < 0.95:
+        results["forensic"] = {"manipulation_score": float(rng.integers(0, 100))}
+    if rng.random() < 0.95:
+        results["metadata"] = {"flags": ["flag"] * int(rng.integers(0, 4))}
+    if rng.random() < 0.85:
+        results["reputation"] = {
+            "total_fraud_reports": int(rng.poisson(0.3)),
+            "merchant": {"verified": bool(rng.random() < 0.3)},
+        }
+    if rng.random() < 0.3:
+        results["template"] = {
+            "matched": bool(rng.random() < 0.8),
+            "layout_deviation": int(rng.integers(0, 101)),
+        }
+    if rng.random() < 0.5:
+        receipts = int(rng.integers(1, 12))
+        results["network"] = {
+            "ring": {
+                "receipts": receipts,
+                "submitters": int(rng.integers(1, receipts + 1)),
+                "merchants": int(rng.integers(1, receipts + 1)),
+            }
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--shard-size", type=int, default=100_000)
+    parser.add_argument(
+        "--check", type=int, default=5000, help="Rows checked against ReasoningAgent"
+    )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    reasoning = ReasoningAgent()
+    templates = [synthetic_results(rng) for _ in range(args.check)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = AgentOutputStore(directory, shard_size=args.shard_size)
+
+        async def record_all():
+            expected = []
+            for i, results in enumerate(templates):
+                final = await reasoning.synthesize(results)
+                expected.append((final["trust_score"], final["verdict"]))
+                await store.record(f"r{i}", results, final)
+            return expected
+
+        expected = asyncio.run(record_all())
+        store.flush()
+
+        # Parity: vectorized scorer == scalar reasoning agent
+        columns = load_shards(directory)
+        scores, verdicts = score_columns(columns)
+        mismatches = sum(
+            1
+            for (score, verdict), got_score, got_verdict in zip(expected, scores, verdicts)
+            if score != got_score or verdict != got_verdict
+        )
+        print(f"parity   {len(expected)} rows checked, {mismatches} mismatches")
+
+        # Scale up: tile the checked rows into full-size shards
+        row_template = [extract_row(f"r{i}", r, {}) for i, r in enumerate(templates)]
+        for name in columns:
+            columns[name] = np.array(
+                [row[name] for row in row_template], dtype=columns[name].dtype
+            )
+        repeats = max(1, args.records // len(row_template))
+        for start in range(0, repeats * len(row_template), args.shard_size):
+            count = min(args.shard_size, repeats * len(row_template) - start)
+            shard = {name: np.resize(values, count) for name, values in columns.items()}
+            np.savez_compressed(
+                os.path.join(directory, f"agent-outputs-bench-{start:09d}.npz"), **shard
+            )
+
+        size_mb = sum(
+            os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+        ) / 1e6
+        started = time.perf_counter()
+        history = load_shards(directory)
+        load_s = time.perf_counter() - started
+
+        report = compare_rules(
+            history, {"authentic_min_score": 75, "metadata_flag_penalty": 5}
+        )
+        rate = report["records"] / report["scoring_seconds"] / 1e6
+        print(f"history  {report['records']:,} records in {size_mb:.1f} MB of shards")
+        print(f"load     {load_s:6.2f} s")
+        print(
+            f"rescore  {report['scoring_seconds']:6.2f} s for two rule sets "
+            f"({rate:.1f}M records/s)"
+        )
+        print(f"shift    {report['changed_verdicts']:,} verdicts changed: {report['transitions']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Analysis latency added by persisting results: one synchronous Firestore
+write per request vs the write-behind FirestoreResultWriter.
+
+Firestore is simulated: each commit costs --commit-ms plus --per-doc-ms per
+document, and for --outage-seconds in the middle of the write-behind run
+every commit fails (the spill file absorbs it). --requests analyses finish
+at --rate per second.
+Usage: python benchmarks/result_writer.py --requests 2000 --rate 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+AGENT_RESULTS = {
+    "vision": {"ocr_text": "OPay Transfer Successful NGN 25,000.00 " * 8, "confidence": 90},
+    "forensic": {"manipulation_score": 12.5, "techniques_detected": []},
+    "metadata": {"flags": []},
+    "reputation": {"total_fraud_reports": 0, "merchant": None},
+}
+FINAL = {"trust_score": 82, "verdict": "authentic", "issues": [], "recommendation": "ok"}
+
+
+class SimulatedFirestore:
+    def __init__(self, commit_ms: float, per_doc_ms: float):
+        self.commit = commit_ms / 1000
+        self.per_doc = per_doc_ms / 1000
+        self.down = False
+        self.commits = 0
+        self.documents = 0
+
+    def collection(self, name):
+        return self
+
+    def document(self, doc_id):
+        return doc_id
+
+    def batch(self):
+        db = self
+
+        class Batch:
+            def __init__(self):
+                self.ops = 0
+
+            def set(self, ref, document):
+                self.ops += 1
+
+            def commit(self):
+                time.sleep(db.commit + db.per_doc * self.ops)
+                if db.down:
+                    raise RuntimeError("503 unavailable")
+                db.commits += 1
+                db.documents += self.ops
+
+        return Batch()
+
+
+async def run(args) -> None:
+    from app.core.metrics import percentiles
+    from app.core.result_writer import FirestoreResultWriter, build_document
+
+    interval = 1 / args.rate
+
+    # Synchronous: every request waits for its own single-document commit
+    db = SimulatedFirestore(args.commit_ms, args.per_doc_ms)
+
+    async def sync_record(receipt_id):
+        document = build_document(receipt_id, AGENT_RESULTS, FINAL)
+        batch = db.batch()
+        batch.set(db.document(receipt_id), document)
+        await asyncio.to_thread(batch.commit)
+
+    sync_latency = await drive(sync_record, args.requests, interval)
+    print(
+        f"sync         added latency p50 {percentiles(sync_latency)['p50']:.2f} ms "
+        f"p99 {percentiles(sync_latency)['p99']:.2f} ms  {db.commits} commits"
+    )
+
+    db = SimulatedFirestore(args.commit_ms, args.per_doc_ms)
+    spill_dir = tempfile.mkdtemp(prefix="result-spill-")
+    writer = FirestoreResultWriter(
+        lambda: db,
+        flush_seconds=args.flush_seconds,
+        retry_base_seconds=0.05,
+        spill_dir=spill_dir,
+    )
+    outage_at = args.requests // 3
+    outage_requests = int(args.outage_seconds * args.rate)
+
+    async def behind_record(receipt_id):
+        index = int(receipt_id)
+        db.down = outage_at <= index < outage_at + outage_requests
+        await writer.record(receipt_id, AGENT_RESULTS, FINAL)
+
+    behind_latency = await drive(behind_record, args.requests, interval)
+    db.down = False
+    # Let the spilled records be written back, then flush the rest
+    deadline = time.monotonic() + 120
+    while db.documents < args.requests and time.monotonic() < deadline:
+        await asyncio.sleep(0.2)
+    await writer.drain()
+    stats = writer.stats()
+    print(
+        f"write-behind added latency p50 {percentiles(behind_latency)['p50']:.2f} ms "
+        f"p99 {percentiles(behind_latency)['p99']:.2f} ms  {db.commits} commits"
+    )
+    print(
+        f"             flush p50 {stats['flush_ms']['p50']:.0f} ms, mean batch "
+        f"{stats['batch_size']['mean']:.0f}, spilled {stats['spilled']}, "
+        f"recovered {stats['recovered']}, {db.documents}/{args.requests} documents written"
+    )
+
+
+async def drive(record, requests: int, interval: float):
+    latencies = []
+    started = time.perf_counter()
+    for index in range(requests):
+        # Paced arrivals, as analyses finish
+        delay = started + index * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        call_started = time.perf_counter()
+        await record(str(index))
+        latencies.append((time.perf_counter() - call_started) * 1000)
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=200)
+    parser.add_argument("--commit-ms", type=float, default=25)
+    parser.add_argument("--per-doc-ms", type=float, default=0.2)
+    parser.add_argument("--flush-seconds", type=float, default=1.0)
+    parser.add_argument("--outage-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Per-receipt tokens and latency: one Gemini request per receipt vs batches.
+
+Runs --receipts analyses through VisionAgent with --concurrency callers
+(the job queue's workers), first one request per receipt, then through
+VisionBatcher. By default Gemini is simulated: each request costs a fixed
+--overhead-ms plus --per-image-ms per image, prompt tokens are the prompt
+text plus 258 per image, and --drop-rate of batch answers are left out to
+exercise the per-image fallback. With --live the real model is called
+(GEMINI_API_KEY must be set).
+Usage: python benchmarks/vision_batching.py receipt.jpg [more.jpg ...] [--batch 4]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+for name in ("GEMINI_API_KEY", "FIREBASE_PROJECT_ID", "CLOUDINARY_URL"):
+    os.environ.setdefault(name, "benchmark")
+
+IMAGE_TOKENS = 258
+ANSWER = {
+    "ocr_text": "OPay Transfer Successful NGN 25,000.00 Account 0123456789",
+    "merchant_name": "OPay",
+    "total_amount": 25000,
+    "currency": "NGN",
+    "receipt_date": "2023-10-19",
+    "items": [],
+    "account_numbers": ["0123456789"],
+    "phone_numbers": [],
+    "visual_quality": "excellent",
+    "visual_anomalies": [],
+    "confidence_score": 90,
+}
+
+
+class SimulatedGemini:
+    """generate_content_async with a fixed + per-image latency and token model"""
+
+    def __init__(self, overhead_ms: float, per_image_ms: float, drop_rate: float):
+        self.overhead = overhead_ms / 1000
+        self.per_image = per_image_ms / 1000
+        self.drop_rate = drop_rate
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    async def generate_content_async(self, contents, stream=False):
+        images = [part for part in contents if not isinstance(part, str)]
+        await asyncio.sleep(self.overhead + self.per_image * len(images))
+        labels = [
+            match.group(1)
+            for part in contents
+            if isinstance(part, str)
+            for match in [re.match(r"Receipt (\S+):$", part)]
+            if match
+        ]
+        if labels:
+            answers = [
+                {"receipt_key": label, **ANSWER}
+                for label in labels
+                if random.random() >= self.drop_rate
+            ]
+            text = "```json\n" + json.dumps(answers) + "\n```"
+        else:
+            text = json.dumps(ANSWER)
+
+        prompt_tokens = sum(len(part) // 4 for part in contents if isinstance(part, str))
+        prompt_tokens += IMAGE_TOKENS * len(images)
+        output_tokens = len(text) // 4
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens
+        self.output_tokens += output_tokens
+
+        class Response:
+            pass
+
+        response = Response()
+        response.text = text
+        response.usage_metadata = Response()
+        response.usage_metadata.prompt_token_count = prompt_tokens
+        response.usage_metadata.candidates_token_count = output_tokens
+        return response
+
+
+async def drive(analyze, images, receipts: int, concurrency: int):
+    """Per-receipt latencies of `receipts` calls from `concurrency` workers"""
+    queue = asyncio.Queue()
+    for index in range(receipts):
+        queue.put_nowait((f"receipt-{index}", images[index % len(images)]))
+    latencies = []
+
+    async def worker():
+        while not queue.empty():
+            receipt_id, image_path = queue.get_nowait()
+            started = time.perf_counter()
+            await analyze(image_path, receipt_id)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started
+
+
+async def run(args) -> None:
+    from app.agents.vision_agent import VisionAgent
+    from app.agents.vision_batcher import VisionBatcher
+    from app.core.metrics import percentiles
+
+    random.seed(7)
+    agent = VisionAgent(os.environ["GEMINI_API_KEY"], stream=False)
+    model = None
+    if not args.live:
+        model = agent.model = SimulatedGemini(args.overhead_ms, args.per_image_ms, args.drop_rate)
+
+    single, single_seconds = await drive(
+        lambda image_path, receipt_id: agent.analyze(image_path),
+        args.images, args.receipts, args.concurrency,
+    )
+    single_tokens = (model.prompt_tokens + model.output_tokens) / args.receipts if model else None
+    single_requests = model.requests if model else args.receipts
+
+    if model:
+        model.requests = model.prompt_tokens = model.output_tokens = 0
+    batcher = VisionBatcher(agent, max_batch=args.batch, window_ms=args.window_ms)
+    batched, batched_seconds = await drive(
+        batcher.analyze, args.images, args.receipts, args.concurrency
+    )
+    stats = batcher.stats()
+
+    def line(label, latencies, seconds, requests, tokens):
+        values = percentiles(latencies)
+        token_text = f"{tokens:.0f} tokens/receipt" if tokens else "tokens n/a"
+        print(
+            f"{label:8s} {requests:4d} requests  {token_text}  latency p50 "
+            f"{values['p50']:.0f} ms p95 {values['p95']:.0f} ms  "
+            f"{args.receipts / seconds:.1f} receipts/s"
+        )
+
+    line("single", single, single_seconds, single_requests, single_tokens)
+    line(
+        "batched",
+        batched,
+        batched_seconds,
+        model.requests if model else stats["batches"],
+        (model.prompt_tokens + model.output_tokens) / args.receipts
+        if model
+        else stats["tokens_per_receipt"]["mean"],
+    )
+    print(
+        f"batches  {stats['batches']} (mean size {stats['batch_size']['mean']}), "
+        f"{stats['fallbacks']} per-image fallbacks, "
+        f"amortized Gemini latency {stats['latency_ms_per_receipt']['p50']} ms/receipt (p50)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--receipts", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=4)
+    parser.add_argument("--window-ms", type=float, default=200)
+    parser.add_argument("--overhead-ms", type=float, default=900)
+    parser.add_argument("--per-image-ms", type=float, default=350)
+    parser.add_argument("--drop-rate", type=float, default=0.05)
+    parser.add_argument("--live", action="store_true", help="call the real Gemini API")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Latency saved by streaming Gemini output into early reputation lookups.
+
+Replays recorded traffic (REPLAY_MODE=record captures each streamed Gemini
+response with its chunk timings, plus every Firestore lookup) through the
+orchestrator twice per image: once waiting for the whole vision result
+before reputation starts, once with lookups started from the streamed
+fields. With --synthesize, a recording is first written for the given
+images: a JSON answer delivered in --chunks pieces over --gemini-ms, and
+Firestore lookups taking --firestore-ms each.
+Usage: python benchmarks/vision_streaming.py replay-data [--synthesize a.jpg b.jpg]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+OCR_TEXT = (
+    "OPay Transfer Successful Amount NGN 25,000.00 Recipient Chinedu Okafor "
+    "Account 0123456789 Bank Access Bank Sender Adaeze Nwosu Phone 08031234567 "
+    "Session ID 100004231019154512345678901234 Reference TRF2310191545 "
+    "Date 19 Oct 2023 15:45:12 Narration Rent payment October"
+)
+
+
+def synthesize(directory: str, images, gemini_ms: float, firestore_ms: float, chunks: int):
+    """Write replay entries for images as if recorded from the live services"""
+    from app.agents.reputation_agent import ReputationAgent
+    from app.agents.vision_agent import VisionAgent
+    from app.core.imaging import file_sha256
+    from app.core.replay import TrafficReplay
+
+    replay = TrafficReplay("record", directory)
+    answer = json.dumps(
+        {
+            "ocr_text": OCR_TEXT,
+            "merchant_name": "OPay",
+            "total_amount": 25000,
+            "currency": "NGN",
+            "receipt_date": "2023-10-19",
+            "items": ["Transfer to Chinedu Okafor", "Rent payment October"],
+            "account_numbers": ["0123456789"],
+            "phone_numbers": ["08031234567"],
+            "visual_quality": "excellent",
+            "visual_anomalies": [],
+            "confidence_score": 90,
+        },
+        indent=2,
+    )
+    # Time to first token, then evenly spaced chunks
+    first_ms = gemini_ms * 0.3
+    step = len(answer) / chunks
+    offsets = [
+        [round(first_ms + (gemini_ms - first_ms) * i / (chunks - 1), 2), round(step * (i + 1))]
+        for i in range(chunks)
+    ]
+    offsets[-1][1] = len(answer)
+
+    def write(kind: str, key: str, latency_ms: float, result, **extra):
+        entry = {
+            "kind": kind,
+            "key": key,
+            "latency_ms": latency_ms,
+            "recorded_at": time.time(),
+            "result": result,
+            **extra,
+        }
+        replay._write(replay._path(kind, key), entry)
+
+    for image_path in images:
+        image_hash = file_sha256(image_path)
+        key = f"{VisionAgent.model_name}:{image_hash}"
+        write("vision", key, gemini_ms, answer, chunks=offsets)
+        replay.save_image(image_path, image_hash)
+
+    words = OCR_TEXT.split()
+    names = ["OPay"] + [" ".join(words[i : i + 3]) for i in range(len(words) - 2)]
+    for name in names:
+        write("firestore", f"businesses:{name}", firestore_ms, None)
+    for account_number in ReputationAgent(None)._extract_account_numbers(OCR_TEXT):
+        account_hash = hashlib.sha256(account_number.encode()).hexdigest()
+        write("firestore", f"fraud_reports:{account_hash}", firestore_ms, 0)
+    print(f"synthesized {len(images)} vision and {len(names) + 1} Firestore entries in {directory}")
+
+
+async def run(images, repeat: int):
+    from app.core.container import container
+    from app.core.metrics import percentiles
+
+    orchestrator = container.orchestrator
+    vision = container.vision_agent
+    results = {}
+    for streamed in (False, True):
+        vision.stream = streamed
+        totals, reputation_ends, verdicts = [], [], set()
+        for round_index in range(repeat):
+            for index, image_path in enumerate(images):
+                started = time.perf_counter()
+                result = await orchestrator.analyze_receipt(
+                    image_path, f"stream-{int(streamed)}-{round_index}-{index}"
+                )
+                totals.append((time.perf_counter() - started) * 1000)
+                nodes = result["pipeline"]["nodes"]
+                reputation_ends.append(nodes["reputation"]["end_ms"] - nodes["vision"]["end_ms"])
+                verdicts.add((result["verdict"], result["trust_score"]))
+        results[streamed] = (percentiles(totals), percentiles(reputation_ends), verdicts)
+
+    for streamed, (total, tail, verdicts) in results.items():
+        label = "streamed" if streamed else "buffered"
+        print(
+            f"{label:9s} total p50 {total['p50']:.1f} ms p95 {total['p95']:.1f} ms  "
+            f"reputation finishes {tail['p50']:.1f} ms after vision (p50)"
+        )
+    saved = results[False][0]["p50"] - results[True][0]["p50"]
+    print(f"saved     {saved:.1f} ms at p50")
+    print(f"same verdicts: {results[False][2] == results[True][2]}")
+    print(f"prefetch  {container.reputation_agent.prefetch_stats()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("directory")
+    parser.add_argument("--synthesize", nargs="+", metavar="IMAGE")
+    parser.add_argument("--gemini-ms", type=float, default=2500.0)
+    parser.add_argument("--firestore-ms", type=float, default=60.0)
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ.update(
+        REPLAY_MODE="replay", REPLAY_DIR=args.directory, WARM_UP_ON_STARTUP="false"
+    )
+    for name in ("GEMINI_API_KEY", "FIREBASE_PROJECT_ID", "CLOUDINARY_URL"):
+        os.environ.setdefault(name, "benchmark")
+
+    if args.synthesize:
+        synthesize(args.directory, args.synthesize, args.gemini_ms, args.firestore_ms, args.chunks)
+        images = args.synthesize
+    else:
+        from replay_load import load_arrivals
+
+        images = sorted({image_path for _, image_path in load_arrivals(args.directory)})
+    if not images:
+        print("No recorded images with vision responses found")
+        return
+    asyncio.run(run(images, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
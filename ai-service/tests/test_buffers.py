@@ -0,0 +1,66 @@
+import threading
+
+import numpy as np
+
+from app.core.buffers import ArenaPool, BufferArena, scratch
+
+
+def test_same_key_and_shape_gets_the_same_buffer():
+    arena = BufferArena()
+    first = arena.array("stats.edges", (480, 640), np.uint8)
+    second = arena.array("stats.edges", (480, 640), np.uint8)
+
+    assert second.ctypes.data == first.ctypes.data
+    assert second.shape == (480, 640) and second.flags.c_contiguous
+    assert arena.counters["grown"] == 1 and arena.counters["reused"] == 1
+    assert arena.counters["allocated_bytes"] == 480 * 640
+
+
+def test_smaller_shapes_are_views_of_the_same_buffer():
+    arena = BufferArena()
+    large = arena.array("stats.laplacian", (480, 640), np.int16)
+    small = arena.array("stats.laplacian", (100, 200), np.int16)
+
+    assert np.shares_memory(large, small)
+    assert small.shape == (100, 200)
+    assert arena.counters["grown"] == 1
+
+
+def test_names_and_dtypes_get_separate_buffers():
+    arena = BufferArena()
+    edges = arena.array("stats.edges", (64, 64), np.uint8)
+    binary = arena.array("text.binary", (64, 64), np.uint8)
+    wide = arena.array("stats.edges", (64, 64), np.int16)
+
+    assert not np.shares_memory(edges, binary)
+    assert not np.shares_memory(edges, wide)
+
+
+def test_growth_and_oversize():
+    arena = BufferArena(max_bytes=1_000_000)
+    arena.array("text.labels", (100, 100), np.uint8)
+    grown = arena.array("text.labels", (110, 100), np.uint8)
+    # Grown with headroom, so a slightly larger request still fits
+    assert arena.array("text.labels", (120, 100), np.uint8).ctypes.data == grown.ctypes.data
+
+    oversize = arena.array("text.gradient", (2000, 1000), np.uint8)
+    assert oversize.shape == (2000, 1000)
+    assert arena.counters["oversize"] == 1
+    assert arena.held_bytes <= 1_000_000
+
+
+def test_pool_hands_each_thread_its_own_arena():
+    pool = ArenaPool()
+    arenas = []
+    thread = threading.Thread(target=lambda: arenas.append(pool.get()))
+    thread.start()
+    thread.join()
+
+    assert pool.get() is pool.get()
+    assert arenas[0] is not pool.get()
+
+
+def test_scratch_without_an_arena_allocates():
+    first = scratch(None, "stats.edges", (8, 8), np.uint8)
+    second = scratch(None, "stats.edges", (8, 8), np.uint8)
+    assert not np.shares_memory(first, second)
@@ -0,0 +1,115 @@
+import pytest
+
+from app.agents.network_agent import NetworkAgent
+from app.core.entity_graph import DAY_SECONDS, EntityGraph
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def add(graph, receipt_id, account, merchant, submitter, timestamp=None):
+    return graph.add_receipt(
+        receipt_id,
+        {"account": [account], "merchant": [merchant]},
+        submitter_id=submitter,
+        timestamp=timestamp,
+    )
+
+
+def test_counts_distinct_receipts_submitters_and_merchants():
+    graph = EntityGraph()
+    add(graph, "r1", "acct", "shop a", "u1")
+    add(graph, "r2", "acct", "shop b", "u2")
+    add(graph, "r3", "acct", "shop b", "u1")
+
+    assert graph.neighbourhood("account", "acct", 30) == {
+        "receipts": 3,
+        "submitters": 2,
+        "merchants": 2,
+    }
+    assert graph.neighbourhood("account", "other", 30)["receipts"] == 0
+
+
+def test_reindexing_a_receipt_does_not_inflate_counts():
+    graph = EntityGraph()
+    assert add(graph, "r1", "acct", "shop", "u1")
+    assert not add(graph, "r1", "acct", "shop", "u1")
+    assert graph.neighbourhood("account", "acct", 30)["receipts"] == 1
+
+
+def test_window_only_counts_recent_receipts():
+    clock = Clock()
+    graph = EntityGraph(clock=clock)
+    add(graph, "old", "acct", "shop a", "u1", timestamp=clock.now - 40 * DAY_SECONDS)
+    add(graph, "new", "acct", "shop b", "u2")
+
+    assert graph.neighbourhood("account", "acct", 30)["receipts"] == 1
+    assert graph.neighbourhood("account", "acct", 60)["receipts"] == 2
+
+
+def test_prune_drops_expired_receipts_entities_and_submitters():
+    clock = Clock()
+    graph = EntityGraph(retention_days=10, clock=clock)
+    for i in range(50):
+        add(graph, f"old{i}", f"acct{i}", f"shop{i}", f"u{i}",
+            timestamp=clock.now - 20 * DAY_SECONDS)
+    add(graph, "new1", "acct0", "fresh", "v1")
+    add(graph, "new2", "acct0", "fresher", "v2")
+
+    assert graph.prune() == 100
+    stats = graph.stats()
+    assert stats["receipts"] == 2
+    assert stats["submitters"] == 2
+    # acct0 plus the two fresh merchant names
+    assert sum(stats["entities"].values()) == 3
+    assert graph.neighbourhood("account", "acct0", 30) == {
+        "receipts": 2,
+        "submitters": 2,
+        "merchants": 2,
+    }
+    assert graph.neighbourhood("account", "acct1", 30)["receipts"] == 0
+
+    # Renumbered IDs keep working for new receipts
+    add(graph, "new3", "acct0", "fresh", "v1")
+    assert graph.neighbourhood("account", "acct0", 30) == {
+        "receipts": 3,
+        "submitters": 2,
+        "merchants": 2,
+    }
+
+
+def test_max_receipts_evicts_the_oldest():
+    clock = Clock()
+    graph = EntityGraph(max_receipts=100, clock=clock)
+    for i in range(1000):
+        clock.now += 1
+        add(graph, f"r{i}", f"acct{i % 7}", f"shop{i % 3}", f"u{i % 11}")
+
+    stats = graph.stats()
+    assert stats["receipts"] <= 100
+    assert stats["evicted_receipts"] == 1000 - stats["receipts"]
+    # Whatever survived is the most recent stretch of receipts
+    kept = sum(graph.neighbourhood("account", f"acct{i}", 30)["receipts"] for i in range(7))
+    assert kept == stats["receipts"]
+    assert add(graph, "r999", "acct0", "shop0", "u0") is False
+    assert add(graph, "r0", "acct0", "shop0", "u0") is True
+
+
+@pytest.mark.asyncio
+async def test_network_agent_reports_the_most_varied_entity():
+    agent = NetworkAgent(EntityGraph())
+    for i, submitter in enumerate(["u1", "u2", "u3"]):
+        result = await agent.analyze(
+            {"account_numbers": ["0123456789"], "merchant_name": f"Shop {i}"},
+            receipt_id=f"r{i}",
+            submitter_id=submitter,
+        )
+
+    assert result["ring"] == {"receipts": 3, "submitters": 3, "merchants": 3}
+    assert result["max_submitters"] == 3
+    assert "0123456789" not in str(result)
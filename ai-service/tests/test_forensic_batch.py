@@ -0,0 +1,69 @@
+import pytest
+from PIL import Image, ImageDraw
+
+from app.agents.forensic_agent import ForensicAgent
+from app.core.buffers import ArenaPool
+
+
+def slip(path, size=(480, 640), lines=8, seed=0, fmt="JPEG"):
+    """A light receipt-like image with a few lines of dark text blocks"""
+    img = Image.new("RGB", size, (235, 232, 225))
+    draw = ImageDraw.Draw(img)
+    for line in range(lines):
+        y = 40 + line * 60
+        x = 30
+        for word in range((seed + line) % 4 + 2):
+            width = 40 + 13 * ((seed * 7 + line * 3 + word) % 5)
+            for stroke in range(0, width, 6):
+                draw.rectangle((x + stroke, y, x + stroke + 3, y + 22), fill=(20, 20, 20))
+            x += width + 25
+    img.save(path, format=fmt, quality=85)
+    return str(path)
+
+
+def comparable(result):
+    # Timings differ from run to run
+    result = {key: value for key, value in result.items() if key != "decode"}
+    result["regions"] = {
+        key: value for key, value in result["regions"].items() if key != "detect_ms"
+    }
+    return result
+
+
+@pytest.fixture
+def images(tmp_path):
+    broken = tmp_path / "broken.jpg"
+    broken.write_bytes(b"not an image")
+    return [
+        slip(tmp_path / "text.jpg"),
+        # Full-image mode, two of the same size stacked together
+        slip(tmp_path / "blank.jpg", lines=0),
+        slip(tmp_path / "sparse.jpg", lines=1, seed=3),
+        slip(tmp_path / "other_size.png", size=(400, 560), seed=5, fmt="PNG"),
+        str(broken),
+        slip(tmp_path / "text2.jpg", seed=2),
+    ]
+
+
+@pytest.mark.parametrize("arenas", [None, ArenaPool()])
+def test_batch_matches_single_image_path(images, arenas):
+    agent = ForensicAgent(arenas=arenas)
+    batch = agent.analyze_batch_sync(images)
+
+    assert len(batch) == len(images)
+    modes = []
+    for path, result in zip(images, batch):
+        if path.endswith("broken.jpg"):
+            assert isinstance(result, Exception)
+            with pytest.raises(Exception):
+                agent.analyze_sync(path)
+            continue
+        assert comparable(result) == comparable(agent.analyze_sync(path))
+        modes.append(result["regions"]["mode"])
+    assert "text" in modes and "full" in modes
+
+
+@pytest.mark.asyncio
+async def test_analyze_batch_without_executor(images):
+    results = await ForensicAgent().analyze_batch(images[:2])
+    assert [result["regions"]["mode"] for result in results] == ["text", "full"]
@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+
+from app.core.idempotency import IdempotencyStore
+
+
+class Analysis:
+    """analyze() stand-in that finishes when release() is called"""
+
+    def __init__(self, result=None, error=None):
+        self.calls = 0
+        self.cancelled = 0
+        self.result = result if result is not None else {"verdict": "authentic"}
+        self.error = error
+        self.gate = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.gate.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error:
+            raise self.error
+        return self.result
+
+    def release(self):
+        self.gate.set()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_analysis():
+    store = IdempotencyStore()
+    analysis = Analysis()
+    first = asyncio.create_task(store.run("r1", analysis))
+    second = asyncio.create_task(store.run("r1", analysis))
+    await asyncio.sleep(0)
+    analysis.release()
+
+    assert sorted([(await first)[1], (await second)[1]]) == ["joined", "started"]
+    assert analysis.calls == 1
+    assert store.counters["joined"] == 1
+
+
+@pytest.mark.asyncio
+async def test_finished_result_is_stored_until_ttl():
+    store = IdempotencyStore(ttl_seconds=0.05)
+    analysis = Analysis()
+    analysis.release()
+
+    assert (await store.run("r1", analysis))[1] == "started"
+    result, status = await store.run("r1", analysis)
+    assert status == "stored"
+    assert result == analysis.result
+    assert analysis.calls == 1
+
+    await asyncio.sleep(0.06)
+    assert (await store.run("r1", analysis))[1] == "started"
+    assert analysis.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_failures_and_unwanted_results_are_not_kept():
+    store = IdempotencyStore(should_store=lambda result: result["verdict"] != "unclear")
+    failing = Analysis(error=RuntimeError("gemini down"))
+    failing.release()
+    with pytest.raises(RuntimeError):
+        await store.run("r1", failing)
+    assert store.counters["failed"] == 1
+
+    unclear = Analysis(result={"verdict": "unclear"})
+    unclear.release()
+    await store.run("r1", unclear)
+    assert (await store.run("r1", unclear))[1] == "started"
+    assert unclear.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_caller_leaving_does_not_cancel_the_analysis():
+    store = IdempotencyStore(abandon_grace_seconds=10)
+    analysis = Analysis()
+    caller = asyncio.create_task(store.run("r1", analysis))
+    await asyncio.sleep(0)
+    caller.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+
+    # A retry within the grace period attaches to the same analysis
+    retry = asyncio.create_task(store.run("r1", analysis))
+    await asyncio.sleep(0)
+    analysis.release()
+    assert (await retry)[1] == "joined"
+    assert analysis.calls == 1
+    assert analysis.cancelled == 0
+
+
+@pytest.mark.asyncio
+async def test_analysis_nobody_waits_for_is_cancelled_after_grace():
+    store = IdempotencyStore(abandon_grace_seconds=0.02)
+    analysis = Analysis()
+    caller = asyncio.create_task(store.run("r1", analysis))
+    await asyncio.sleep(0)
+    caller.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+
+    await asyncio.sleep(0.05)
+    assert analysis.cancelled == 1
+    assert store.counters["abandoned"] == 1
+    assert store.stats()["in_progress"] == 0
+
+    # The next request starts afresh
+    analysis.release()
+    assert (await store.run("r1", analysis))[1] == "started"
+
+
+@pytest.mark.asyncio
+async def test_without_grace_unwaited_analyses_complete_and_are_stored():
+    store = IdempotencyStore(abandon_grace_seconds=None)
+    analysis = Analysis()
+    caller = asyncio.create_task(store.run("r1", analysis))
+    await asyncio.sleep(0)
+    caller.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+
+    analysis.release()
+    await asyncio.sleep(0)
+    assert (await store.run("r1", analysis))[1] == "stored"
+    assert analysis.cancelled == 0
+
+
+@pytest.mark.asyncio
+async def test_oldest_completed_entries_are_evicted():
+    store = IdempotencyStore(max_entries=2)
+    for key in ("a", "b", "c"):
+        analysis = Analysis()
+        analysis.release()
+        await store.run(key, analysis)
+
+    assert store.counters["evicted"] == 1
+    assert store.stats()["stored"] == 2
@@ -0,0 +1,71 @@
+import json
+import random
+
+import pytest
+
+from app.core.json_stream import JSONFieldStream
+
+RESPONSE = {
+    "ocr_text": 'Transfer to "Ade" {ref: 12,3}\nAcct: 0123456789 \\ done',
+    "merchant_name": "Opay",
+    "total_amount": 15000.5,
+    "currency": None,
+    "is_receipt": True,
+    "items": [{"name": "a, b", "price": [1, 2]}, "}"],
+    "account_numbers": ["0123456789"],
+    "confidence_score": 85,
+}
+
+
+def stream(text, sizes):
+    parser = JSONFieldStream()
+    fields, position = [], 0
+    for size in sizes:
+        fields += parser.feed(text[position : position + size])
+        position += size
+    fields += parser.feed(text[position:])
+    return parser, fields
+
+
+def test_whole_response_yields_every_field_in_order():
+    parser, fields = stream(json.dumps(RESPONSE), [])
+    assert fields == list(RESPONSE.items())
+    assert parser.done
+
+
+def test_single_character_chunks():
+    text = json.dumps(RESPONSE, indent=2)
+    _, fields = stream(text, [1] * len(text))
+    assert fields == list(RESPONSE.items())
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_chunk_splits(seed):
+    rng = random.Random(seed)
+    text = "```json\n" + json.dumps(RESPONSE, indent=rng.choice([None, 2])) + "\n```"
+    sizes = [rng.randint(1, 12) for _ in range(len(text))]
+    parser, fields = stream(text, sizes)
+    assert dict(fields) == RESPONSE
+    assert parser.done
+
+
+def test_fields_are_reported_as_soon_as_they_end():
+    parser = JSONFieldStream()
+    assert parser.feed('{"merchant_name": "Op') == []
+    assert parser.feed('ay", "total') == [("merchant_name", "Opay")]
+    # A number is only complete at the next separator
+    assert parser.feed('_amount": 150') == []
+    assert parser.feed("00}") == [("total_amount", 15000)]
+    assert parser.done
+    assert parser.feed(', "late": 1}') == []
+
+
+def test_escaped_quote_split_across_chunks():
+    parser = JSONFieldStream()
+    assert parser.feed('{"ocr_text": "say \\') == []
+    assert parser.feed('"hi\\"", "x": 1}') == [("ocr_text", 'say "hi"'), ("x", 1)]
+
+
+def test_malformed_value_is_skipped():
+    _, fields = stream('{"a": tru, "b": [1, 2]}', [])
+    assert fields == [("b", [1, 2])]
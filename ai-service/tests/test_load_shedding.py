@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from app.core.load_shedding import LoadSheddingMiddleware, RouteClass
+
+
+class SlowApp:
+    """ASGI app whose responses are held until release()"""
+
+    def __init__(self):
+        self.gate = asyncio.Event()
+
+    async def __call__(self, scope, receive, send):
+        await self.gate.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    def release(self):
+        self.gate.set()
+
+
+def middleware(app, lag_ms=0.0, **kwargs):
+    options = dict(max_inflight=4, reserved=2, lag_limit_ms=500, retry_after=7)
+    options.update(kwargs)
+    return LoadSheddingMiddleware(
+        app,
+        classes=[
+            RouteClass("critical", "critical", routes=(("GET", "/"), ("GET", "/health"))),
+            RouteClass("account", "high", routes=(("POST", "/api/check-account"),)),
+            RouteClass(
+                "analysis", "low", routes=(("POST", "/api/analyze-receipt"),), max_inflight=2
+            ),
+            RouteClass("jobs", "low", routes=(("*", "/api/analyze-receipt/jobs"),)),
+            RouteClass("default", "low"),
+        ],
+        lag_source=lambda: lag_ms,
+        metrics_name=None,
+        **options,
+    )
+
+
+async def call(shedder, method, path):
+    """Start a request; returns (task, sent messages)"""
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path}
+    task = asyncio.create_task(shedder(scope, receive, send))
+    await asyncio.sleep(0)
+    return task, sent
+
+
+def status(sent):
+    return sent[0]["status"] if sent else None
+
+
+def test_routes_match_the_longest_prefix():
+    shedder = middleware(SlowApp())
+    assert shedder._classify("POST", "/api/analyze-receipt").name == "analysis"
+    assert shedder._classify("POST", "/api/analyze-receipt/stream").name == "analysis"
+    assert shedder._classify("GET", "/api/analyze-receipt/jobs/abc").name == "jobs"
+    assert shedder._classify("GET", "/health/ready").name == "critical"
+    # "/" only matches itself
+    assert shedder._classify("GET", "/docs").name == "default"
+    assert shedder._classify("GET", "/api/analyze-receipt").name == "default"
+
+
+@pytest.mark.asyncio
+async def test_class_limit_returns_429_with_retry_after():
+    app = SlowApp()
+    shedder = middleware(app)
+    running = [await call(shedder, "POST", "/api/analyze-receipt") for _ in range(2)]
+    _, sent = await call(shedder, "POST", "/api/analyze-receipt")
+
+    assert status(sent) == 429
+    assert (b"retry-after", b"7") in sent[0]["headers"]
+    assert shedder.counters["analysis"]["shed_429"] == 1
+
+    app.release()
+    for task, sent in running:
+        await task
+        assert status(sent) == 200
+    assert shedder.inflight == 0
+    assert shedder.counters["analysis"]["inflight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_reserved_slots_are_kept_for_high_priority():
+    app = SlowApp()
+    shedder = middleware(app)
+    # Low priority may use max_inflight - reserved = 2 slots
+    tasks = [
+        await call(shedder, "POST", "/api/analyze-receipt"),
+        await call(shedder, "GET", "/api/analyze-receipt/jobs/1"),
+    ]
+    _, shed = await call(shedder, "GET", "/api/analyze-receipt/jobs/2")
+    assert status(shed) == 503
+
+    tasks += [await call(shedder, "POST", "/api/check-account") for _ in range(2)]
+    _, full = await call(shedder, "POST", "/api/check-account")
+    assert status(full) == 503
+    assert shedder.inflight == 4
+
+    # Probes are never shed
+    probe, probe_sent = await call(shedder, "GET", "/health")
+    app.release()
+    await probe
+    assert status(probe_sent) == 200
+    for task, _ in tasks:
+        await task
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_sheds_low_priority_only():
+    app = SlowApp()
+    app.release()
+    shedder = middleware(app, lag_ms=800)
+
+    _, analysis = await call(shedder, "POST", "/api/analyze-receipt")
+    account, account_sent = await call(shedder, "POST", "/api/check-account")
+    await account
+
+    assert status(analysis) == 503
+    assert status(account_sent) == 200
+
+
+@pytest.mark.asyncio
+async def test_non_http_scopes_pass_through():
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append(scope["type"])
+
+    shedder = middleware(app, max_inflight=0)
+    await shedder({"type": "lifespan"}, None, None)
+    assert seen == ["lifespan"]
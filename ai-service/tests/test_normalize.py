@@ -0,0 +1,58 @@
+import os
+
+import pytest
+from PIL import Image
+
+from app.core.normalize import ImageNormalizer, ImageRejectedError
+
+
+def test_oversized_png_is_rejected_from_its_header(tmp_path, monkeypatch):
+    path = tmp_path / "bomb.png"
+    Image.new("L", (2000, 1000)).save(path)
+    loads = []
+    monkeypatch.setattr(Image.Image, "load", lambda self: loads.append(self))
+    normalizer = ImageNormalizer(max_decode_pixels=1_000_000)
+
+    with pytest.raises(ImageRejectedError, match="decode limit"):
+        normalizer.normalize(str(path))
+    assert loads == []
+    assert normalizer.counters["rejected"] == 1
+
+
+def test_jpeg_of_the_same_size_is_accepted_through_draft(tmp_path):
+    # Decodable at 1/8 scale, so only a fraction of the pixels is ever held
+    path = tmp_path / "large.jpg"
+    Image.new("RGB", (2000, 1000), (200, 200, 200)).save(path)
+    normalizer = ImageNormalizer(max_pixels=500_000, max_decode_pixels=1_000_000)
+
+    result = normalizer.normalize(str(path))
+    try:
+        assert result.size[0] * result.size[1] <= 500_000
+        assert "downscaled" in result.changes
+    finally:
+        os.remove(result.path)
+
+
+def test_image_beyond_pil_bomb_limit_is_rejected(tmp_path, monkeypatch):
+    path = tmp_path / "bomb.jpg"
+    Image.new("RGB", (200, 200)).save(path)
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 10_000)
+    normalizer = ImageNormalizer()
+
+    with pytest.raises(ImageRejectedError):
+        normalizer.normalize(str(path))
+    assert normalizer.counters["rejected"] == 1
+
+
+def test_concurrent_normalizations_get_their_own_copy(tmp_path):
+    path = tmp_path / "screenshot.png"
+    Image.new("RGBA", (64, 48), (0, 0, 0, 0)).save(path)
+    normalizer = ImageNormalizer()
+
+    first = normalizer.normalize(str(path))
+    second = normalizer.normalize(str(path))
+
+    assert first.path != second.path
+    assert {os.path.dirname(first.path), os.path.dirname(second.path)} == {str(tmp_path)}
+    with Image.open(first.path) as img:
+        assert (img.mode, img.size) == ("RGB", (64, 48))
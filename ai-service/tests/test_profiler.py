@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+import pytest
+
+from app.agents.pipeline import AgentGraph, AgentNode
+from app.core.cancellation import CancellableExecutor
+from app.core.profiler import stage_times
+
+
+def spin(seconds, cancel=None):
+    """Burn CPU on the calling thread"""
+    deadline = time.thread_time() + seconds
+    while time.thread_time() < deadline:
+        pass
+    return seconds
+
+
+@pytest.mark.asyncio
+async def test_executor_cpu_is_credited_to_the_node_that_awaited_it():
+    executor = CancellableExecutor(max_workers=2)
+
+    async def offloaded(inputs):
+        return await executor.run("spin", spin, 0.05)
+
+    async def waiting(inputs):
+        await asyncio.sleep(0.05)
+        return True
+
+    graph = AgentGraph(
+        [
+            AgentNode(name="offloaded", run=offloaded, output="offloaded"),
+            AgentNode(name="waiting", run=waiting, output="waiting"),
+        ]
+    )
+    try:
+        run = await graph.run({}, measure_cpu=True)
+    finally:
+        executor.shutdown()
+
+    stages = stage_times(run.timings)
+    assert stages["offloaded"]["offloaded_cpu_ms"] >= 45
+    assert stages["offloaded"]["cpu_ms"] >= stages["offloaded"]["offloaded_cpu_ms"]
+    assert stages["waiting"]["offloaded_cpu_ms"] == 0
+    assert stages["waiting"]["cpu_ms"] < 20
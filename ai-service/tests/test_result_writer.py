@@ -0,0 +1,156 @@
+import glob
+import json
+import os
+
+import pytest
+
+from app.core.result_writer import FirestoreResultWriter
+
+
+class FakeFirestore:
+    """Records committed documents; commits raise while down"""
+
+    def __init__(self):
+        self.down = False
+        self.documents = {}
+        self.commits = 0
+
+    def batch(self):
+        db = self
+        writes = []
+
+        class Batch:
+            def set(self, ref, document):
+                writes.append((ref, document))
+
+            def commit(self):
+                if db.down:
+                    raise RuntimeError("unavailable")
+                db.commits += 1
+                db.documents.update(writes)
+
+        return Batch()
+
+    def collection(self, name):
+        class Collection:
+            def document(self, doc_id):
+                return doc_id
+
+        return Collection()
+
+
+def writer(db, spill_dir, **kwargs):
+    options = dict(batch_size=5, max_retries=0, retry_base_seconds=0, flush_seconds=0.01)
+    options.update(kwargs)
+    return FirestoreResultWriter(lambda: db, spill_dir=str(spill_dir), **options)
+
+
+def spill(spill_dir, name, count, torn=False):
+    path = os.path.join(spill_dir, name)
+    with open(path, "w") as f:
+        for i in range(count):
+            f.write(json.dumps({"id": f"{name}-{i}", "document": {"i": i}}) + "\n")
+        if torn:
+            f.write('{"id": "half')
+    return path
+
+
+def files(spill_dir):
+    return sorted(os.path.basename(path) for path in glob.glob(os.path.join(spill_dir, "*")))
+
+
+async def flush_all(w):
+    w._resume_at = 0
+    while await w._flush_batch():
+        pass
+
+
+@pytest.mark.asyncio
+async def test_records_are_batched_to_firestore(tmp_path):
+    db = FakeFirestore()
+    w = writer(db, tmp_path)
+    for i in range(12):
+        await w.record(f"r{i}", {}, {"verdict": "authentic", "trust_score": 80})
+    await w.drain()
+
+    assert len(db.documents) == 12
+    assert w.counters["written"] == 12
+    assert files(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_failed_batches_are_spilled_then_written_back(tmp_path):
+    db = FakeFirestore()
+    db.down = True
+    w = writer(db, tmp_path)
+    for i in range(5):
+        await w.record(f"r{i}", {}, {"verdict": "authentic"})
+    w._task.cancel()
+    await flush_all(w)
+
+    assert w.counters["spilled"] == 5
+    assert files(tmp_path) == [f"results-{os.getpid()}.jsonl"]
+
+    db.down = False
+    await flush_all(w)
+    assert len(db.documents) == 5
+    assert files(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_spill_file_survives_until_its_records_commit(tmp_path):
+    spill(tmp_path, "results-1.jsonl", 7, torn=True)
+    db = FakeFirestore()
+    w = writer(db, tmp_path)
+
+    # Read back into memory: a crash now must not lose the records
+    w._recover(10)
+    assert len(w._buffer) == 7
+    assert files(tmp_path) == [f"results-1.jsonl.recovering-{os.getpid()}"]
+
+    await flush_all(w)
+    assert len(db.documents) == 7
+    assert files(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_recovered_records_that_fail_again_are_respilled(tmp_path):
+    spill(tmp_path, "results-1.jsonl", 3)
+    db = FakeFirestore()
+    db.down = True
+    w = writer(db, tmp_path)
+    await flush_all(w)
+
+    # Now only in our own spill file, so the claimed one could go
+    assert files(tmp_path) == [f"results-{os.getpid()}.jsonl"]
+    db.down = False
+    await flush_all(w)
+    assert sorted(db.documents) == [f"results-1.jsonl-{i}" for i in range(3)]
+
+
+@pytest.mark.asyncio
+async def test_files_of_dead_or_previous_processes_are_reclaimed(tmp_path):
+    # Claimed by a process that no longer exists, and by an earlier process
+    # that had our PID (container restart)
+    spill(tmp_path, "results-1.jsonl.recovering-999999999", 2)
+    spill(tmp_path, f"results-2.jsonl.recovering-{os.getpid()}", 2)
+    db = FakeFirestore()
+    w = writer(db, tmp_path)
+    await flush_all(w)
+
+    assert len(db.documents) == 4
+    assert files(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_drain_returns_unread_spill_to_the_next_process(tmp_path):
+    spill(tmp_path, "results-1.jsonl", 12)
+    db = FakeFirestore()
+    w = writer(db, tmp_path)
+    w._recover(5)
+    await w.drain()
+
+    # The five read back were committed; the file is unclaimed again for
+    # whoever starts next (replaying those five is idempotent)
+    assert len(db.documents) == 5
+    assert files(tmp_path) == ["results-1.jsonl"]
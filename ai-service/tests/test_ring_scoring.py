@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from app.agents.batch_scorer import score_columns
+from app.agents.reasoning_agent import SCORING_RULES, ReasoningAgent
+from app.core.agent_store import COLUMNS, extract_row
+
+
+def network(receipts, submitters, merchants):
+    return {
+        "ring": {"receipts": receipts, "submitters": submitters, "merchants": merchants},
+        "window_days": 30,
+    }
+
+
+@pytest.mark.parametrize(
+    "ring, weight",
+    [
+        # A different name on every receipt from several people
+        ((3, 3, 3), 1.0),
+        ((5, 4, 4), 0.75),
+        # A busy genuine shop: many submitters, one name plus OCR variants
+        ((200, 150, 1), 0.0),
+        ((200, 150, 4), 0.0),
+        # Too few submitters or merchant names
+        ((3, 2, 3), 0.0),
+        ((3, 3, 2), 0.0),
+        ((0, 0, 0), 0.0),
+    ],
+)
+def test_ring_weight(ring, weight):
+    assert ReasoningAgent()._ring_weight(network(*ring)) == pytest.approx(weight)
+
+
+def test_ring_weight_without_network():
+    agent = ReasoningAgent()
+    assert agent._ring_weight(None) == 0.0
+    assert agent._ring_weight({}) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_penalty_scales_with_diversity():
+    agent = ReasoningAgent()
+
+    async def score(ring):
+        return await agent._calculate_trust_score({}, {}, {}, {}, None, network(*ring))
+
+    clean = await score((0, 0, 0))
+    assert await score((200, 150, 1)) == clean
+    assert await score((3, 3, 3)) == clean - SCORING_RULES["ring_penalty"]
+    assert await score((5, 4, 4)) == clean - SCORING_RULES["ring_penalty"] * 0.75
+
+
+@pytest.mark.asyncio
+async def test_shared_account_issue_only_for_rings():
+    agent = ReasoningAgent()
+    ring = await agent.synthesize({"network": network(4, 3, 4)})
+    shop = await agent.synthesize({"network": network(400, 300, 2)})
+
+    assert [i["type"] for i in ring["issues"]].count("shared_account") == 1
+    assert "shared_account" not in [i["type"] for i in shop["issues"]]
+
+
+@pytest.mark.asyncio
+async def test_batch_scorer_matches_reasoning_agent():
+    agent = ReasoningAgent()
+    rows, expected = [], []
+    for receipts in range(0, 12):
+        for submitters in range(0, receipts + 1):
+            for merchants in range(0, receipts + 1):
+                results = {
+                    "vision": {"confidence": 80, "ocr_text": "x" * 30},
+                    "network": network(receipts, submitters, merchants),
+                }
+                final = await agent.synthesize(results)
+                rows.append(extract_row("r", results, final))
+                expected.append(final["trust_score"])
+
+    columns = {
+        name: np.array([row[name] for row in rows], dtype=dtype)
+        for name, dtype in COLUMNS.items()
+    }
+    scores, _ = score_columns(columns)
+    assert scores.tolist() == expected
@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.core.text_regions import detect_text_regions, scale_boxes, text_line_profile
+
+SIZE = (960, 1280)  # width, height
+# x, y, w, h of each printed line on the full-resolution slip
+LINES = [(80, 120, 520, 36), (80, 260, 380, 36), (80, 400, 640, 36), (480, 900, 360, 48)]
+
+
+@pytest.fixture
+def slip():
+    """Full-resolution grayscale slip: light paper, dark glyph-like strokes"""
+    gray = np.full((SIZE[1], SIZE[0]), 236, np.uint8)
+    for x, y, w, h in LINES:
+        for stroke in range(x, x + w, 14):
+            cv2.rectangle(gray, (stroke, y), (stroke + 6, y + h - 1), 25, -1)
+    return gray
+
+
+def contains(box, line):
+    x, y, w, h = box
+    lx, ly, lw, lh = line
+    return x <= lx and y <= ly and x + w >= lx + lw and y + h >= ly + lh
+
+
+def test_detects_each_printed_line(slip):
+    boxes = detect_text_regions(slip)
+
+    assert boxes.shape == (len(LINES), 4)
+    for line in LINES:
+        assert any(contains(box, line) for box in boxes.tolist())
+    # Largest first
+    areas = boxes[:, 2] * boxes[:, 3]
+    assert list(areas) == sorted(areas, reverse=True)
+
+
+def test_blank_paper_has_no_text(slip):
+    assert len(detect_text_regions(np.full_like(slip, 236))) == 0
+    assert text_line_profile(np.full_like(slip, 236))["text_lines"] == 0
+
+
+def test_scaled_boxes_cover_the_full_resolution_lines(slip):
+    small = cv2.resize(slip, (SIZE[0] // 4, SIZE[1] // 4), interpolation=cv2.INTER_AREA)
+    boxes = detect_text_regions(small)
+    assert len(boxes) == len(LINES)
+
+    full = scale_boxes(boxes, (small.shape[1], small.shape[0]), SIZE, align=8)
+
+    x, y, w, h = full.T
+    # Snapped to the 8x8 JPEG grid and kept inside the image
+    assert not (x % 8).any() and not (y % 8).any()
+    assert not (w % 8).any() and not (h % 8).any()
+    assert (x >= 0).all() and (y >= 0).all()
+    assert (x + w <= SIZE[0]).all() and (y + h <= SIZE[1]).all()
+    for line in LINES:
+        assert any(contains(box, line) for box in full.tolist())
+
+
+def test_scale_boxes_clips_at_the_image_edge():
+    boxes = np.array([[230, 310, 10, 10]])
+    full = scale_boxes(boxes, (240, 320), (962, 1283), align=8)
+
+    x, y, w, h = full[0].tolist()
+    assert (x, y) == (920, 1240)
+    assert (x + w, y + h) == (962, 1283)